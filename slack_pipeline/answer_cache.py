@@ -0,0 +1,208 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+import numpy as np
+from langchain.schema import Document
+
+def decode_embedding(value):
+    """Embedding stored as a float32 BLOB, or as a JSON list by older versions of the cache."""
+    if isinstance(value, bytes):
+        return np.frombuffer(value, dtype=np.float32)
+    return np.asarray(json.loads(value), dtype=np.float32)
+
+class SemanticAnswerCache:
+    """
+    Cache of generated answers, looked up by the meaning of the question.
+
+    A question whose embedding has a cosine similarity of at least `threshold`
+    with a previously answered question gets the stored answer and sources back
+    without calling the LLM. Every entry records the IDs and channels of the
+    documents that supported it, so that ingesting new messages into one of
+    those channels drops the answers that may have gone stale.
+    """
+
+    def __init__(self, cache_file, threshold=0.95):
+        """
+        Args:
+            cache_file (str): SQLite file holding the cached answers
+            threshold (float): Minimum cosine similarity for a cache hit
+        """
+        self.threshold = threshold
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0}
+
+        cache_dir = os.path.dirname(cache_file)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        self.db = sqlite3.connect(cache_file, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS answers (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                question TEXT NOT NULL,
+                embedding BLOB NOT NULL,
+                answer TEXT NOT NULL,
+                sources TEXT NOT NULL,
+                created_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS answer_documents (
+                answer_id INTEGER NOT NULL,
+                document_id TEXT,
+                channel_id TEXT
+            );
+            CREATE INDEX IF NOT EXISTS answer_documents_channel ON answer_documents (channel_id);
+            CREATE INDEX IF NOT EXISTS answer_documents_document ON answer_documents (document_id);
+            """
+        )
+        self.db.commit()
+        self._load()
+
+    def _load(self):
+        """Load the normalized question embeddings into one matrix for fast lookups."""
+        rows = self.db.execute("SELECT id, embedding FROM answers").fetchall()
+        self.ids = [row[0] for row in rows]
+        if rows:
+            self.matrix = np.stack([decode_embedding(row[1]) for row in rows])
+            self.matrix /= np.linalg.norm(self.matrix, axis=1, keepdims=True)
+        else:
+            self.matrix = None
+
+    def lookup(self, embedding):
+        """
+        Find a cached answer for a question embedding.
+
+        Args:
+            embedding (list): Embedding of the new question
+
+        Returns:
+            dict: {"question", "answer", "source_documents", "similarity"} or None on a miss
+        """
+        with self.lock:
+            if self.matrix is None:
+                self.stats["misses"] += 1
+                return None
+
+            query = np.asarray(embedding, dtype=np.float32)
+            similarities = self.matrix @ (query / np.linalg.norm(query))
+            best = int(np.argmax(similarities))
+
+            if similarities[best] >= self.threshold:
+                # The entry may have been invalidated by another process since it was loaded
+                row = self.db.execute(
+                    "SELECT question, answer, sources FROM answers WHERE id = ?", (self.ids[best],)
+                ).fetchone()
+                if row:
+                    self.stats["hits"] += 1
+                    return {
+                        "question": row[0],
+                        "answer": row[1],
+                        "source_documents": [Document(**source) for source in json.loads(row[2])],
+                        "similarity": float(similarities[best])
+                    }
+                self._load()
+
+            self.stats["misses"] += 1
+            return None
+
+    def store(self, question, embedding, answer, source_documents):
+        """
+        Remember the answer to a question.
+
+        Args:
+            question (str): The question that was answered
+            embedding (list): Embedding of the question
+            answer (str): The generated answer
+            source_documents (list): Langchain documents the answer was generated from
+        """
+        sources = [
+            {"id": doc.id, "page_content": doc.page_content, "metadata": doc.metadata}
+            for doc in source_documents
+        ]
+
+        vector = np.asarray(embedding, dtype=np.float32)
+
+        with self.lock:
+            cursor = self.db.execute(
+                "INSERT INTO answers (question, embedding, answer, sources, created_at) VALUES (?, ?, ?, ?, ?)",
+                (question, vector.tobytes(), answer, json.dumps(sources), time.time())
+            )
+            self.db.executemany(
+                "INSERT INTO answer_documents (answer_id, document_id, channel_id) VALUES (?, ?, ?)",
+                [(cursor.lastrowid, doc.id, doc.metadata.get("channel_id")) for doc in source_documents]
+            )
+            self.db.commit()
+
+            # Only the new row is added; reloading every embedding made each store O(N)
+            row = (vector / np.linalg.norm(vector))[None, :]
+            self.ids.append(cursor.lastrowid)
+            self.matrix = row if self.matrix is None else np.vstack([self.matrix, row])
+
+    def _delete(self, where, values):
+        values = list(values)
+        if not values:
+            return 0
+
+        placeholders = ",".join("?" * len(values))
+        with self.lock:
+            answer_ids = [
+                row[0] for row in self.db.execute(
+                    f"SELECT DISTINCT answer_id FROM answer_documents WHERE {where} IN ({placeholders})", values
+                )
+            ]
+            if answer_ids:
+                id_placeholders = ",".join("?" * len(answer_ids))
+                self.db.execute(f"DELETE FROM answers WHERE id IN ({id_placeholders})", answer_ids)
+                self.db.execute(f"DELETE FROM answer_documents WHERE answer_id IN ({id_placeholders})", answer_ids)
+                self.db.commit()
+                self._load()
+
+        return len(answer_ids)
+
+    def invalidate_channels(self, channel_ids):
+        """Drop every answer supported by a document from one of the channels. Returns the count dropped."""
+        return self._delete("channel_id", channel_ids)
+
+    def invalidate_documents(self, document_ids):
+        """Drop every answer supported by one of the documents. Returns the count dropped."""
+        return self._delete("document_id", document_ids)
+
+    def clear(self):
+        """Drop every cached answer."""
+        with self.lock:
+            self.db.execute("DELETE FROM answers")
+            self.db.execute("DELETE FROM answer_documents")
+            self.db.commit()
+            self._load()
+
+    def cache_stats(self):
+        """Return hit and miss counters and the number of cached answers."""
+        with self.lock:
+            return dict(self.stats, entries=len(self.ids))
+
+    def close(self):
+        self.db.close()
+
+def invalidate_answer_cache(cache_file, channel_ids):
+    """
+    Drop the cached answers that relied on any of the given channels.
+
+    Called after ingestion so that answers never outlive the messages they were built from.
+
+    Args:
+        cache_file (str): SQLite file holding the cached answers
+        channel_ids (iterable): Channels that received new or changed documents
+
+    Returns:
+        int: Number of answers dropped
+    """
+    if not os.path.exists(cache_file):
+        return 0
+
+    cache = SemanticAnswerCache(cache_file)
+    try:
+        return cache.invalidate_channels(channel_ids)
+    finally:
+        cache.close()
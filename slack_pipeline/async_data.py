@@ -0,0 +1,388 @@
+import os
+import json
+import time
+import queue
+import asyncio
+import threading
+import aiohttp
+from contextlib import asynccontextmanager
+from slack_sdk.web.async_client import AsyncWebClient
+from slack_sdk.errors import SlackApiError
+from dotenv import load_dotenv
+from metrics import metrics
+
+load_dotenv()
+
+# Slack rate-limit tier of every Web API method the pipeline calls
+# https://api.slack.com/docs/rate-limits
+SLACK_METHOD_TIERS = {
+    "conversations.list": 2,
+    "users.list": 2,
+    "conversations.history": 3,
+    "conversations.info": 3,
+    "conversations.replies": 3,
+    "users.info": 4,
+}
+
+# Sustained requests per minute allowed for each tier
+TIER_REQUESTS_PER_MINUTE = {
+    1: 1,
+    2: 20,
+    3: 50,
+    4: 100,
+}
+
+# Errors that will not go away by retrying the same request
+FATAL_SLACK_ERRORS = {"not_in_channel", "channel_not_found", "invalid_auth", "missing_scope", "not_authed"}
+
+class TokenBucket:
+    """
+    Asyncio token bucket shared by every coroutine calling methods of one Slack tier.
+
+    Tokens refill continuously at `rate_per_minute`; up to `burst` requests can be
+    sent back-to-back. A Retry-After from Slack pauses the whole bucket, so every
+    caller backs off together instead of each one discovering the limit on its own.
+    The state is guarded by a thread lock rather than an asyncio one, so the same
+    bucket can be shared by coroutines running on different event loops.
+    """
+
+    def __init__(self, rate_per_minute, burst=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = burst or max(1, rate_per_minute // 10)
+        self.tokens = float(self.capacity)
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self):
+        """Wait until a request may be sent."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    wait_time = self.paused_until - now
+                else:
+                    self._refill(now)
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait_time = (1 - self.tokens) / self.rate
+
+            await asyncio.sleep(wait_time)
+
+    def pause(self, seconds):
+        """Stop handing out tokens for `seconds` (e.g. after a Retry-After)."""
+        with self.lock:
+            now = time.monotonic()
+            self.paused_until = max(self.paused_until, now + seconds)
+            self.tokens = 0.0
+            self.updated_at = now
+
+class SlackRateLimiter:
+    """One token bucket per Slack rate-limit tier."""
+
+    def __init__(self, tier_limits=None):
+        limits = dict(TIER_REQUESTS_PER_MINUTE)
+        limits.update(tier_limits or {})
+        self.buckets = {tier: TokenBucket(rpm) for tier, rpm in limits.items()}
+
+    def bucket_for(self, method):
+        return self.buckets[SLACK_METHOD_TIERS.get(method, 3)]
+
+    async def acquire(self, method):
+        await self.bucket_for(method).acquire()
+
+    def pause(self, method, seconds):
+        self.bucket_for(method).pause(seconds)
+
+async def call_slack_api(client, limiter, method, max_retries=5, **kwargs):
+    """
+    Call a Slack Web API method through the shared rate limiter.
+
+    Rate-limited calls are retried for as long as Slack keeps answering with a
+    Retry-After, so pages are delayed but never dropped. Network errors and 5xx
+    responses are retried with exponential backoff up to `max_retries` times,
+    after which the error is raised rather than silently returning partial data.
+
+    Args:
+        client (AsyncWebClient): The Slack client
+        limiter (SlackRateLimiter): Limiter shared by all concurrent callers
+        method (str): Web API method name, e.g. "conversations.history"
+        max_retries (int): Retries for transient non rate-limit failures
+        **kwargs: Arguments passed to the method
+
+    Returns:
+        AsyncSlackResponse: The API response
+    """
+    api_method = getattr(client, method.replace(".", "_"))
+    failures = 0
+
+    while True:
+        await limiter.acquire(method)
+        try:
+            started = time.perf_counter()
+            response = await api_method(**kwargs)
+            metrics.record(
+                "fetch",
+                time.perf_counter() - started,
+                items=len(response.get("messages", [])),
+                bytes=len(json.dumps(response.data))
+            )
+            return response
+
+        except SlackApiError as e:
+            status = e.response.status_code
+            error = e.response.get("error", "")
+
+            if status == 429 or error == "ratelimited":
+                wait_time = float(e.response.headers.get("Retry-After", 30))
+                print(f"Rate limited on {method}. Waiting {wait_time} seconds...")
+                limiter.pause(method, wait_time)
+                continue
+
+            if error in FATAL_SLACK_ERRORS or status < 500:
+                raise
+
+            failures += 1
+            if failures > max_retries:
+                raise
+
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            failures += 1
+            if failures > max_retries:
+                raise
+
+        await asyncio.sleep(min(60, 2 ** failures))
+
+@asynccontextmanager
+async def async_slack_client(max_concurrency=16):
+    """Yield an AsyncWebClient whose requests share one pooled aiohttp session."""
+    connector = aiohttp.TCPConnector(limit=max_concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        yield AsyncWebClient(token=os.environ.get("SLACK_BOT_TOKEN"), session=session)
+
+async def list_channel_ids_async(client, limiter):
+    """Return the IDs of all channels visible to the bot, following pagination."""
+    channel_ids = []
+    cursor = None
+
+    while True:
+        result = await call_slack_api(
+            client, limiter, "conversations.list",
+            types="public_channel,private_channel",
+            exclude_archived=True,
+            cursor=cursor,
+            limit=1000
+        )
+        channel_ids.extend(channel["id"] for channel in result["channels"])
+
+        cursor = result.get("response_metadata", {}).get("next_cursor")
+        if not cursor:
+            return channel_ids
+
+async def iter_channel_pages_async(client, limiter, channel_id, oldest=None, latest=None):
+    """
+    Yield the messages of a channel one conversations.history page at a time.
+
+    Args:
+        client (AsyncWebClient): The Slack client
+        limiter (SlackRateLimiter): Limiter shared by all concurrent callers
+        channel_id (str): The ID of the channel to extract messages from
+        oldest (str, optional): Timestamp of the oldest message to fetch
+        latest (str, optional): Timestamp of the latest message to fetch
+
+    Yields:
+        list: The message objects of one page
+    """
+    cursor = None
+
+    while True:
+        result = await call_slack_api(
+            client, limiter, "conversations.history",
+            channel=channel_id,
+            cursor=cursor,
+            oldest=oldest,
+            latest=latest,
+            limit=1000
+        )
+        yield result["messages"]
+
+        if not result.get("has_more", False):
+            return
+        cursor = result["response_metadata"]["next_cursor"]
+
+async def extract_channel_messages_async(client, limiter, channel_id, oldest=None, latest=None):
+    """
+    Extract all messages from a specific channel, following every page.
+
+    Args:
+        client (AsyncWebClient): The Slack client
+        limiter (SlackRateLimiter): Limiter shared by all concurrent callers
+        channel_id (str): The ID of the channel to extract messages from
+        oldest (str, optional): Timestamp of the oldest message to fetch
+        latest (str, optional): Timestamp of the latest message to fetch
+
+    Returns:
+        list: List of message objects
+    """
+    all_messages = []
+
+    async for page in iter_channel_pages_async(client, limiter, channel_id, oldest, latest):
+        all_messages.extend(page)
+
+    return all_messages
+
+async def extract_all_channels_messages_async(channel_ids=None, oldest=None, latest=None,
+                                              oldest_by_channel=None, max_concurrency=16,
+                                              tier_limits=None):
+    """
+    Extract messages from many channels concurrently.
+
+    A channel is either extracted completely or left out of the result (and
+    reported), so callers never persist a truncated history.
+
+    Args:
+        channel_ids (list, optional): List of channel IDs to extract from
+        oldest (str, optional): Timestamp of the oldest message to fetch
+        latest (str, optional): Timestamp of the latest message to fetch
+        oldest_by_channel (dict, optional): Per-channel `oldest`, overriding `oldest`
+        max_concurrency (int): Maximum number of channels fetched at the same time
+        tier_limits (dict, optional): Requests per minute overrides, keyed by tier
+
+    Returns:
+        dict: Dictionary with channel IDs as keys and lists of messages as values
+    """
+    oldest_by_channel = oldest_by_channel or {}
+    limiter = SlackRateLimiter(tier_limits)
+    semaphore = asyncio.Semaphore(max_concurrency)
+    channels_data = {}
+
+    async with async_slack_client(max_concurrency) as client:
+        if not channel_ids:
+            channel_ids = await list_channel_ids_async(client, limiter)
+
+        async def extract_one(channel_id):
+            async with semaphore:
+                try:
+                    channel_info = await call_slack_api(client, limiter, "conversations.info", channel=channel_id)
+                    channel_name = channel_info["channel"]["name"]
+
+                    messages = await extract_channel_messages_async(
+                        client, limiter, channel_id,
+                        oldest=oldest_by_channel.get(channel_id, oldest),
+                        latest=latest
+                    )
+                except SlackApiError as e:
+                    if e.response.get("error") == "not_in_channel":
+                        print(f"ERROR: Bot is not in channel {channel_id}. Please add the bot to this channel in Slack using /invite @BotName")
+                    else:
+                        print(f"Error processing channel {channel_id}: {e}")
+                    return
+                except Exception as e:
+                    print(f"Error processing channel {channel_id}: {e}")
+                    return
+
+                channels_data[channel_id] = {
+                    "name": channel_name,
+                    "messages": messages
+                }
+                print(f"Extracted {len(messages)} messages from #{channel_name}")
+
+        await asyncio.gather(*(extract_one(channel_id) for channel_id in channel_ids))
+
+    return channels_data
+
+def extract_all_channels_messages_concurrent(channel_ids=None, oldest=None, latest=None,
+                                             oldest_by_channel=None, max_concurrency=16):
+    """Blocking wrapper around extract_all_channels_messages_async."""
+    return asyncio.run(
+        extract_all_channels_messages_async(
+            channel_ids=channel_ids,
+            oldest=oldest,
+            latest=latest,
+            oldest_by_channel=oldest_by_channel,
+            max_concurrency=max_concurrency
+        )
+    )
+
+def iter_all_channels_messages(channel_ids=None, oldest=None, latest=None, oldest_by_channel=None,
+                               max_concurrency=16, failed_channels=None, queue_size=64, limiter=None):
+    """
+    Yield message records from many channels as their pages arrive.
+
+    The channels are fetched concurrently on a background event loop that hands
+    pages over through a bounded queue, so at most `queue_size` pages are held in
+    memory no matter how long the history is. Each record is the Slack message
+    with "channel_id" and "channel_name" added.
+
+    Args:
+        channel_ids (list, optional): List of channel IDs to extract from
+        oldest (str, optional): Timestamp of the oldest message to fetch
+        latest (str, optional): Timestamp of the latest message to fetch
+        oldest_by_channel (dict, optional): Per-channel `oldest`, overriding `oldest`
+        max_concurrency (int): Maximum number of channels fetched at the same time
+        failed_channels (list, optional): Receives the IDs of channels that could not
+            be extracted completely; their records may already have been yielded
+        queue_size (int): Maximum number of pages waiting to be consumed
+        limiter (SlackRateLimiter, optional): Limiter to share with other callers, e.g. the thread fetches
+
+    Yields:
+        dict: One message record
+    """
+    oldest_by_channel = oldest_by_channel or {}
+    limiter = limiter or SlackRateLimiter()
+    pages = queue.Queue(maxsize=queue_size)
+    done = object()
+
+    async def produce():
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async with async_slack_client(max_concurrency) as client:
+            ids = channel_ids or await list_channel_ids_async(client, limiter)
+
+            async def produce_one(channel_id):
+                async with semaphore:
+                    try:
+                        channel_info = await call_slack_api(client, limiter, "conversations.info", channel=channel_id)
+                        channel_name = channel_info["channel"]["name"]
+                        print(f"Extracting messages from #{channel_name} ({channel_id})...")
+
+                        async for page in iter_channel_pages_async(
+                            client, limiter, channel_id,
+                            oldest=oldest_by_channel.get(channel_id, oldest),
+                            latest=latest
+                        ):
+                            records = [dict(msg, channel_id=channel_id, channel_name=channel_name) for msg in page]
+                            # Blocks while the consumer is behind, which throttles the producers
+                            await asyncio.to_thread(pages.put, records)
+                    except Exception as e:
+                        print(f"Error processing channel {channel_id}: {e}")
+                        if failed_channels is not None:
+                            failed_channels.append(channel_id)
+
+            await asyncio.gather(*(produce_one(channel_id) for channel_id in ids))
+
+    def run():
+        try:
+            asyncio.run(produce())
+        except Exception as e:
+            pages.put(e)
+        finally:
+            pages.put(done)
+
+    producer = threading.Thread(target=run, daemon=True)
+    producer.start()
+
+    while True:
+        item = pages.get()
+        if item is done:
+            break
+        if isinstance(item, Exception):
+            raise item
+        yield from item
+
+    producer.join()
@@ -0,0 +1,333 @@
+"""
+Offline benchmarks for the slack_pipeline ingest and query paths.
+
+Runs entirely without Slack or OpenAI: a synthetic workspace export is pushed
+through the real transform, chunking and ingestion code with a deterministic
+local embedding model, then retrieval and answering are timed against a fake
+chat model with configurable latency.
+
+    python benchmark.py --sizes 10000 100000 1000000 --output bench.json
+"""
+import os
+import json
+import time
+import random
+import shutil
+import hashlib
+import argparse
+import tempfile
+from functools import lru_cache
+from typing import Any, Iterator, List, Optional
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from chunking import chunk_conversation_windows
+from transform import iter_documents_for_vectordb
+from vectordb import create_vector_database, SlackRAGService
+from index_versions import directory_size
+from metrics import metrics
+
+VOCABULARY = (
+    "fineract mifos loan client savings account office staff teller cashier product charge "
+    "interest repayment schedule disbursement approval batch job api endpoint token oauth "
+    "database migration liquibase mysql postgres docker kubernetes tomcat gradle build test "
+    "error exception stacktrace null pointer timeout config property tenant datatable report "
+    "android web app mobile wallet release version branch pull request review merge commit "
+    "please help thanks anyone know how why when where what issue bug fix works failed"
+).split()
+
+USERS = [f"U{index:07d}" for index in range(200)]
+
+def synthetic_text(rng):
+    """Message text with a long-tailed length, like real chat."""
+    length = max(1, int(rng.lognormvariate(2.3, 0.9)))
+    words = [rng.choice(VOCABULARY) for _ in range(length)]
+    if rng.random() < 0.05:
+        words.append(f"FINERACT-{rng.randint(1000, 2500)}")
+    if rng.random() < 0.15:
+        return rng.choice(["thanks!", "+1", "ok", "will check", "same here"])
+    return " ".join(words)
+
+def generate_synthetic_export(num_messages, num_channels=20, thread_ratio=0.1, seed=42,
+                              start_ts=1_700_000_000.0):
+    """
+    Yield a synthetic Slack history in the record format of the extractor.
+
+    Messages come in bursts (a few seconds apart) separated by quiet periods,
+    spread over channels with a skewed popularity. A share of the messages
+    start threads, which are yielded as thread records after the channel history.
+
+    Args:
+        num_messages (int): Number of top-level messages to generate
+        num_channels (int): Number of channels
+        thread_ratio (float): Share of messages that start a thread
+        seed (int): Seed of the random generator, the output is deterministic
+        start_ts (float): Epoch time of the first message
+
+    Yields:
+        dict: Message records, then thread records
+    """
+    rng = random.Random(seed)
+    channels = [(f"C{index:08d}", f"channel-{index}") for index in range(num_channels)]
+    weights = [1.0 / (rank + 1) for rank in range(num_channels)]
+    clocks = {channel_id: start_ts for channel_id, _ in channels}
+    threads = []
+
+    produced = 0
+    while produced < num_messages:
+        channel_id, channel_name = rng.choices(channels, weights)[0]
+        burst = min(rng.randint(1, 30), num_messages - produced)
+        clocks[channel_id] += rng.expovariate(1 / 3600)
+
+        for _ in range(burst):
+            clocks[channel_id] += rng.expovariate(1 / 20)
+            ts = f"{clocks[channel_id]:.6f}"
+            record = {
+                "type": "message",
+                "ts": ts,
+                "user": rng.choice(USERS),
+                "text": synthetic_text(rng),
+                "channel_id": channel_id,
+                "channel_name": channel_name
+            }
+
+            if rng.random() < thread_ratio:
+                replies = rng.randint(1, 12)
+                reply_times = sorted(clocks[channel_id] + rng.expovariate(1 / 600) for _ in range(replies))
+                record.update(thread_ts=ts, reply_count=replies, latest_reply=f"{reply_times[-1]:.6f}")
+                threads.append({
+                    "type": "thread",
+                    "channel_id": channel_id,
+                    "channel_name": channel_name,
+                    "thread_ts": ts,
+                    "latest_reply": record["latest_reply"],
+                    "reply_count": replies,
+                    "parent": {"user": record["user"], "ts": ts, "text": record["text"]},
+                    "replies": [
+                        {"user": rng.choice(USERS), "ts": f"{reply_ts:.6f}", "text": synthetic_text(rng)}
+                        for reply_ts in reply_times
+                    ]
+                })
+
+            produced += 1
+            yield record
+
+    yield from threads
+
+@lru_cache(maxsize=65536)
+def token_vector(token, dimension):
+    """Fixed random direction of a token, memoized since seeding a generator costs more than the sum."""
+    seed = int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "little")
+    vector = np.random.default_rng(seed).standard_normal(dimension)
+    vector.setflags(write=False)
+    return vector
+
+class FakeEmbeddings(Embeddings):
+    """
+    Deterministic local embedding model.
+
+    Each token is hashed to a fixed random direction, so texts sharing words
+    get similar vectors (unlike pure random embeddings) and retrieval behaves
+    plausibly. `latency` seconds are added per call to mimic a remote API.
+    """
+
+    def __init__(self, dimension=384, latency=0.0):
+        self.dimension = dimension
+        self.latency = latency
+        self.model = f"fake-hash-{dimension}"
+
+    def _embed(self, text):
+        vector = np.zeros(self.dimension)
+        for token in text.lower().split():
+            vector += token_vector(token, self.dimension)
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts):
+        if self.latency:
+            time.sleep(self.latency)
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+class FakeChatModel(BaseChatModel):
+    """Chat model answering with a canned text after a configurable delay."""
+
+    response: str = "This is a synthetic answer used to measure the pipeline overhead around the LLM call."
+    first_token_latency: float = 0.3
+    token_latency: float = 0.01
+
+    @property
+    def _llm_type(self):
+        return "fake-chat"
+
+    def _generate(self, messages, stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs):
+        time.sleep(self.first_token_latency + self.token_latency * len(self.response.split()))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.response))])
+
+    def _stream(self, messages, stop: Optional[List[str]] = None, run_manager: Any = None,
+                **kwargs) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self.first_token_latency)
+        for index, word in enumerate(self.response.split()):
+            if index:
+                time.sleep(self.token_latency)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word + " "))
+
+def percentile(values, q):
+    """Return the q-th percentile (0-100) of a list of numbers."""
+    return float(np.percentile(values, q)) if values else 0.0
+
+def latency_summary(latencies):
+    """p50/p95/p99 and mean of a list of latencies, in milliseconds."""
+    milliseconds = [value * 1000 for value in latencies]
+    return {
+        "p50_ms": percentile(milliseconds, 50),
+        "p95_ms": percentile(milliseconds, 95),
+        "p99_ms": percentile(milliseconds, 99),
+        "mean_ms": float(np.mean(milliseconds)) if milliseconds else 0.0
+    }
+
+def benchmark_ingest(num_messages, persist_directory, embeddings, batch_size=200, max_workers=4):
+    """
+    Time the transform, chunking and ingestion of a synthetic export.
+
+    Returns:
+        dict: Documents ingested, elapsed seconds, documents/sec and index size
+    """
+    records = generate_synthetic_export(num_messages)
+    documents = chunk_conversation_windows(iter_documents_for_vectordb(records))
+
+    started = time.perf_counter()
+    vectordb = create_vector_database(
+        documents,
+        persist_directory=persist_directory,
+        batch_size=batch_size,
+        max_workers=max_workers,
+        embeddings=embeddings
+    )
+    elapsed = time.perf_counter() - started
+    count = vectordb._collection.count()
+
+    return {
+        "messages": num_messages,
+        "documents": count,
+        "seconds": elapsed,
+        "documents_per_second": count / elapsed if elapsed else 0.0,
+        "messages_per_second": num_messages / elapsed if elapsed else 0.0,
+        "index_bytes": directory_size(persist_directory)
+    }
+
+def sample_queries(num_queries, seed=7):
+    """Questions drawn from the synthetic vocabulary, with some exact repeats."""
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(num_queries):
+        if queries and rng.random() < 0.2:
+            queries.append(rng.choice(queries))
+        else:
+            words = [rng.choice(VOCABULARY) for _ in range(rng.randint(3, 10))]
+            queries.append("how do I " + " ".join(words) + "?")
+    return queries
+
+def benchmark_queries(service, queries, answer_queries=0):
+    """
+    Time retrieval for every query and full answers for the first `answer_queries`.
+
+    Returns:
+        dict: Latency summaries for "retrieve" and "answer"
+    """
+    retrieve = []
+    for query in queries:
+        started = time.perf_counter()
+        service.query(query)
+        retrieve.append(time.perf_counter() - started)
+
+    answer = []
+    for query in queries[:answer_queries]:
+        started = time.perf_counter()
+        service.answer(query)
+        answer.append(time.perf_counter() - started)
+
+    return {"retrieve": latency_summary(retrieve), "answer": latency_summary(answer)}
+
+def run_benchmarks(sizes, num_queries=200, answer_queries=20, llm_latency=0.3, embedding_latency=0.0,
+                   work_directory=None, keep=False):
+    """
+    Run the ingest and query benchmarks for every history size.
+
+    Args:
+        sizes (list): Numbers of messages to generate, e.g. [10000, 100000, 1000000]
+        num_queries (int): Retrieval queries timed per size
+        answer_queries (int): End-to-end answers timed per size
+        llm_latency (float): Time to first token of the fake chat model, in seconds
+        embedding_latency (float): Delay added to every embedding call, in seconds
+        work_directory (str, optional): Where the indexes are built, a temp dir by default
+        keep (bool): Keep the built indexes instead of deleting them
+
+    Returns:
+        list: One result dictionary per size
+    """
+    work_directory = work_directory or tempfile.mkdtemp(prefix="slack_bench_")
+    embeddings = FakeEmbeddings(latency=embedding_latency)
+    results = []
+
+    for size in sizes:
+        persist_directory = os.path.join(work_directory, f"vectordb_{size}")
+        print(f"\n=== {size} messages ===")
+        metrics.reset()
+
+        ingest = benchmark_ingest(size, persist_directory, embeddings)
+        print(f"Ingest: {ingest['documents']} documents, {ingest['documents_per_second']:.0f} docs/s, "
+              f"{ingest['index_bytes'] / 1e6:.1f} MB")
+
+        service = SlackRAGService(
+            persist_directory=persist_directory,
+            embeddings=embeddings,
+            llm=FakeChatModel(first_token_latency=llm_latency)
+        )
+        queries = benchmark_queries(service, sample_queries(num_queries), answer_queries)
+        service.close()
+
+        for stage in ("retrieve", "answer"):
+            summary = queries[stage]
+            print(f"{stage.capitalize()}: p50 {summary['p50_ms']:.1f} ms, p95 {summary['p95_ms']:.1f} ms, "
+                  f"p99 {summary['p99_ms']:.1f} ms")
+
+        metrics.print_summary()
+        results.append({"size": size, "ingest": ingest, **queries, "stages": metrics.summary()["stages"]})
+
+        if not keep:
+            shutil.rmtree(persist_directory, ignore_errors=True)
+
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline slack_pipeline benchmarks")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000],
+                        help="history sizes to benchmark, in messages")
+    parser.add_argument("--queries", type=int, default=200, help="retrieval queries per size")
+    parser.add_argument("--answers", type=int, default=20, help="end-to-end answers per size")
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="fake LLM time to first token (s)")
+    parser.add_argument("--embedding-latency", type=float, default=0.0, help="fake embedding call latency (s)")
+    parser.add_argument("--work-dir", help="directory for the benchmark indexes")
+    parser.add_argument("--keep", action="store_true", help="keep the built indexes")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    results = run_benchmarks(
+        args.sizes,
+        num_queries=args.queries,
+        answer_queries=args.answers,
+        llm_latency=args.llm_latency,
+        embedding_latency=args.embedding_latency,
+        work_directory=args.work_dir,
+        keep=args.keep
+    )
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
@@ -0,0 +1,134 @@
+from ingest import make_document_id
+from tokenizer import count_tokens
+
+# A window is closed when it would exceed this many tokens...
+DEFAULT_MAX_TOKENS = 512
+# ...or when the next message is this many seconds away from the previous one
+DEFAULT_MAX_GAP_SECONDS = 15 * 60
+
+def author(doc):
+    """Name a message is attributed to inside a window: the display name when it was resolved."""
+    return doc["metadata"].get("user_name") or doc["metadata"]["user"]
+
+class ConversationWindow:
+    """Consecutive messages of one channel waiting to be emitted as a single document."""
+
+    def __init__(self, channel_id):
+        self.channel_id = channel_id
+        self.documents = []
+        self.tokens = 0
+        self.first_ts = None
+        self.last_ts = None
+        self.stored = None
+
+    @classmethod
+    def reopen(cls, stored):
+        """Window continuing a stored window document, so that later messages extend it."""
+        metadata = stored["metadata"]
+        window = cls(metadata["channel_id"])
+        window.stored = stored
+        window.tokens = count_tokens(stored["content"])
+        window.first_ts = float(metadata["timestamp"])
+        window.last_ts = float(metadata["end_timestamp"])
+        return window
+
+    def accepts(self, ts, tokens, max_tokens, max_gap_seconds):
+        if self.stored is not None and ts <= float(self.stored["metadata"]["end_timestamp"]):
+            # Stored content is not re-sorted, so only later messages are appended to it
+            return False
+        if not self.documents and self.stored is None:
+            return True
+        gap = min(abs(ts - self.first_ts), abs(ts - self.last_ts))
+        return self.tokens + tokens <= max_tokens and gap <= max_gap_seconds
+
+    def add(self, doc, ts, tokens):
+        self.documents.append(doc)
+        self.tokens += tokens
+        self.first_ts = ts if self.first_ts is None else min(self.first_ts, ts)
+        self.last_ts = ts if self.last_ts is None else max(self.last_ts, ts)
+
+    def to_document(self):
+        """Merge the member messages, oldest first, into one vector database document."""
+        members = sorted(self.documents, key=lambda doc: float(doc["metadata"]["timestamp"]))
+        first, last = members[0]["metadata"], members[-1]["metadata"]
+        lines = [f"{author(doc)}: {doc['content']}" for doc in members]
+
+        if self.stored is not None:
+            # Same ID as the stored window, so the upsert replaces it
+            metadata = dict(self.stored["metadata"])
+            metadata.update({
+                "end_timestamp": last["timestamp"],
+                "message_count": metadata.get("message_count", 0) + len(members),
+                "message_ids": ",".join([metadata["message_ids"]] + [doc["id"] for doc in members])
+            })
+            return {
+                "id": self.stored["id"],
+                "content": "\n".join([self.stored["content"]] + lines),
+                "metadata": metadata
+            }
+
+        return {
+            "id": make_document_id(self.channel_id, first["timestamp"]) + ":window",
+            "content": "\n".join(lines),
+            "metadata": {
+                "channel": first["channel"],
+                "channel_id": self.channel_id,
+                "user": first["user"],
+                "user_name": first.get("user_name", first["user"]),
+                "timestamp": first["timestamp"],
+                "end_timestamp": last["timestamp"],
+                "message_count": len(members),
+                "message_ids": ",".join(doc["id"] for doc in members),
+                "type": "window"
+            }
+        }
+
+def chunk_conversation_windows(documents, max_tokens=DEFAULT_MAX_TOKENS, max_gap_seconds=DEFAULT_MAX_GAP_SECONDS,
+                               stored_windows=None):
+    """
+    Group consecutive messages of a channel into time-bounded windows under a token budget.
+
+    Short replies such as "thanks!" or "+1" are embedded together with the
+    conversation around them instead of taking a vector (and a retrieval slot)
+    of their own. The stream may interleave channels and arrive in either time
+    order, as pages from conversations.history do; one open window is kept per
+    channel. Thread documents are already one per conversation and pass through.
+
+    Args:
+        documents (iterable): Message and thread documents from iter_documents_for_vectordb
+        max_tokens (int): Token budget of a window
+        max_gap_seconds (int): Largest silence allowed between two messages of a window
+        stored_windows (dict, optional): Already stored window documents by channel ID, extended
+            (under their own ID) by the messages that fit, as when ingesting a few messages at a time
+
+    Yields:
+        dict: Window and thread documents
+    """
+    windows = {}
+    stored_windows = dict(stored_windows or {})
+
+    for doc in documents:
+        metadata = doc["metadata"]
+        if metadata.get("type") == "thread":
+            yield doc
+            continue
+
+        channel_id = metadata["channel_id"]
+        ts = float(metadata["timestamp"])
+        tokens = count_tokens(doc["content"])
+
+        window = windows.get(channel_id)
+        if window is None and channel_id in stored_windows:
+            window = windows[channel_id] = ConversationWindow.reopen(stored_windows.pop(channel_id))
+        if window is not None and not window.accepts(ts, tokens, max_tokens, max_gap_seconds):
+            if window.documents:
+                yield window.to_document()
+            window = None
+        if window is None:
+            window = windows[channel_id] = ConversationWindow(channel_id)
+
+        window.add(doc, ts, tokens)
+
+    for window in windows.values():
+        if window.documents:
+            yield window.to_document()
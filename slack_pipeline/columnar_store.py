@@ -0,0 +1,447 @@
+import os
+import time
+import uuid
+from datetime import datetime, timezone
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.fs as pafs
+import pyarrow.parquet as pq
+
+# One row per Slack message, thread replies included
+MESSAGE_SCHEMA = pa.schema([
+    ("ts", pa.string()),
+    ("channel_name", pa.string()),
+    ("user", pa.string()),
+    ("thread_ts", pa.string()),
+    ("text", pa.string()),
+    ("subtype", pa.string()),
+    ("reply_count", pa.int32()),
+    ("latest_reply", pa.string()),
+    ("edited_ts", pa.string()),
+    ("edited_user", pa.string()),
+    ("ingested_at", pa.float64())
+])
+
+# Directory levels of the hive-style layout: <root>/channel_id=C…/month=2024-05/part-….parquet
+PARTITION_SCHEMA = pa.schema([("channel_id", pa.string()), ("month", pa.string())])
+
+DEFAULT_ROWS_PER_FILE = 50000
+
+# Every incremental sync adds a small file to the partitions it touches; past
+# this many files a partition is merged back into one
+DEFAULT_MAX_FILES_PER_PARTITION = 16
+
+# Part files are memory-mapped rather than read into buffers, so scans decode
+# the selected columns straight from the page cache
+MAPPED_FILESYSTEM = pafs.LocalFileSystem(use_mmap=True)
+
+def open_dataset(source):
+    """Open a partition directory, or a list of its part files, as one memory-mapped Parquet dataset."""
+    return ds.dataset(source, schema=MESSAGE_SCHEMA, format="parquet", filesystem=MAPPED_FILESYSTEM)
+
+def message_month(ts):
+    """Partition month ("YYYY-MM", UTC) of a Slack timestamp."""
+    return datetime.fromtimestamp(float(ts), tz=timezone.utc).strftime("%Y-%m")
+
+def message_row(msg, channel_id, channel_name, ingested_at):
+    edited = msg.get("edited") or {}
+    return {
+        "ts": msg["ts"],
+        "channel_name": channel_name,
+        "user": msg.get("user", "unknown"),
+        "thread_ts": msg.get("thread_ts"),
+        "text": msg.get("text", ""),
+        "subtype": msg.get("subtype"),
+        "reply_count": msg.get("reply_count"),
+        "latest_reply": msg.get("latest_reply"),
+        "edited_ts": edited.get("ts"),
+        "edited_user": edited.get("user"),
+        "ingested_at": ingested_at
+    }
+
+def record_to_rows(record, ingested_at):
+    """Rows of a message record, or of the parent and every reply of a thread record."""
+    channel_id, channel_name = record["channel_id"], record.get("channel_name", record["channel_id"])
+
+    if record.get("type") != "thread":
+        if not record.get("ts"):
+            return []
+        return [(channel_id, message_row(record, channel_id, channel_name, ingested_at))]
+
+    thread_ts = record["thread_ts"]
+    parent = dict(record["parent"], thread_ts=thread_ts, reply_count=record["reply_count"],
+                  latest_reply=record.get("latest_reply"))
+    rows = [(channel_id, message_row(parent, channel_id, channel_name, ingested_at))]
+    rows.extend(
+        (channel_id, message_row(dict(reply, thread_ts=thread_ts), channel_id, channel_name, ingested_at))
+        for reply in record["replies"]
+    )
+    return rows
+
+def partition_directory(root, channel_id, month):
+    return os.path.join(root, f"channel_id={channel_id}", f"month={month}")
+
+def part_files(directory):
+    """Finished Parquet files of a partition, in write order."""
+    return sorted(
+        os.path.join(directory, name) for name in os.listdir(directory)
+        if name.startswith("part-") and name.endswith(".parquet")
+    )
+
+def write_part_file(directory, table):
+    """Write a table as a new Parquet file of a partition."""
+    os.makedirs(directory, exist_ok=True)
+
+    # Sortable names: files of a partition list in write order
+    name = f"part-{time.time_ns()}-{uuid.uuid4().hex[:8]}.parquet"
+    # Readers skip dot files, so a crash never leaves a half-written part behind
+    tmp_path = os.path.join(directory, f".{name}.tmp")
+    pq.write_table(table, tmp_path, compression="zstd")
+    os.replace(tmp_path, os.path.join(directory, name))
+
+def latest_versions(table):
+    """Keep the most recently ingested row of every message of one partition, oldest message first."""
+    table = table.append_column("_epoch", pc.cast(table["ts"], pa.float64()))
+    table = table.sort_by([("_epoch", "ascending"), ("ingested_at", "descending")])
+    if table.num_rows:
+        keys = table["ts"].combine_chunks()
+        previous = pa.concat_arrays([pa.nulls(1, keys.type), keys.slice(0, len(keys) - 1)])
+        table = table.filter(pc.fill_null(pc.not_equal(keys, previous), True))
+    return table.drop_columns(["_epoch"])
+
+def compact_partition(directory):
+    """
+    Merge the files of a partition into one holding the latest version of every message.
+
+    The merged file is in place before the old ones are removed, and readers
+    keep the most recently ingested copy of a message, so a crash in between
+    only leaves duplicates behind. Files written meanwhile are left alone.
+
+    Returns:
+        int: Number of files merged
+    """
+    files = part_files(directory)
+    if len(files) < 2:
+        return 0
+
+    table = latest_versions(open_dataset(files).to_table())
+    write_part_file(directory, table)
+    for path in files:
+        os.remove(path)
+    return len(files)
+
+def iter_partitions(root, channels=None, since=None, until=None):
+    """Yield (channel_id, month, directory) of the stored partitions, channel by channel, oldest month first."""
+    if not os.path.isdir(root):
+        return
+
+    first_month = message_month(since) if since is not None else None
+    last_month = message_month(until) if until is not None else None
+
+    for channel_entry in sorted(os.listdir(root)):
+        if not channel_entry.startswith("channel_id="):
+            continue
+        channel_id = channel_entry.split("=", 1)[1]
+        if channels and channel_id not in channels:
+            continue
+
+        channel_directory = os.path.join(root, channel_entry)
+        for month_entry in sorted(os.listdir(channel_directory)):
+            if not month_entry.startswith("month="):
+                continue
+            month = month_entry.split("=", 1)[1]
+            if (first_month and month < first_month) or (last_month and month > last_month):
+                continue
+            yield channel_id, month, os.path.join(channel_directory, month_entry)
+
+def compact_store(root, min_files=2):
+    """
+    Compact every partition of the store that has at least `min_files` files.
+
+    Returns:
+        int: Number of partitions compacted
+    """
+    compacted = 0
+    for _, _, directory in iter_partitions(root):
+        if len(part_files(directory)) >= min_files:
+            compact_partition(directory)
+            compacted += 1
+    return compacted
+
+class MessageStoreWriter:
+    """
+    Append-only writer of the columnar message store.
+
+    Rows are buffered per (channel, month) partition and written as a new
+    Parquet file whenever `rows_per_file` rows are waiting and on close, so a
+    history of any size is written in bounded memory and existing files are
+    appended to. A message written twice (re-sync, edit) is stored twice;
+    readers keep the most recently ingested copy. A partition that has
+    accumulated `max_files_per_partition` files is compacted into one.
+    """
+
+    def __init__(self, root, rows_per_file=DEFAULT_ROWS_PER_FILE,
+                 max_files_per_partition=DEFAULT_MAX_FILES_PER_PARTITION):
+        """
+        Args:
+            root (str): Directory of the store
+            rows_per_file (int): Buffered rows that trigger a write
+            max_files_per_partition (int): Files of a partition that trigger its compaction
+        """
+        self.root = root
+        self.rows_per_file = rows_per_file
+        self.max_files_per_partition = max_files_per_partition
+        self.buffers = {}
+        self.buffered = 0
+        self.written = 0
+
+    def add(self, record):
+        """Buffer a message or thread record."""
+        for channel_id, row in record_to_rows(record, time.time()):
+            self.buffers.setdefault((channel_id, message_month(row["ts"])), []).append(row)
+            self.buffered += 1
+
+        if self.buffered >= self.rows_per_file:
+            self.flush()
+
+    def flush(self):
+        """Write every buffered partition to a new Parquet file."""
+        for (channel_id, month), rows in self.buffers.items():
+            directory = partition_directory(self.root, channel_id, month)
+            table = pa.Table.from_pylist(sorted(rows, key=lambda row: float(row["ts"])), schema=MESSAGE_SCHEMA)
+            write_part_file(directory, table)
+            self.written += len(rows)
+
+            if len(part_files(directory)) >= self.max_files_per_partition:
+                compact_partition(directory)
+
+        self.buffers = {}
+        self.buffered = 0
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def write_records_to_store(records, root, rows_per_file=DEFAULT_ROWS_PER_FILE):
+    """
+    Write records to the columnar store as they stream past.
+
+    Args:
+        records (iterable): Message and thread records
+        root (str): Directory of the store
+        rows_per_file (int): Buffered rows that trigger a write
+
+    Yields:
+        dict: Every record, unchanged
+    """
+    with MessageStoreWriter(root, rows_per_file) as writer:
+        for record in records:
+            writer.add(record)
+            yield record
+
+def iter_message_batches(root, columns=None, channels=None, since=None, until=None, batch_size=10000,
+                         threads=None):
+    """
+    Stream the stored messages as Arrow record batches, one partition at a time.
+
+    Only the requested columns are decoded, and channel and month filters skip
+    whole partitions without opening them. Messages are deduplicated within
+    their partition, so memory is bounded by the largest (channel, month) rather
+    than by the whole history. Every message appears once, in its most recently
+    ingested version; partitions come channel by channel, oldest month first,
+    and the messages of a partition oldest first.
+
+    Args:
+        root (str): Directory of the store
+        columns (list, optional): Columns to read, all if omitted
+        channels (list, optional): Only read these channel IDs
+        since (float, optional): Only read messages at or after this epoch time
+        until (float, optional): Only read messages at or before this epoch time
+        batch_size (int): Rows per batch
+        threads (list, optional): Only read the parents and replies of these thread timestamps
+
+    Yields:
+        pyarrow.RecordBatch: The messages, with channel_id and month columns
+    """
+    # The key and version columns are always needed to keep one copy per message
+    stored = [
+        name for name in MESSAGE_SCHEMA.names
+        if columns is None or name in columns or name in ("ts", "ingested_at")
+    ]
+    stored_schema = pa.schema([MESSAGE_SCHEMA.field(name) for name in stored])
+    output = list(dict.fromkeys(columns)) if columns is not None else MESSAGE_SCHEMA.names + PARTITION_SCHEMA.names
+
+    row_filter = None
+    if since is not None:
+        row_filter = pc.field("ts").cast(pa.float64()) >= float(since)
+    if until is not None:
+        until_filter = pc.field("ts").cast(pa.float64()) <= float(until)
+        row_filter = until_filter if row_filter is None else row_filter & until_filter
+    if threads is not None:
+        thread_filter = pc.field("thread_ts").isin(list(threads))
+        row_filter = thread_filter if row_filter is None else row_filter & thread_filter
+
+    for channel_id, month, directory in iter_partitions(root, channels, since, until):
+        dataset = open_dataset(directory)
+        table = pa.Table.from_batches(dataset.to_batches(columns=stored, filter=row_filter), schema=stored_schema)
+        if not table.num_rows:
+            continue
+
+        table = latest_versions(table)
+        table = table.append_column("channel_id", pa.array([channel_id] * table.num_rows, pa.string()))
+        table = table.append_column("month", pa.array([month] * table.num_rows, pa.string()))
+        yield from table.select(output).to_batches(max_chunksize=batch_size)
+
+def high_water_marks(root, channels=None):
+    """
+    Newest top-level message of every stored channel, as sync state high-water marks.
+
+    Only the latest month with channel history is read per channel. Thread
+    replies are left out, as conversations.history does.
+
+    Returns:
+        dict: Newest `ts` keyed by channel ID
+    """
+    months = {}
+    for channel_id, _, directory in iter_partitions(root, channels):
+        months.setdefault(channel_id, []).append(directory)
+
+    marks = {}
+    top_level = pc.field("thread_ts").is_null() | (pc.field("thread_ts") == pc.field("ts")) | (
+        pc.field("subtype") == "thread_broadcast")
+    for channel_id, directories in months.items():
+        for directory in reversed(directories):
+            dataset = open_dataset(directory)
+            ts = dataset.to_table(columns=["ts"], filter=top_level)["ts"].to_pylist()
+            if ts:
+                marks[channel_id] = max(ts, key=float)
+                break
+    return marks
+
+def read_messages(root, columns=None, channels=None, since=None, until=None):
+    """
+    Read the stored messages as one Arrow table, oldest message first.
+
+    Loads the whole selection into memory; iter_message_batches streams it.
+    Arguments are those of iter_message_batches.
+
+    Returns:
+        pyarrow.Table: The messages, with channel_id and month columns
+    """
+    schema = pa.unify_schemas([MESSAGE_SCHEMA, PARTITION_SCHEMA])
+    if columns is not None:
+        schema = pa.schema([schema.field(name) for name in dict.fromkeys(columns)])
+
+    table = pa.Table.from_batches(list(iter_message_batches(root, columns, channels, since, until)), schema=schema)
+    order = pc.sort_indices(pc.cast(table["ts"], pa.float64())) if "ts" in table.column_names else None
+    return table.take(order) if order is not None else table
+
+def row_to_message(row):
+    """Stored row as a Slack message dict, without empty fields."""
+    msg = {key: value for key, value in row.items() if value is not None}
+    if msg.pop("edited_ts", None):
+        msg["edited"] = {"ts": row["edited_ts"], "user": row["edited_user"]}
+        msg.pop("edited_user", None)
+    return msg
+
+def complete_threads(root, channel_id, threads, columns, since):
+    """
+    Add the parents and earlier replies of threads started before `since` but active after it.
+
+    Only the partitions between the oldest such thread and `since` are read,
+    and within them only the rows of those threads.
+    """
+    older = [thread_ts for (_, thread_ts) in threads if float(thread_ts) < since]
+    if not older:
+        return
+
+    for batch in iter_message_batches(root, columns, [channel_id], since=min(map(float, older)), until=since,
+                                      threads=older):
+        for row in batch.to_pylist():
+            msg = row_to_message(row)
+            thread = threads[(channel_id, msg["thread_ts"])]
+            if msg["ts"] == msg["thread_ts"]:
+                thread["parent"] = thread["parent"] or msg
+            elif float(msg["ts"]) < since:
+                thread["replies"].append(msg)
+
+    for thread in threads.values():
+        thread["replies"].sort(key=lambda reply: float(reply["ts"]))
+
+def thread_records(threads):
+    """Thread records of the threads collected by iter_store_records that have replies."""
+    for (channel_id, thread_ts), thread in threads.items():
+        parent = thread["parent"]
+        if parent is None or not thread["replies"]:
+            continue
+        yield {
+            "type": "thread",
+            "channel_id": channel_id,
+            "channel_name": parent.get("channel_name", channel_id),
+            "thread_ts": thread_ts,
+            "latest_reply": parent.get("latest_reply"),
+            "reply_count": len(thread["replies"]),
+            "parent": {"user": parent.get("user", "unknown"), "ts": parent["ts"], "text": parent.get("text", "")},
+            "replies": [
+                {"user": reply.get("user", "unknown"), "ts": reply["ts"], "text": reply.get("text", "")}
+                for reply in thread["replies"]
+            ]
+        }
+
+def iter_store_records(root, channels=None, since=None, until=None, batch_size=10000):
+    """
+    Yield the stored history in the record format of the extractor.
+
+    The channels are read one after the other: the top-level messages of a
+    channel are yielded oldest first, followed by one thread record per thread
+    of that channel, so the result can go straight into
+    iter_documents_for_vectordb and only one channel's threads are held at a time.
+
+    Args:
+        root (str): Directory of the store
+        channels (list, optional): Only read these channel IDs
+        since (float, optional): Only read messages at or after this epoch time; a thread with
+            replies in the period comes whole, with its older parent and replies
+        until (float, optional): Only read messages at or before this epoch time
+        batch_size (int): Rows converted to Python objects at a time
+
+    Yields:
+        dict: Message records, then thread records, channel by channel
+    """
+    columns = ["channel_id", "channel_name", "ts", "user", "thread_ts", "text", "subtype",
+               "reply_count", "latest_reply", "edited_ts", "edited_user"]
+    threads = {}
+    current_channel = None
+
+    for batch in iter_message_batches(root, columns, channels, since, until, batch_size):
+        for row in batch.to_pylist():
+            if row["channel_id"] != current_channel:
+                if since is not None:
+                    complete_threads(root, current_channel, threads, columns, since)
+                yield from thread_records(threads)
+                threads = {}
+                current_channel = row["channel_id"]
+
+            msg = row_to_message(row)
+            thread_ts = msg.get("thread_ts")
+            if thread_ts:
+                thread = threads.setdefault((msg["channel_id"], thread_ts), {"parent": None, "replies": []})
+                if thread_ts == msg["ts"]:
+                    thread["parent"] = msg
+                else:
+                    thread["replies"].append(msg)
+                    # Replies are not part of the channel history, as in conversations.history
+                    if msg.get("subtype") != "thread_broadcast":
+                        continue
+
+            yield msg
+
+    if since is not None:
+        complete_threads(root, current_channel, threads, columns, since)
+    yield from thread_records(threads)
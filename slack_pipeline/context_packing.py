@@ -0,0 +1,151 @@
+import re
+from langchain.schema import Document
+from tokenizer import count_tokens, truncate_to_tokens
+from chunking import DEFAULT_MAX_GAP_SECONDS
+
+# Token budget of the context placed in the "stuff" prompt
+DEFAULT_CONTEXT_TOKENS = 2000
+
+# Documents whose word shingles overlap at least this much are near-duplicates
+DEFAULT_DUPLICATE_THRESHOLD = 0.8
+
+# A trimmed document is only kept if at least this many tokens of it fit
+MIN_TRIMMED_TOKENS = 50
+
+SHINGLE_SIZE = 3
+
+def shingles(text):
+    """Set of overlapping word triples of a text, ignoring case and punctuation."""
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < SHINGLE_SIZE:
+        return {tuple(words)}
+    return {tuple(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+def is_near_duplicate(candidate, kept, threshold):
+    """
+    Return True if the shingles of `candidate` are mostly covered by an already kept document.
+
+    Containment rather than Jaccard similarity is used, so a message that is
+    repeated inside a longer window or thread counts as a duplicate of it.
+    """
+    if not candidate:
+        return True
+    return any(len(candidate & other) / len(candidate) >= threshold for other in kept)
+
+def drop_near_duplicates(documents, threshold=DEFAULT_DUPLICATE_THRESHOLD):
+    """Keep the best ranked copy of every group of near-duplicate documents."""
+    kept, kept_shingles = [], []
+
+    for doc in documents:
+        doc_shingles = shingles(doc.page_content)
+        if not is_near_duplicate(doc_shingles, kept_shingles, threshold):
+            kept.append(doc)
+            kept_shingles.append(doc_shingles)
+
+    return kept
+
+def to_seconds(value, default=0.0):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+def conversation_span(doc):
+    """(channel, thread, first ts, last ts) of a document, used to find neighbouring pieces."""
+    metadata = doc.metadata
+    start = to_seconds(metadata.get("timestamp"))
+    end = to_seconds(metadata.get("end_timestamp"), start)
+    return metadata.get("channel_id"), metadata.get("thread_ts"), start, end
+
+def merge_adjacent(documents, max_gap_seconds=DEFAULT_MAX_GAP_SECONDS):
+    """
+    Merge retrieved pieces of the same conversation into one block.
+
+    Two documents are merged when they belong to the same thread, or to the
+    same channel outside any thread and follow each other within
+    `max_gap_seconds`. The merged block takes the rank of its best member and
+    lists the pieces oldest first, so the LLM reads the conversation in order.
+    """
+    groups = []
+
+    for rank, doc in enumerate(documents):
+        channel_id, thread_ts, start, end = conversation_span(doc)
+        for group in groups:
+            if group["channel_id"] != channel_id or group["thread_ts"] != thread_ts:
+                continue
+            if thread_ts or (start - group["end"] <= max_gap_seconds and group["start"] - end <= max_gap_seconds):
+                group["documents"].append((start, doc))
+                group["start"], group["end"] = min(group["start"], start), max(group["end"], end)
+                break
+        else:
+            groups.append({
+                "channel_id": channel_id,
+                "thread_ts": thread_ts,
+                "start": start,
+                "end": end,
+                "rank": rank,
+                "documents": [(start, doc)]
+            })
+
+    merged = []
+    for group in sorted(groups, key=lambda group: group["rank"]):
+        members = [doc for _, doc in sorted(group["documents"], key=lambda member: member[0])]
+        if len(members) == 1:
+            merged.append(members[0])
+            continue
+
+        merged.append(Document(
+            id=members[0].id,
+            page_content="\n".join(doc.page_content for doc in members),
+            metadata=dict(members[0].metadata, merged_ids=",".join(str(doc.id) for doc in members))
+        ))
+
+    return merged
+
+def trim_to_budget(documents, max_tokens=DEFAULT_CONTEXT_TOKENS):
+    """
+    Keep documents in rank order until the token budget is spent.
+
+    The document that crosses the budget is cut to fit, unless less than
+    MIN_TRIMMED_TOKENS of it would remain.
+    """
+    packed = []
+    remaining = max_tokens
+
+    for doc in documents:
+        # Documents are joined with a blank line in the prompt
+        tokens = count_tokens(doc.page_content) + 1
+        if tokens <= remaining:
+            packed.append(doc)
+            remaining -= tokens
+            continue
+
+        if remaining >= MIN_TRIMMED_TOKENS:
+            packed.append(Document(
+                id=doc.id,
+                page_content=truncate_to_tokens(doc.page_content, remaining - 1),
+                metadata=dict(doc.metadata, trimmed=True)
+            ))
+        break
+
+    return packed
+
+def pack_context(documents, max_tokens=DEFAULT_CONTEXT_TOKENS, duplicate_threshold=DEFAULT_DUPLICATE_THRESHOLD):
+    """
+    Turn retrieved documents into the smallest context that keeps their information.
+
+    Near-duplicates (repeated bot messages, cross-posts, a message also present
+    in its thread) are dropped, pieces of the same conversation are merged, and
+    the result is cut to `max_tokens` tokens counted with the model's tokenizer.
+
+    Args:
+        documents (list): Retrieved Langchain documents, best first
+        max_tokens (int): Token budget of the context
+        duplicate_threshold (float): Shingle containment above which a document is a duplicate
+
+    Returns:
+        list: The packed documents, best first
+    """
+    documents = drop_near_duplicates(documents, duplicate_threshold)
+    documents = merge_adjacent(documents)
+    return trim_to_budget(documents, max_tokens)
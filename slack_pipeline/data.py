@@ -6,6 +6,7 @@ from slack_sdk import WebClient
 from slack_bolt import App
 from slack_bolt.adapter.socket_mode import SocketModeHandler
 from dotenv import load_dotenv
+from async_data import extract_all_channels_messages_concurrent
 
 load_dotenv()
 
@@ -127,9 +128,169 @@ def save_data_to_file(data, filename=None):
     
     return filename
 
-## TODO: Add a function to process messages for vector database
+def append_records_to_jsonl(records, filename):
+    """
+    Append records to a JSONL file as they stream past.
+    
+    The file is only ever appended to, one JSON object per line, so nothing has
+    to be held in memory and an interrupted run keeps everything written so far.
+    
+    Args:
+        records (iterable): Message or thread records
+        filename (str): Path of the JSONL file
+        
+    Yields:
+        dict: Every record, unchanged, once it has been written
+    """
+    with open(filename, 'a', encoding='utf-8') as f:
+        for record in records:
+            f.write(json.dumps(record) + "\n")
+            yield record
+
+def iter_jsonl(filename):
+    """Yield the records of a JSONL file one line at a time."""
+    with open(filename, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+def iter_channels_data_records(channels_data):
+    """
+    Flatten the dictionary returned by extract_all_channels_messages into records.
+    
+    Args:
+        channels_data (dict): Dictionary with channel IDs as keys
+        
+    Yields:
+        dict: Message records with "channel_id" and "channel_name", then thread records
+    """
+    for channel_id, channel_data in channels_data.items():
+        channel_name = channel_data.get("name", channel_id)
+        for msg in channel_data.get("messages", []):
+            yield dict(msg, channel_id=channel_id, channel_name=channel_name)
+        for thread in channel_data.get("threads", []):
+            yield thread
+
+def load_sync_state(state_file):
+    """
+    Load the per-channel high-water marks written by a previous sync.
+    
+    Args:
+        state_file (str): Path to the sync state JSON file
+        
+    Returns:
+        dict: Dictionary with channel IDs as keys and the newest seen `ts` as values
+    """
+    if not os.path.exists(state_file):
+        return {}
+    
+    with open(state_file, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def save_sync_state(state, state_file):
+    """Atomically write the per-channel high-water marks to disk."""
+    state_dir = os.path.dirname(state_file)
+    if state_dir:
+        os.makedirs(state_dir, exist_ok=True)
+    
+    tmp_file = f"{state_file}.tmp"
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_file, state_file)
+    
+    return state_file
+
+def track_high_water_marks(records, state):
+    """
+    Advance the per-channel high-water marks in `state` as message records stream past.
+    
+    Args:
+        records (iterable): Message records with "channel_id" and "ts"
+        state (dict): High-water marks keyed by channel ID, updated in place
+        
+    Yields:
+        dict: Every record, unchanged
+    """
+    for record in records:
+        channel_id, ts = record.get("channel_id"), record.get("ts")
+        if channel_id and ts and (channel_id not in state or float(ts) > float(state[channel_id])):
+            state[channel_id] = ts
+        yield record
 
-def main(channel_ids=None, days_back=100, output_file=None):
+def update_sync_state(state, channels_data):
+    """
+    Advance the high-water mark of every channel to the newest message extracted.
+    
+    Args:
+        state (dict): Current high-water marks, keyed by channel ID
+        channels_data (dict): Extracted data as returned by extract_all_channels_messages
+        
+    Returns:
+        dict: A new state dictionary with the updated high-water marks
+    """
+    new_state = dict(state)
+    for _ in track_high_water_marks(iter_channels_data_records(channels_data), new_state):
+        pass
+    
+    return new_state
+
+def sync_channels_messages(channel_ids=None, state_file="./slack_vectordb/sync_state.json", days_back=100,
+                           concurrent=True):
+    """
+    Extract only the messages posted since the last sync of each channel.
+    
+    Without `channel_ids`, every channel visible to the bot is listed on each
+    run, so channels created or joined since the last sync are picked up too.
+    Channels without a high-water mark yet fall back to the `days_back` window.
+    The state file is not written here; call save_sync_state once the returned
+    messages have been stored so that a failed run is simply retried.
+    
+    Args:
+        channel_ids (list, optional): Specific channel IDs to sync
+        state_file (str): Path to the sync state JSON file
+        days_back (int, optional): Window used for channels that were never synced
+        concurrent (bool): Fetch channels concurrently with the async extraction engine
+        
+    Returns:
+        tuple: (channels_data, new_state) where channels_data has the same shape as
+            extract_all_channels_messages and new_state holds the advanced high-water marks
+    """
+    state = load_sync_state(state_file)
+    
+    if days_back:
+        default_oldest = str(datetime.now().timestamp() - (days_back * 24 * 60 * 60))
+    else:
+        default_oldest = None
+    
+    if concurrent:
+        # Lists the channels itself when none are given; `oldest` is exclusive, so the
+        # checkpointed message is not fetched again, and unknown channels get the default window
+        channels_data = extract_all_channels_messages_concurrent(
+            channel_ids,
+            oldest=default_oldest,
+            oldest_by_channel=state
+        )
+    else:
+        if not channel_ids:
+            try:
+                result = client.conversations_list(types="public_channel,private_channel")
+                channel_ids = [channel["id"] for channel in result["channels"]]
+            except Exception as e:
+                print(f"Error fetching channels: {e}")
+                return {}, state
+        
+        channels_data = {}
+        for channel_id in channel_ids:
+            channel_data = extract_all_channels_messages([channel_id], oldest=state.get(channel_id, default_oldest))
+            channels_data.update(channel_data)
+    
+    new_messages = sum(len(data["messages"]) for data in channels_data.values())
+    print(f"Fetched {new_messages} new messages from {len(channels_data)} channels.")
+    
+    return channels_data, update_sync_state(state, channels_data)
+
+
+def main(channel_ids=None, days_back=100, output_file=None, concurrent=True):
     """
     Main function to extract messages and prepare them for vector database.
     
@@ -137,6 +298,7 @@ def main(channel_ids=None, days_back=100, output_file=None):
         channel_ids (list, optional): Specific channel IDs to extract from
         days_back (int, optional): How many days back to extract messages
         output_file (str, optional): Filename to save raw data
+        concurrent (bool): Fetch channels concurrently with the async extraction engine
     
     Returns:
         list: Processed documents ready for vector database
@@ -149,7 +311,10 @@ def main(channel_ids=None, days_back=100, output_file=None):
         oldest = None
     
     # Extract messages
-    channels_data = extract_all_channels_messages(channel_ids, oldest)
+    if concurrent:
+        channels_data = extract_all_channels_messages_concurrent(channel_ids, oldest)
+    else:
+        channels_data = extract_all_channels_messages(channel_ids, oldest)
     
     # Save raw data if needed
     if output_file:
@@ -0,0 +1,218 @@
+import os
+import platform
+import threading
+from langchain_core.embeddings import Embeddings
+from langchain_openai import OpenAIEmbeddings
+
+DEFAULT_LOCAL_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+# Output sizes of the OpenAI models, so that checking a collection costs no API call
+OPENAI_DIMENSIONS = {
+    "text-embedding-ada-002": 1536,
+    "text-embedding-3-small": 1536,
+    "text-embedding-3-large": 3072
+}
+
+# int8 ONNX exports shipped with the sentence-transformers models, one per instruction set
+QUANTIZED_ONNX_FILES = {
+    "arm64": "onnx/model_qint8_arm64.onnx",
+    "avx512_vnni": "onnx/model_qint8_avx512_vnni.onnx",
+    "avx512": "onnx/model_qint8_avx512.onnx",
+    "avx2": "onnx/model_quint8_avx2.onnx"
+}
+
+# Keys stored in the Chroma collection metadata
+MODEL_METADATA_KEY = "embedding_model"
+DIMENSION_METADATA_KEY = "embedding_dimension"
+
+def cpu_flags():
+    """Instruction set flags of the CPU, empty where /proc/cpuinfo is not available."""
+    try:
+        with open("/proc/cpuinfo", "r", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("flags"):
+                    return set(line.split(":", 1)[1].split())
+    except OSError:
+        pass
+    return set()
+
+def default_quantized_onnx_file():
+    """The int8 ONNX export matching the CPU the process runs on."""
+    if platform.machine().lower() in ("arm64", "aarch64"):
+        return QUANTIZED_ONNX_FILES["arm64"]
+
+    flags = cpu_flags()
+    if "avx512_vnni" in flags:
+        return QUANTIZED_ONNX_FILES["avx512_vnni"]
+    if "avx512f" in flags:
+        return QUANTIZED_ONNX_FILES["avx512"]
+    return QUANTIZED_ONNX_FILES["avx2"]
+
+class LocalEmbeddings(Embeddings):
+    """
+    Sentence-transformers embedding model running on the local CPU.
+
+    Texts are encoded in batches of `batch_size` per forward pass. Forward passes
+    are serialized: every pass already uses all `num_threads` cores, so the
+    parallel ingestion workers would only compete for them. With
+    `runtime="onnx"` the model runs in ONNX Runtime, and `quantize=True` loads
+    the int8 weights built for the local CPU (ONNX) or dynamically quantizes
+    the linear layers (torch).
+    """
+
+    def __init__(self, model_name=DEFAULT_LOCAL_MODEL, runtime="torch", num_threads=None, quantize=False,
+                 batch_size=64, onnx_file=None):
+        """
+        Args:
+            model_name (str): Hugging Face model name or local path
+            runtime (str): "torch" or "onnx"
+            num_threads (int, optional): CPU threads per forward pass, all cores if omitted
+            quantize (bool): Use int8 weights
+            batch_size (int): Texts encoded per forward pass
+            onnx_file (str, optional): ONNX file of the model repository to load, by default the
+                int8 export for the local CPU when quantizing and the full precision model otherwise
+        """
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError as e:
+            raise ImportError(
+                "Local embeddings need sentence-transformers: pip install 'sentence-transformers[onnx]'"
+            ) from e
+
+        num_threads = num_threads or os.cpu_count()
+        model_kwargs = {}
+
+        if runtime == "onnx":
+            import onnxruntime
+
+            session_options = onnxruntime.SessionOptions()
+            session_options.intra_op_num_threads = num_threads
+            model_kwargs["session_options"] = session_options
+            model_kwargs["provider"] = "CPUExecutionProvider"
+            if onnx_file or quantize:
+                model_kwargs["file_name"] = onnx_file or default_quantized_onnx_file()
+        elif runtime != "torch":
+            raise ValueError(f"Unknown embedding runtime: {runtime}")
+
+        import torch
+        torch.set_num_threads(num_threads)
+
+        self.model_name = model_name
+        self.runtime = runtime
+        self.quantize = quantize
+        self.batch_size = batch_size
+        self.lock = threading.Lock()
+        self.client = SentenceTransformer(model_name, device="cpu", backend=runtime, model_kwargs=model_kwargs)
+
+        if quantize and runtime == "torch":
+            self.client = torch.quantization.quantize_dynamic(self.client, {torch.nn.Linear}, dtype=torch.qint8)
+
+        self.dimension = self.client.get_sentence_embedding_dimension()
+        # Quantized weights give slightly different vectors, so they count as another model
+        self.model = model_name + ("-int8" if quantize else "")
+
+    def embed_documents(self, texts):
+        with self.lock:
+            vectors = self.client.encode(
+                list(texts),
+                batch_size=self.batch_size,
+                normalize_embeddings=True,
+                convert_to_numpy=True,
+                show_progress_bar=False
+            )
+        return vectors.tolist()
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+def make_embeddings(backend=None, http_client=None):
+    """
+    Build the embedding model selected by the environment.
+
+    EMBEDDING_BACKEND is "openai" (the default) or "local". The local backend
+    reads LOCAL_EMBEDDING_MODEL, LOCAL_EMBEDDING_RUNTIME ("torch" or "onnx"),
+    EMBEDDING_THREADS, EMBEDDING_QUANTIZE ("int8") and LOCAL_EMBEDDING_ONNX_FILE
+    (the ONNX file to load, picked for the CPU if omitted).
+
+    Args:
+        backend (str, optional): Overrides EMBEDDING_BACKEND
+        http_client (httpx.Client, optional): HTTP client for the OpenAI backend
+
+    Returns:
+        Embeddings: The embedding model
+    """
+    backend = backend or os.environ.get("EMBEDDING_BACKEND", "openai")
+
+    if backend == "openai":
+        return OpenAIEmbeddings(
+            openai_api_key=os.environ.get("OPENAI_API_KEY"),
+            http_client=http_client
+        )
+    if backend == "local":
+        threads = os.environ.get("EMBEDDING_THREADS")
+        return LocalEmbeddings(
+            model_name=os.environ.get("LOCAL_EMBEDDING_MODEL", DEFAULT_LOCAL_MODEL),
+            runtime=os.environ.get("LOCAL_EMBEDDING_RUNTIME", "torch"),
+            num_threads=int(threads) if threads else None,
+            quantize=os.environ.get("EMBEDDING_QUANTIZE", "").lower() == "int8",
+            onnx_file=os.environ.get("LOCAL_EMBEDDING_ONNX_FILE") or None
+        )
+
+    raise ValueError(f"Unknown embedding backend: {backend}")
+
+def embedding_model_name(embeddings):
+    """Name identifying the vectors an embedding model produces."""
+    return getattr(embeddings, "model", None) or type(embeddings).__name__
+
+def embedding_dimension(embeddings):
+    """Length of the vectors of an embedding model, embedding a probe text if it is not known."""
+    dimension = getattr(embeddings, "dimension", None) or getattr(embeddings, "dimensions", None)
+    if dimension:
+        return dimension
+    if embedding_model_name(embeddings) in OPENAI_DIMENSIONS:
+        return OPENAI_DIMENSIONS[embedding_model_name(embeddings)]
+    return len(embeddings.embed_query("dimension probe"))
+
+def check_embedding_model(vectordb, embeddings):
+    """
+    Refuse to use a collection with another embedding model than the one it was built with.
+
+    Vectors from different models live in unrelated spaces: mixing them does not
+    fail, it silently returns nonsense. The model name and dimension are recorded
+    in the collection metadata on first use and compared on every open.
+    Collections built before the metadata existed are adopted if their stored
+    vectors have the right dimension.
+
+    Args:
+        vectordb (Chroma): The vector store
+        embeddings (Embeddings): The embedding model about to be used with it
+
+    Raises:
+        ValueError: If the collection was built with another model
+    """
+    collection = vectordb._collection
+    metadata = dict(collection.metadata or {})
+    model = embedding_model_name(embeddings)
+    dimension = embedding_dimension(embeddings)
+
+    if MODEL_METADATA_KEY in metadata:
+        if metadata[MODEL_METADATA_KEY] != model or metadata[DIMENSION_METADATA_KEY] != dimension:
+            raise ValueError(
+                f"The collection was built with {metadata[MODEL_METADATA_KEY]} "
+                f"({metadata[DIMENSION_METADATA_KEY]} dimensions), not {model} ({dimension} dimensions). "
+                "Rebuild it into a new directory to switch embedding models."
+            )
+        return
+
+    if collection.count():
+        stored = collection.get(limit=1, include=["embeddings"])["embeddings"]
+        if len(stored[0]) != dimension:
+            raise ValueError(
+                f"The collection holds {len(stored[0])}-dimensional vectors, "
+                f"but {model} produces {dimension} dimensions."
+            )
+
+    # The distance function cannot be changed after creation, so it is not passed back
+    metadata = {key: value for key, value in metadata.items() if not key.startswith("hnsw:")}
+    metadata.update({MODEL_METADATA_KEY: model, DIMENSION_METADATA_KEY: dimension})
+    collection.modify(metadata=metadata)
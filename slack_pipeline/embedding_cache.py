@@ -0,0 +1,118 @@
+import os
+import re
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+from langchain_core.embeddings import Embeddings
+
+def normalize_query(text):
+    """Normalize a query so that trivially different spellings share a cache entry."""
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+def query_cache_key(text):
+    """
+    Cache key of a query: whitespace is collapsed, case is kept.
+
+    Case matters to the embedding models (ticket keys like FINERACT-1234, class
+    names), so queries that only differ in case get their own entries.
+    """
+    return re.sub(r"\s+", " ", text).strip()
+
+class CachedQueryEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that caches query embeddings in two tiers.
+
+    Queries are keyed by their whitespace-normalized text and the embedding model
+    name, and the original text is what gets embedded on a miss. The
+    first tier is an in-process LRU dictionary; the second is a SQLite file that
+    survives restarts and is shared by every process pointing at it. Document
+    embeddings are passed straight through to the wrapped model.
+    """
+
+    def __init__(self, embeddings, model_name, cache_file=None, max_entries=10000):
+        """
+        Args:
+            embeddings (Embeddings): The embedding model to wrap
+            model_name (str): Name of the model, part of every cache key
+            cache_file (str, optional): SQLite file of the persistent tier, none if omitted
+            max_entries (int): Capacity of the in-process LRU tier
+        """
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+
+        self.db = None
+        if cache_file:
+            cache_dir = os.path.dirname(cache_file)
+            if cache_dir:
+                os.makedirs(cache_dir, exist_ok=True)
+            self.db = sqlite3.connect(cache_file, check_same_thread=False)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS query_embeddings ("
+                "model TEXT NOT NULL, query TEXT NOT NULL, embedding TEXT NOT NULL, "
+                "PRIMARY KEY (model, query))"
+            )
+            self.db.commit()
+
+    def _remember(self, key, embedding):
+        self.memory[key] = embedding
+        self.memory.move_to_end(key)
+        if len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+
+    def embed_query(self, text):
+        key = query_cache_key(text)
+
+        with self.lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return self.memory[key]
+
+            if self.db is not None:
+                row = self.db.execute(
+                    "SELECT embedding FROM query_embeddings WHERE model = ? AND query = ?",
+                    (self.model_name, key)
+                ).fetchone()
+                if row:
+                    embedding = json.loads(row[0])
+                    self._remember(key, embedding)
+                    self.stats["disk_hits"] += 1
+                    return embedding
+
+            self.stats["misses"] += 1
+
+        embedding = self.embeddings.embed_query(text)
+
+        with self.lock:
+            self._remember(key, embedding)
+            if self.db is not None:
+                self.db.execute(
+                    "INSERT OR REPLACE INTO query_embeddings (model, query, embedding) VALUES (?, ?, ?)",
+                    (self.model_name, key, json.dumps(embedding))
+                )
+                self.db.commit()
+
+        return embedding
+
+    def embed_documents(self, texts):
+        return self.embeddings.embed_documents(texts)
+
+    def cache_stats(self):
+        """Return hit and miss counters for both tiers."""
+        with self.lock:
+            stats = dict(self.stats)
+            stats["memory_entries"] = len(self.memory)
+
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        return stats
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
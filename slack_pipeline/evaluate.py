@@ -0,0 +1,236 @@
+"""
+Retrieval quality and latency evaluation for the Slack RAG.
+
+A golden set of questions, each with the IDs of the Slack messages that answer
+it, is run through the configured retriever (as get_rag_service builds it) and
+through any alternative retriever configurations. Every configuration is
+reported with recall@k, MRR and nDCG@k next to its retrieval latency
+percentiles and index size, so a change to `k`, chunking, the embedding model
+or reranking comes with its quality cost. Each configuration gets an empty
+query embedding cache of its own: the questions are run once cold (every query
+embedded) and once warm (every query embedding cached), and both latencies are
+reported.
+
+    python evaluate.py golden.jsonl --configs retrievers.json --k 1 5 10 --output eval.json
+
+The golden set is JSONL (or a JSON list) of
+{"question": "...", "relevant_ids": ["C5KKAMQCW:1712345678.123456", ...]},
+optionally with a "channel" the question is restricted to. IDs are message IDs
+("<channel_id>:<ts>") or document IDs. The configurations file is a JSON list;
+every key but "name" is optional:
+
+    [
+        {"name": "baseline"},
+        {"name": "vector only", "lexical": false},
+        {"name": "rerank", "rerank_model": "cross-encoder/ms-marco-MiniLM-L-6-v2", "rerank_candidates": 30},
+        {"name": "local embeddings", "persist_directory": "./slack_vectordb_local", "embedding_backend": "local"}
+    ]
+"""
+import os
+import json
+import time
+import argparse
+import tempfile
+import numpy as np
+from benchmark import latency_summary
+from index_versions import directory_size
+from vectordb import make_rag_service, QUERY_CACHE_FILENAME
+from embedding_backends import make_embeddings
+from rerank import CrossEncoderReranker
+
+DEFAULT_K_VALUES = (1, 5, 10)
+
+# Evaluated with the settings the chat assistant retrieves with
+BASELINE_CONFIG = {"name": "baseline"}
+
+def load_golden_set(path):
+    """Read golden questions from a JSONL file or a JSON list."""
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+
+    if text.lstrip().startswith("["):
+        entries = json.loads(text)
+    else:
+        entries = [json.loads(line) for line in text.splitlines() if line.strip()]
+
+    for entry in entries:
+        if not entry.get("question") or not entry.get("relevant_ids"):
+            raise ValueError(f"Golden entry without a question or relevant_ids: {entry}")
+    return entries
+
+def covered_ids(doc):
+    """
+    IDs a retrieved document counts as: its own, the messages of its window,
+    the parent and replies of the thread it holds and the near-duplicates it stands for.
+    """
+    metadata = doc.metadata or {}
+    ids = {doc.id} if doc.id else set()
+    for key in ("message_ids", "reply_ids", "duplicate_ids"):
+        if metadata.get(key):
+            ids.update(metadata[key].split(","))
+    if metadata.get("type") == "thread" and metadata.get("channel_id") and metadata.get("thread_ts"):
+        ids.add(f"{metadata['channel_id']}:{metadata['thread_ts']}")
+    return ids
+
+def score_ranking(documents, relevant_ids, k_values=DEFAULT_K_VALUES):
+    """
+    Quality metrics of one ranked result list.
+
+    A document is relevant when it covers a relevant ID that no better ranked
+    document covered, so a message returned twice (in a window and in its
+    thread) is only counted once. nDCG@k is binary: its DCG is normalized by
+    the ideal ranking of min(k, |relevant|) relevant documents, and a perfect
+    ranking scores 1 whatever the number of relevant IDs. How much of the
+    answer a window holds is measured by recall@k instead.
+
+    Args:
+        documents (list): Retrieved Langchain documents, best first
+        relevant_ids (iterable): Message or document IDs that answer the question
+        k_values (iterable): Cut-offs to compute recall and nDCG at
+
+    Returns:
+        dict: "recall@k" and "ndcg@k" for every k, and "mrr"
+    """
+    relevant = set(relevant_ids)
+    found = set()
+    gains = []
+
+    for doc in documents:
+        new = (covered_ids(doc) & relevant) - found
+        found |= new
+        gains.append((1 if new else 0, len(found)))
+
+    scores = {"mrr": 0.0}
+    for rank, (gain, _) in enumerate(gains, start=1):
+        if gain:
+            scores["mrr"] = 1.0 / rank
+            break
+
+    for k in k_values:
+        top = gains[:k]
+        scores[f"recall@{k}"] = (top[-1][1] if top else 0) / len(relevant)
+        dcg = sum(gain / np.log2(rank + 1) for rank, (gain, _) in enumerate(top, start=1))
+        ideal = sum(1.0 / np.log2(rank + 1) for rank in range(1, min(k, len(relevant)) + 1))
+        scores[f"ndcg@{k}"] = float(dcg / ideal)
+
+    return scores
+
+def build_service(config, query_cache_file):
+    """
+    A SlackRAGService for a retriever configuration, with its own query embedding cache.
+
+    Every key left out of the configuration keeps the environment setting, so
+    the baseline retrieves exactly as get_rag_service does.
+    """
+    overrides = {"query_cache_file": query_cache_file}
+    if config.get("rerank_model"):
+        overrides["reranker"] = CrossEncoderReranker(config["rerank_model"])
+    if config.get("rerank_candidates"):
+        overrides["rerank_candidates"] = config["rerank_candidates"]
+    if config.get("embedding_backend"):
+        overrides["embeddings"] = make_embeddings(config["embedding_backend"])
+
+    persist_directory = config.get("persist_directory", "./slack_vectordb")
+    service = make_rag_service(os.path.realpath(persist_directory), **overrides)
+    if not config.get("lexical", True):
+        service.retriever.lexical_index = None
+    if config.get("fetch_k"):
+        service.retriever.fetch_k = config["fetch_k"]
+    return service
+
+def evaluate_config(config, golden, k_values=DEFAULT_K_VALUES):
+    """
+    Run every golden question through one configuration, cold and then warm.
+
+    The service is built before the clock starts and starts with an empty
+    query embedding cache, so the cold pass embeds every question and the
+    warm pass finds them all cached. Quality is scored on the cold pass.
+
+    Returns:
+        dict: Mean quality metrics, cold and warm retrieval latency summaries and index size
+    """
+    persist_directory = config.get("persist_directory", "./slack_vectordb")
+    depth = max(k_values)
+    latencies = {"cold": [], "warm": []}
+    per_question = []
+
+    with tempfile.TemporaryDirectory(prefix="slack-eval-") as cache_dir:
+        service = build_service(config, os.path.join(cache_dir, QUERY_CACHE_FILENAME))
+        try:
+            for run in ("cold", "warm"):
+                for entry in golden:
+                    started = time.perf_counter()
+                    documents = service.query(entry["question"], k=depth, channel=entry.get("channel"))
+                    latencies[run].append(time.perf_counter() - started)
+                    if run == "cold":
+                        per_question.append(score_ranking(documents, entry["relevant_ids"], k_values))
+        finally:
+            service.close()
+
+    metric_names = ["mrr"] + [f"{name}@{k}" for name in ("recall", "ndcg") for k in k_values]
+    return {
+        "name": config["name"],
+        "config": config,
+        "questions": len(golden),
+        "quality": {name: float(np.mean([scores[name] for scores in per_question])) for name in metric_names},
+        "latency": latency_summary(latencies["cold"]),
+        "warm_latency": latency_summary(latencies["warm"]),
+        "index_bytes": directory_size(os.path.realpath(persist_directory))
+    }
+
+def print_report(results, k_values=DEFAULT_K_VALUES):
+    """Print one line per configuration; p50, p95 and p99 are the cold latencies."""
+    columns = [f"recall@{k}" for k in k_values] + ["mrr"] + [f"ndcg@{k}" for k in k_values]
+    print("\n" + f"{'configuration':<24}" + "".join(f"{name:>11}" for name in columns)
+          + f"{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'warm p50':>10}{'warm p95':>10}{'index MB':>10}")
+
+    for result in results:
+        print(
+            f"{result['name'][:23]:<24}"
+            + "".join(f"{result['quality'][name]:>11.3f}" for name in columns)
+            + f"{result['latency']['p50_ms']:>9.1f}{result['latency']['p95_ms']:>9.1f}"
+            + f"{result['latency']['p99_ms']:>9.1f}"
+            + f"{result['warm_latency']['p50_ms']:>10.1f}{result['warm_latency']['p95_ms']:>10.1f}"
+            + f"{result['index_bytes'] / 1e6:>10.1f}"
+        )
+
+def run_evaluation(golden, configs=None, k_values=DEFAULT_K_VALUES):
+    """
+    Evaluate the baseline and every alternative configuration on a golden set.
+
+    Args:
+        golden (list): Golden entries from load_golden_set
+        configs (list, optional): Retriever configurations, the baseline alone if omitted
+        k_values (iterable): Cut-offs to compute recall and nDCG at
+
+    Returns:
+        list: One result per configuration
+    """
+    results = []
+    for config in configs or [BASELINE_CONFIG]:
+        print(f"Evaluating {config['name']} on {len(golden)} questions...")
+        results.append(evaluate_config(config, golden, k_values))
+
+    print_report(results, k_values)
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Retrieval quality and latency evaluation")
+    parser.add_argument("golden", help="golden questions with their relevant message IDs (JSONL or JSON)")
+    parser.add_argument("--configs", help="JSON list of retriever configurations, the baseline if omitted")
+    parser.add_argument("--k", type=int, nargs="+", default=list(DEFAULT_K_VALUES),
+                        help="cut-offs for recall@k and nDCG@k")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    configs = None
+    if args.configs:
+        with open(args.configs, "r", encoding="utf-8") as f:
+            configs = json.load(f)
+
+    results = run_evaluation(load_golden_set(args.golden), configs, sorted(args.k))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
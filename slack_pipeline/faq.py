@@ -0,0 +1,245 @@
+import os
+import re
+import sqlite3
+import numpy as np
+from langchain.schema import Document
+from embedding_cache import normalize_query
+from embedding_backends import embedding_model_name
+from ingest import make_document_id
+
+# Cosine similarity above which a nearest-neighbour FAQ entry answers the question
+DEFAULT_FAQ_THRESHOLD = 0.92
+
+# Replies by the asker that mark the previous answer as the one that worked
+ACKNOWLEDGEMENT_PATTERN = re.compile(
+    r"\b(thanks|thank you|thx|ty|worked|works now|working now|solved|fixed|resolved|that did it|perfect)\b"
+    r"|:\+1:|:white_check_mark:|:heavy_check_mark:|:pray:|:tada:",
+    re.IGNORECASE
+)
+
+QUESTION_PATTERN = re.compile(
+    r"\?|^\s*(how|what|why|when|where|which|who|is|are|can|could|does|do|did|should|has|have|anyone|anybody)\b",
+    re.IGNORECASE
+)
+
+def normalize_question(text):
+    """Normalize a question for exact matching: case, whitespace, mentions and punctuation."""
+    text = re.sub(r"<[^>]+>", " ", text)
+    text = re.sub(r"[^\w\s]", " ", text)
+    return normalize_query(text)
+
+def resolved_answer(thread):
+    """
+    Return the replies that resolved a thread's question, or None.
+
+    An answer counts as resolving when the asker acknowledges it in the next
+    reply ("thanks, that worked"). Consecutive replies of the same helper are
+    kept together.
+    """
+    asker = thread["parent"]["user"]
+    block = []
+
+    for reply in thread["replies"]:
+        if reply["user"] != asker:
+            if block and block[-1]["user"] != reply["user"]:
+                block = []
+            block.append(reply)
+        elif block and ACKNOWLEDGEMENT_PATTERN.search(reply["text"]):
+            return block
+        else:
+            block = []
+
+    return None
+
+def mine_faq_entries(threads, users=None):
+    """
+    Extract question/answer pairs from thread records.
+
+    A thread becomes an entry when its parent reads like a question and one of
+    the replies was acknowledged by the asker. When the same question was asked
+    several times, the most recent thread wins.
+
+    Args:
+        threads (iterable): Thread records as produced by fetch_threads
+        users (UserDirectory, optional): Directory used to write mentions as display names
+
+    Returns:
+        list: Entries with question, answer, channel_id, channel, thread_ts and document_id
+    """
+    entries = {}
+
+    for thread in threads:
+        question = thread["parent"]["text"].strip()
+        if not question or not QUESTION_PATTERN.search(question):
+            continue
+
+        answer = resolved_answer(thread)
+        if answer is None:
+            continue
+
+        answer_text = "\n".join(reply["text"] for reply in answer)
+        if users is not None:
+            question, answer_text = users.rewrite_mentions(question), users.rewrite_mentions(answer_text)
+
+        key = normalize_question(question)
+        if key in entries and float(entries[key]["thread_ts"]) >= float(thread["thread_ts"]):
+            continue
+
+        entries[key] = {
+            "question": question,
+            "answer": answer_text,
+            "channel_id": thread["channel_id"],
+            "channel": thread.get("channel_name", thread["channel_id"]),
+            "thread_ts": thread["thread_ts"],
+            "document_id": make_document_id(thread["channel_id"], thread["thread_ts"]) + ":thread"
+        }
+
+    return list(entries.values())
+
+def build_faq_index(entries, embeddings, index_file, batch_size=200):
+    """
+    Write a FAQ index file, replacing any previous one atomically.
+
+    Args:
+        entries (list): Entries from mine_faq_entries
+        embeddings (Embeddings): Model used to embed the questions, the same as the vector database's
+        index_file (str): SQLite file to write
+
+    Returns:
+        int: Number of entries written
+    """
+    index_dir = os.path.dirname(index_file)
+    if index_dir:
+        os.makedirs(index_dir, exist_ok=True)
+
+    tmp_file = f"{index_file}.tmp"
+    if os.path.exists(tmp_file):
+        os.remove(tmp_file)
+
+    db = sqlite3.connect(tmp_file)
+    db.executescript(
+        """
+        CREATE TABLE faq (
+            id INTEGER PRIMARY KEY,
+            normalized_question TEXT NOT NULL UNIQUE,
+            question TEXT NOT NULL,
+            answer TEXT NOT NULL,
+            channel_id TEXT,
+            channel TEXT,
+            thread_ts TEXT,
+            document_id TEXT,
+            embedding BLOB NOT NULL
+        );
+        CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+        """
+    )
+    db.execute("INSERT INTO meta VALUES ('embedding_model', ?)", (embedding_model_name(embeddings),))
+
+    for start in range(0, len(entries), batch_size):
+        batch = entries[start:start + batch_size]
+        vectors = embeddings.embed_documents([entry["question"] for entry in batch])
+        db.executemany(
+            "INSERT INTO faq (normalized_question, question, answer, channel_id, channel, thread_ts, document_id, "
+            "embedding) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [
+                (normalize_question(entry["question"]), entry["question"], entry["answer"], entry["channel_id"],
+                 entry["channel"], entry["thread_ts"], entry["document_id"],
+                 np.asarray(vector, dtype=np.float32).tobytes())
+                for entry, vector in zip(batch, vectors)
+            ]
+        )
+
+    db.commit()
+    db.close()
+    os.replace(tmp_file, index_file)
+    return len(entries)
+
+class FAQIndex:
+    """
+    In-memory FAQ lookup answering frequent questions without retrieval or an LLM call.
+
+    The whole index is loaded at start-up: a dictionary of normalized questions
+    for exact matches and one normalized embedding matrix for nearest-neighbour
+    matches. A few hundred entries take well under a millisecond to search.
+    """
+
+    def __init__(self, index_file, threshold=DEFAULT_FAQ_THRESHOLD, model_name=None):
+        """
+        Args:
+            index_file (str): SQLite file written by build_faq_index
+            threshold (float): Minimum cosine similarity of a nearest-neighbour match
+            model_name (str, optional): Embedding model of the caller; nearest-neighbour
+                matching is disabled if the index was built with another one
+        """
+        self.threshold = threshold
+        self.stats = {"exact_hits": 0, "semantic_hits": 0, "misses": 0}
+
+        db = sqlite3.connect(index_file)
+        rows = db.execute(
+            "SELECT normalized_question, question, answer, channel_id, channel, thread_ts, document_id, embedding "
+            "FROM faq ORDER BY id"
+        ).fetchall()
+        built_with = dict(db.execute("SELECT key, value FROM meta").fetchall()).get("embedding_model")
+        db.close()
+
+        self.entries = [
+            {
+                "question": row[1],
+                "answer": row[2],
+                "channel_id": row[3],
+                "channel": row[4],
+                "thread_ts": row[5],
+                "document_id": row[6]
+            }
+            for row in rows
+        ]
+        self.exact = {row[0]: index for index, row in enumerate(rows)}
+
+        self.matrix = None
+        if rows and (model_name is None or model_name == built_with):
+            self.matrix = np.stack([np.frombuffer(row[7], dtype=np.float32) for row in rows])
+            self.matrix /= np.linalg.norm(self.matrix, axis=1, keepdims=True)
+        elif rows:
+            print(f"FAQ index was built with {built_with}, not {model_name}; only exact matches are used.")
+
+    def lookup_exact(self, query):
+        """Return the entry whose normalized question equals the query's, or None."""
+        index = self.exact.get(normalize_question(query))
+        if index is None:
+            return None
+        self.stats["exact_hits"] += 1
+        return dict(self.entries[index], score=1.0, match="exact")
+
+    def lookup_similar(self, embedding):
+        """Return the nearest entry if its similarity reaches the threshold, or None."""
+        if self.matrix is None:
+            self.stats["misses"] += 1
+            return None
+
+        query = np.asarray(embedding, dtype=np.float32)
+        similarities = self.matrix @ (query / np.linalg.norm(query))
+        best = int(np.argmax(similarities))
+
+        if similarities[best] < self.threshold:
+            self.stats["misses"] += 1
+            return None
+        self.stats["semantic_hits"] += 1
+        return dict(self.entries[best], score=float(similarities[best]), match="semantic")
+
+    @staticmethod
+    def to_document(entry):
+        """The thread an entry was mined from, as a source document."""
+        return Document(
+            id=entry["document_id"],
+            page_content=f"{entry['question']}\n{entry['answer']}",
+            metadata={
+                "channel": entry["channel"],
+                "channel_id": entry["channel_id"],
+                "timestamp": entry["thread_ts"],
+                "thread_ts": entry["thread_ts"],
+                "type": "faq"
+            }
+        )
+
+    def __len__(self):
+        return len(self.entries)
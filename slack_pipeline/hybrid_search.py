@@ -0,0 +1,123 @@
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Optional
+from langchain_core.retrievers import BaseRetriever
+
+# Damping constant from the original reciprocal rank fusion paper
+RRF_K = 60
+
+def to_epoch(value):
+    """Convert a datetime or a number of seconds since the epoch to a float timestamp."""
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.timestamp()
+    return float(value)
+
+def build_chroma_filter(channel=None, since=None, until=None):
+    """
+    Build the Chroma `where` filter restricting a search to a channel and a time range.
+
+    A window or thread matches when it overlaps the range: it ends at or after
+    `since` and starts at or before `until`. Documents stored before "end_ts"
+    existed are matched on their start time.
+
+    Args:
+        channel (str, optional): Channel ID (C05...) or name, with or without "#"
+        since (datetime or float, optional): Oldest message time to include
+        until (datetime or float, optional): Newest message time to include
+
+    Returns:
+        dict: The filter, or None when nothing is restricted
+    """
+    conditions = []
+    if channel:
+        name = channel.lstrip("#")
+        conditions.append({"$or": [{"channel_id": name}, {"channel": name}]})
+    if since is not None:
+        since = to_epoch(since)
+        conditions.append({"$or": [{"end_ts": {"$gte": since}}, {"ts": {"$gte": since}}]})
+    if until is not None:
+        conditions.append({"ts": {"$lte": to_epoch(until)}})
+
+    if not conditions:
+        return None
+    if len(conditions) == 1:
+        return conditions[0]
+    return {"$and": conditions}
+
+def reciprocal_rank_fusion(result_lists, k=RRF_K):
+    """
+    Merge ranked document lists with reciprocal rank fusion.
+
+    Each document scores sum(1 / (k + rank)) over the lists it appears in, so
+    documents found by both searches rise to the top without having to make
+    BM25 and cosine scores comparable.
+
+    Args:
+        result_lists (list): Lists of Langchain documents, best first
+        k (int): Damping constant
+
+    Returns:
+        list: The fused documents, best first
+    """
+    scores = {}
+    documents = {}
+
+    for results in result_lists:
+        for rank, doc in enumerate(results, start=1):
+            key = doc.id or doc.page_content
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+            documents.setdefault(key, doc)
+
+    return [documents[key] for key in sorted(scores, key=scores.get, reverse=True)]
+
+class HybridRetriever(BaseRetriever):
+    """
+    Retriever running a vector search and a BM25 search in parallel and fusing the results.
+
+    Without a lexical index it behaves like the plain Chroma retriever. With a
+    reranker, the `rerank_candidates` best fused documents are rescored and only
+    the top `k` are returned.
+    """
+
+    vectordb: Any
+    lexical_index: Optional[Any] = None
+    k: int = 5
+    fetch_k: int = 20
+    executor: Any = None
+    reranker: Optional[Any] = None
+    rerank_candidates: int = 30
+
+    def search(self, query, k=None, channel=None, since=None, until=None):
+        """
+        Return the `k` best documents for the query.
+
+        The channel and time range are applied inside both searches, before
+        ranking, so they shrink the candidate set rather than the results.
+        """
+        k = k or self.k
+        candidates = max(k, self.rerank_candidates) if self.reranker is not None else k
+        where = build_chroma_filter(channel, since, until)
+
+        if self.lexical_index is None:
+            documents = self.vectordb.similarity_search(query, k=candidates, filter=where)
+        else:
+            fetch_k = max(candidates, self.fetch_k)
+            vector_future = self.executor.submit(self.vectordb.similarity_search, query, k=fetch_k, filter=where)
+            lexical_future = self.executor.submit(
+                self.lexical_index.search, query, k=fetch_k,
+                channel=channel and channel.lstrip("#"), since=to_epoch(since), until=to_epoch(until)
+            )
+            documents = reciprocal_rank_fusion([vector_future.result(), lexical_future.result()])[:candidates]
+
+        if self.reranker is None:
+            return documents
+        return self.reranker.rerank(query, documents, k)
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        return self.search(query)
+
+def make_search_executor():
+    """Thread pool shared by the two searches of every query."""
+    return ThreadPoolExecutor(max_workers=4, thread_name_prefix="hybrid-search")
@@ -0,0 +1,284 @@
+import os
+import re
+import time
+import fcntl
+import shutil
+import sqlite3
+from contextlib import contextmanager
+from langchain_chroma import Chroma
+from vectordb import open_lexical_index, open_duplicate_index, NEAR_DUPLICATE_INDEX_FILENAME
+from threads import thread_last_activity
+
+# Versions kept on disk: the live one and the previous one, which readers that
+# have not noticed a swap yet may still be using
+DEFAULT_KEEP_VERSIONS = 2
+
+# Sibling directories of the pointer: ./slack_vectordb.20250101-120000, then -1, -2... within a second
+VERSION_PATTERN = re.compile(r"\.(\d{8}-\d{6})(?:-(\d+))?$")
+
+def directory_size(path):
+    """Total size in bytes of the files below a directory."""
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, names in os.walk(path)
+        for name in names
+    )
+
+@contextmanager
+def writer_lock(persist_directory, blocking=True):
+    """
+    Hold the lock that serializes the processes writing to a database.
+
+    Syncs, rebuilds, compaction and the realtime ingestor all write under it,
+    so a compaction never copies a version while another process is still
+    adding to it, and nothing is written to a version about to be replaced.
+    The lock file sits next to the pointer, so it survives version swaps, and
+    the lock is released by the kernel if its holder dies.
+
+    Args:
+        persist_directory (str): The pointer readers open
+        blocking (bool): Wait for another writer to finish instead of giving up
+
+    Yields:
+        bool: True when the lock is held, False if `blocking` is off and another writer has it
+    """
+    lock_file = f"{os.path.abspath(persist_directory).rstrip(os.sep)}.lock"
+    with open(lock_file, "a") as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            if not blocking:
+                yield False
+                return
+            print(f"Waiting for another process writing to {persist_directory}...")
+            fcntl.flock(f, fcntl.LOCK_EX)
+
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def live_version(persist_directory):
+    """Directory the pointer currently resolves to, None if there is no database yet."""
+    if not os.path.exists(persist_directory):
+        return None
+    return os.path.realpath(persist_directory)
+
+def version_directories(persist_directory):
+    """Every version directory of a database, oldest first."""
+    base = os.path.abspath(persist_directory)
+    parent, name = os.path.dirname(base), os.path.basename(base)
+    if not os.path.isdir(parent):
+        return []
+
+    versions = []
+    for entry in os.listdir(parent):
+        match = entry.startswith(name) and VERSION_PATTERN.fullmatch(entry[len(name):])
+        if match and os.path.isdir(os.path.join(parent, entry)):
+            versions.append(((match.group(1), int(match.group(2) or 0)), os.path.join(parent, entry)))
+    return [path for _, path in sorted(versions)]
+
+def version_path(persist_directory):
+    """A new, unused version directory name next to the pointer."""
+    base = f"{os.path.abspath(persist_directory)}.{time.strftime('%Y%m%d-%H%M%S')}"
+    path, attempt = base, 1
+    while os.path.exists(path):
+        path, attempt = f"{base}-{attempt}", attempt + 1
+    return path
+
+def copy_file(source, target):
+    """Copy a file, through the SQLite backup API for databases so that WAL content is included."""
+    if source.endswith(".sqlite3"):
+        source_db, target_db = sqlite3.connect(source), sqlite3.connect(target)
+        source_db.backup(target_db)
+        target_db.close()
+        source_db.close()
+    else:
+        shutil.copy2(source, target)
+
+def newer_versions(persist_directory):
+    """Versions created after the live one: builds that were never activated."""
+    versions = version_directories(persist_directory)
+    live = live_version(persist_directory)
+    if live not in versions:
+        return versions if live is None else []
+    return versions[versions.index(live) + 1:]
+
+def adopt_plain_directory(persist_directory):
+    """Turn a database that is still a plain directory into the first version behind a pointer."""
+    persist_directory = persist_directory.rstrip(os.sep)
+    if os.path.isdir(persist_directory) and not os.path.islink(persist_directory):
+        version_dir = version_path(persist_directory)
+        os.rename(persist_directory, version_dir)
+        os.symlink(os.path.basename(version_dir), persist_directory)
+        print(f"Moved the existing database to {version_dir}")
+
+def new_version_directory(persist_directory, carry_over=(), resume=False):
+    """
+    Create the directory a new version of the database is built in.
+
+    Args:
+        persist_directory (str): The pointer readers open, e.g. ./slack_vectordb
+        carry_over (iterable): File names copied from the live version (sync state, caches...)
+        resume (bool): Reuse a version left unfinished by an interrupted build, so that its
+            ingestion checkpoint is picked up
+
+    Returns:
+        str: The version directory
+    """
+    adopt_plain_directory(persist_directory)
+    live = live_version(persist_directory)
+
+    if resume:
+        pending = newer_versions(persist_directory)
+        if pending:
+            print(f"Resuming the unfinished build in {pending[-1]}")
+            return pending[-1]
+
+    path = version_path(persist_directory)
+    os.makedirs(path)
+    for name in carry_over:
+        if live and os.path.exists(os.path.join(live, name)):
+            copy_file(os.path.join(live, name), os.path.join(path, name))
+    return path
+
+def activate_version(persist_directory, version_dir, keep=DEFAULT_KEEP_VERSIONS):
+    """
+    Atomically point the database at a finished version.
+
+    The pointer is a symlink replaced with a single rename, so a reader opening
+    the database sees either the old or the new version, never a half-built one.
+    Older versions beyond `keep` are deleted; the previous one is kept for
+    readers that are still using it.
+
+    Args:
+        persist_directory (str): The pointer readers open
+        version_dir (str): Directory holding the new version
+        keep (int): Number of versions kept on disk, the live one included
+    """
+    persist_directory = persist_directory.rstrip(os.sep)
+    adopt_plain_directory(persist_directory)
+
+    # Relative target, so the whole tree can be moved or mounted elsewhere
+    tmp_link = f"{persist_directory}.swap"
+    if os.path.lexists(tmp_link):
+        os.remove(tmp_link)
+    os.symlink(os.path.basename(version_dir), tmp_link)
+    os.replace(tmp_link, persist_directory)
+    print(f"{persist_directory} now points to {os.path.basename(version_dir)}")
+
+    remove_old_versions(persist_directory, keep)
+
+def remove_old_versions(persist_directory, keep=DEFAULT_KEEP_VERSIONS):
+    """Delete the oldest versions beyond `keep`, never the live one or an unfinished newer build."""
+    pending = newer_versions(persist_directory)
+    versions = [path for path in version_directories(persist_directory) if path not in pending]
+
+    for path in versions[:max(len(versions) - keep, 0)]:
+        shutil.rmtree(path, ignore_errors=True)
+        print(f"Removed old version {os.path.basename(path)}")
+
+def retention_cutoff(retention_days):
+    """Epoch time before which documents are pruned, None to keep everything."""
+    if not retention_days:
+        return None
+    return time.time() - retention_days * 24 * 60 * 60
+
+def last_activity(metadata):
+    """Time of the newest message in a document: its window end or latest thread reply, or its own timestamp."""
+    if metadata.get("type") == "thread" and not metadata.get("end_timestamp"):
+        # Written before threads recorded their latest reply: activity unknown, so never pruned
+        return None
+    times = [metadata.get("ts"), metadata.get("end_timestamp")]
+    times = [float(value) for value in times if value not in (None, "", "unknown")]
+    return max(times) if times else None
+
+def retained_records(records, retention_days=None):
+    """Yield the message and thread records whose last activity is within the retention period."""
+    cutoff = retention_cutoff(retention_days)
+    for record in records:
+        last = thread_last_activity(record) if record.get("type") == "thread" else record.get("ts")
+        if cutoff is None or not last or float(last) >= cutoff:
+            yield record
+
+def compact_vector_database(persist_directory="./slack_vectordb", retention_days=None, carry_over=(),
+                            batch_size=1000, keep=DEFAULT_KEEP_VERSIONS):
+    """
+    Copy the live vectors into a fresh version, dropping expired documents, and swap to it.
+
+    Chroma never gives back the space of deleted or overwritten vectors, so the
+    store only grows. Compaction writes the surviving documents with their
+    stored embeddings into a new version (nothing is embedded again), rebuilds
+    the keyword index from them and swaps the pointer once the copy is complete.
+    Readers keep answering from the old version until then; writers wait on
+    the writer lock, so nothing written meanwhile is left behind in the old one.
+
+    Args:
+        persist_directory (str): The pointer readers open
+        retention_days (int, optional): Drop documents whose newest message is older than this
+        carry_over (iterable): File names copied from the live version
+        batch_size (int): Documents copied per request
+        keep (int): Number of versions kept on disk
+
+    Returns:
+        dict: Numbers of kept and pruned documents and the sizes before and after
+    """
+    if not os.path.exists(persist_directory):
+        raise FileNotFoundError(f"No vector database at {persist_directory}")
+
+    with writer_lock(persist_directory):
+        version_dir = new_version_directory(persist_directory, list(carry_over) + [NEAR_DUPLICATE_INDEX_FILENAME])
+        source_dir = live_version(persist_directory)
+        cutoff = retention_cutoff(retention_days)
+        source = Chroma(persist_directory=source_dir)._collection
+        stats = {"kept": 0, "pruned": 0, "bytes_before": directory_size(source_dir)}
+
+        try:
+            target = Chroma(persist_directory=version_dir)
+            # The embedding model stamp comes along; HNSW settings cannot be modified
+            metadata = {
+                key: value for key, value in (source.metadata or {}).items() if not key.startswith("hnsw:")
+            }
+            if metadata:
+                target._collection.modify(metadata=metadata)
+
+            pruned = []
+            offset = 0
+            while True:
+                batch = source.get(include=["embeddings", "documents", "metadatas"],
+                                   limit=batch_size, offset=offset)
+                if not batch["ids"]:
+                    break
+                offset += len(batch["ids"])
+
+                keep_rows = []
+                for i, (doc_id, doc_metadata) in enumerate(zip(batch["ids"], batch["metadatas"])):
+                    last = last_activity(doc_metadata or {})
+                    if cutoff is not None and last is not None and last < cutoff:
+                        pruned.append(doc_id)
+                    else:
+                        keep_rows.append(i)
+
+                if keep_rows:
+                    target._collection.add(
+                        ids=[batch["ids"][i] for i in keep_rows],
+                        embeddings=[batch["embeddings"][i] for i in keep_rows],
+                        documents=[batch["documents"][i] for i in keep_rows],
+                        metadatas=[batch["metadatas"][i] for i in keep_rows]
+                    )
+                stats["kept"] += len(keep_rows)
+
+            stats["pruned"] = len(pruned)
+            duplicate_index = open_duplicate_index(version_dir)
+            duplicate_index.remove(pruned)
+            duplicate_index.close()
+            open_lexical_index(version_dir, target).close()
+        except BaseException:
+            shutil.rmtree(version_dir, ignore_errors=True)
+            raise
+
+        stats["bytes_after"] = directory_size(version_dir)
+        activate_version(persist_directory, version_dir, keep)
+        print(f"Compacted {persist_directory}: {stats['kept']} documents kept, {stats['pruned']} pruned, "
+              f"{stats['bytes_before'] / 1e6:.1f} MB -> {stats['bytes_after'] / 1e6:.1f} MB.")
+    return stats
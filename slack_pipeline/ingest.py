@@ -0,0 +1,201 @@
+import os
+import json
+import time
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from itertools import islice
+from tokenizer import count_tokens
+from metrics import metrics
+
+def batched(iterable, batch_size):
+    """Yield lists of up to `batch_size` items from any iterable."""
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
+
+def make_document_id(channel_id, ts):
+    """Deterministic ID of the document for one Slack message."""
+    return f"{channel_id}:{ts}"
+
+def content_hash(text):
+    """Hash of a document's text, stored in its metadata to detect edits."""
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+def prepare_batch(batch):
+    """
+    Give every document of a batch its ID, content hash and numeric start and end timestamps.
+
+    Documents without an explicit ID are keyed by channel and timestamp, or by
+    their content when neither is known, so the same message always maps to
+    the same vector.
+    """
+    for doc in batch:
+        metadata = doc["metadata"]
+        metadata["content_hash"] = content_hash(doc["content"])
+        # Numeric copy of the Slack timestamp, so time ranges can be filtered in the store
+        if metadata.get("timestamp") and "ts" not in metadata:
+            metadata["ts"] = float(metadata["timestamp"])
+        # Numeric time of the last message of a window or thread (recomputed, as windows grow), so a
+        # time range matches every conversation it overlaps rather than only those that start in it
+        if metadata.get("end_timestamp"):
+            metadata["end_ts"] = float(metadata["end_timestamp"])
+        elif "ts" in metadata:
+            metadata["end_ts"] = metadata["ts"]
+        if not doc.get("id"):
+            if metadata.get("channel_id") and metadata.get("timestamp"):
+                doc["id"] = make_document_id(metadata["channel_id"], metadata["timestamp"])
+            else:
+                doc["id"] = metadata["content_hash"]
+    return batch
+
+def filter_unchanged(vectordb, batch):
+    """Drop the documents already stored with the same content hash."""
+    # A batch can mention the same message twice (e.g. re-appended raw records); keep the last one
+    batch = list({doc["id"]: doc for doc in batch}.values())
+    existing = vectordb._collection.get(ids=[doc["id"] for doc in batch], include=["metadatas"])
+    stored_hashes = {
+        doc_id: (metadata or {}).get("content_hash")
+        for doc_id, metadata in zip(existing["ids"], existing["metadatas"])
+    }
+    return [doc for doc in batch if stored_hashes.get(doc["id"]) != doc["metadata"]["content_hash"]]
+
+def batch_fingerprint(batch):
+    """Identify a batch by the content of its documents."""
+    digest = hashlib.sha1()
+    for doc in batch:
+        digest.update(doc["content"].encode("utf-8"))
+        digest.update(json.dumps(doc["metadata"], sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()
+
+def load_checkpoint(checkpoint_file):
+    """Return {batch_number: fingerprint} for the batches committed by a previous run."""
+    committed = {}
+    if checkpoint_file and os.path.exists(checkpoint_file):
+        with open(checkpoint_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    committed[entry["batch"]] = entry["fingerprint"]
+    return committed
+
+def embed_with_retries(embeddings, texts, max_retries=5):
+    """Embed a batch, retrying transient API errors with exponential backoff."""
+    for attempt in range(max_retries + 1):
+        try:
+            return embeddings.embed_documents(texts)
+        except Exception as e:
+            if attempt == max_retries:
+                raise
+            wait_time = min(60, 2 ** attempt)
+            print(f"Embedding failed ({e}). Retrying in {wait_time} seconds...")
+            time.sleep(wait_time)
+
+def ingest_documents(documents, vectordb, batch_size=200, max_workers=4, checkpoint_file=None, max_retries=5,
+                     lexical_index=None):
+    """
+    Embed and store documents in batches, in parallel and resumably.
+
+    Every document gets a deterministic ID and a content hash; documents that
+    are already stored with the same hash are not embedded again, so re-running
+    an ingestion is cheap and never duplicates vectors.
+
+    Batches are embedded by `max_workers` threads, while the main thread writes
+    the finished batches to Chroma and appends each one to the checkpoint file.
+    A run that crashes can simply be started again with the same documents in
+    the same order (e.g. from the raw JSONL file): batches already in the
+    checkpoint are skipped. The checkpoint is removed once every batch is in.
+
+    Args:
+        documents (iterable): Processed documents ({"content", "metadata"}, optional "id")
+        vectordb (Chroma): The vector store to write to
+        batch_size (int): Number of documents embedded per request
+        max_workers (int): Number of batches embedded concurrently
+        checkpoint_file (str, optional): JSONL file recording the committed batches
+        max_retries (int): Retries for a failing batch before the run is aborted
+        lexical_index (LexicalIndex, optional): BM25 index kept in step with the vectors
+
+    Returns:
+        dict: Ingestion statistics (documents, unchanged, tokens, batches, skipped_batches, seconds)
+    """
+    committed = load_checkpoint(checkpoint_file)
+    embeddings = vectordb.embeddings
+    stats = {"documents": 0, "unchanged": 0, "tokens": 0, "batches": 0, "skipped_batches": 0, "seconds": 0.0}
+    started = time.monotonic()
+
+    def embed_batch(batch):
+        texts = [doc["content"] for doc in batch]
+        tokens = sum(count_tokens(text) for text in texts)
+        size = sum(len(text.encode("utf-8")) for text in texts)
+        with metrics.timer("embed", items=len(texts), bytes=size, input_tokens=tokens):
+            vectors = embed_with_retries(embeddings, texts, max_retries)
+        return vectors, tokens
+
+    def commit(number, fingerprint, batch, vectors, tokens):
+        size = sum(len(doc["content"].encode("utf-8")) for doc in batch)
+        with metrics.timer("upsert", items=len(batch), bytes=size):
+            vectordb._collection.upsert(
+                ids=[doc["id"] for doc in batch],
+                embeddings=vectors,
+                metadatas=[doc["metadata"] for doc in batch],
+                documents=[doc["content"] for doc in batch]
+            )
+            if lexical_index is not None:
+                lexical_index.upsert(batch)
+        if checkpoint_file:
+            with open(checkpoint_file, 'a', encoding='utf-8') as f:
+                f.write(json.dumps({"batch": number, "fingerprint": fingerprint}) + "\n")
+
+        elapsed = time.monotonic() - started
+        stats["documents"] += len(batch)
+        stats["tokens"] += tokens
+        stats["batches"] += 1
+        print(
+            f"Committed batch {number}: {stats['documents']} documents, "
+            f"{stats['documents'] / elapsed:.1f} docs/s, {stats['tokens'] / elapsed:.0f} tokens/s"
+        )
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = {}
+
+        def drain():
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                number, fingerprint, batch = pending.pop(future)
+                commit(number, fingerprint, batch, *future.result())
+
+        for number, batch in enumerate(batched(documents, batch_size)):
+            batch = prepare_batch(batch)
+            fingerprint = batch_fingerprint(batch)
+            if committed.get(number) == fingerprint:
+                stats["skipped_batches"] += 1
+                continue
+
+            # Only new and edited messages are embedded again
+            changed = filter_unchanged(vectordb, batch)
+            stats["unchanged"] += len(batch) - len(changed)
+            if not changed:
+                continue
+            batch = changed
+
+            pending[executor.submit(embed_batch, batch)] = (number, fingerprint, batch)
+
+            # Keep only a bounded number of batches in memory
+            if len(pending) >= max_workers * 2:
+                drain()
+
+        while pending:
+            drain()
+
+    stats["seconds"] = time.monotonic() - started
+    if stats["skipped_batches"]:
+        print(f"Skipped {stats['skipped_batches']} batches committed by a previous run.")
+    if stats["unchanged"]:
+        print(f"Skipped {stats['unchanged']} documents whose content has not changed.")
+
+    if checkpoint_file and os.path.exists(checkpoint_file):
+        os.remove(checkpoint_file)
+
+    return stats
@@ -0,0 +1,217 @@
+import os
+import re
+import json
+import sqlite3
+import threading
+from langchain.schema import Document
+
+# Keep Jira keys (FINERACT-1234) and snake_case identifiers as single tokens
+FTS_TOKENIZER = "unicode61 tokenchars '-_'"
+
+QUERY_TERM_PATTERN = re.compile(r"[\w][\w\-\.]*[\w]|[\w]")
+
+class LexicalIndex:
+    """
+    In-process BM25 index over the documents of the vector database.
+
+    Backed by an SQLite FTS5 table, so it is persisted next to the Chroma
+    collection, updated document by document during ingestion and answers
+    keyword queries in milliseconds over millions of rows without a server.
+    """
+
+    def __init__(self, index_file):
+        """
+        Args:
+            index_file (str): SQLite file holding the index
+        """
+        index_dir = os.path.dirname(index_file)
+        if index_dir:
+            os.makedirs(index_dir, exist_ok=True)
+
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(index_file, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        backfill = not self.db.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'message_documents'"
+        ).fetchone()
+        self.db.executescript(
+            f"""
+            CREATE TABLE IF NOT EXISTS documents (
+                rowid INTEGER PRIMARY KEY,
+                doc_id TEXT NOT NULL UNIQUE,
+                channel_id TEXT,
+                ts REAL,
+                end_ts REAL,
+                content TEXT NOT NULL,
+                metadata TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS documents_channel_ts ON documents (channel_id, ts);
+            CREATE TABLE IF NOT EXISTS message_documents (
+                message_id TEXT NOT NULL,
+                doc_id TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS message_documents_message ON message_documents (message_id);
+            CREATE INDEX IF NOT EXISTS message_documents_doc ON message_documents (doc_id);
+            CREATE VIRTUAL TABLE IF NOT EXISTS documents_fts USING fts5(
+                content, content='documents', content_rowid='rowid', tokenize="{FTS_TOKENIZER}"
+            );
+            CREATE TRIGGER IF NOT EXISTS documents_ai AFTER INSERT ON documents BEGIN
+                INSERT INTO documents_fts (rowid, content) VALUES (new.rowid, new.content);
+            END;
+            CREATE TRIGGER IF NOT EXISTS documents_ad AFTER DELETE ON documents BEGIN
+                INSERT INTO documents_fts (documents_fts, rowid, content) VALUES ('delete', old.rowid, old.content);
+            END;
+            CREATE TRIGGER IF NOT EXISTS documents_au AFTER UPDATE ON documents BEGIN
+                INSERT INTO documents_fts (documents_fts, rowid, content) VALUES ('delete', old.rowid, old.content);
+                INSERT INTO documents_fts (rowid, content) VALUES (new.rowid, new.content);
+            END;
+            """
+        )
+        columns = {row[1] for row in self.db.execute("PRAGMA table_info(documents)")}
+        if "end_ts" not in columns:
+            # Indexes written before conversations were filtered by their end time
+            self.db.execute("ALTER TABLE documents ADD COLUMN end_ts REAL")
+            self.db.execute(
+                "UPDATE documents SET end_ts = COALESCE(CAST(json_extract(metadata, '$.end_timestamp') AS REAL), ts)"
+            )
+        if backfill:
+            # Indexes written before the side table existed
+            rows = self.db.execute(
+                "SELECT doc_id, json_extract(metadata, '$.message_ids') FROM documents "
+                "WHERE json_extract(metadata, '$.message_ids') IS NOT NULL"
+            ).fetchall()
+            self.db.executemany(
+                "INSERT INTO message_documents (message_id, doc_id) VALUES (?, ?)",
+                [(message_id, doc_id) for doc_id, message_ids in rows for message_id in message_ids.split(",")]
+            )
+        self.db.commit()
+
+    def upsert(self, documents):
+        """
+        Add or replace documents in the index.
+
+        Args:
+            documents (list): Processed documents with "id", "content" and "metadata"
+        """
+        rows = []
+        message_rows = []
+        for doc in documents:
+            metadata = doc["metadata"]
+            rows.append((
+                doc["id"],
+                metadata.get("channel_id"),
+                metadata.get("ts"),
+                metadata.get("end_ts", metadata.get("ts")),
+                doc["content"],
+                json.dumps(metadata)
+            ))
+            if metadata.get("message_ids"):
+                message_rows.extend((message_id, doc["id"]) for message_id in metadata["message_ids"].split(","))
+
+        with self.lock:
+            self.db.executemany(
+                "INSERT INTO documents (doc_id, channel_id, ts, end_ts, content, metadata) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (doc_id) DO UPDATE SET channel_id = excluded.channel_id, ts = excluded.ts, "
+                "end_ts = excluded.end_ts, content = excluded.content, metadata = excluded.metadata",
+                rows
+            )
+            self.db.executemany("DELETE FROM message_documents WHERE doc_id = ?", [(row[0],) for row in rows])
+            self.db.executemany("INSERT INTO message_documents (message_id, doc_id) VALUES (?, ?)", message_rows)
+            self.db.commit()
+
+    def delete(self, doc_ids):
+        """Remove documents from the index."""
+        doc_ids = [(doc_id,) for doc_id in doc_ids]
+        with self.lock:
+            self.db.executemany("DELETE FROM documents WHERE doc_id = ?", doc_ids)
+            self.db.executemany("DELETE FROM message_documents WHERE doc_id = ?", doc_ids)
+            self.db.commit()
+
+    def rebuild_from_collection(self, collection, batch_size=1000):
+        """Index every document already stored in a Chroma collection."""
+        offset = 0
+        while True:
+            result = collection.get(include=["documents", "metadatas"], limit=batch_size, offset=offset)
+            if not result["ids"]:
+                return
+            self.upsert([
+                {"id": doc_id, "content": content, "metadata": metadata or {}}
+                for doc_id, content, metadata in zip(result["ids"], result["documents"], result["metadatas"])
+            ])
+            offset += len(result["ids"])
+
+    def find_containing(self, message_id):
+        """Return the IDs of the window documents that include a message."""
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT DISTINCT doc_id FROM message_documents WHERE message_id = ?", (message_id,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def latest_window(self, channel_id):
+        """Return the ID of the window holding the newest indexed message of a channel, or None."""
+        # Message IDs are "<channel_id>:<ts>" and Slack timestamps have a fixed width, so they sort by time
+        with self.lock:
+            row = self.db.execute(
+                "SELECT doc_id FROM message_documents WHERE message_id > ? AND message_id < ? "
+                "ORDER BY message_id DESC LIMIT 1",
+                (f"{channel_id}:", f"{channel_id};")
+            ).fetchone()
+        return row[0] if row else None
+
+    def count(self):
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    @staticmethod
+    def to_match_expression(query):
+        """Turn free text into an FTS5 query matching any of its terms."""
+        terms = QUERY_TERM_PATTERN.findall(query)
+        # Quoted terms are matched as phrases, so "org.apache.fineract" keeps its word order
+        return " OR ".join('"{}"'.format(term.replace('"', '')) for term in terms)
+
+    def search(self, query, k=5, channel=None, since=None, until=None):
+        """
+        Return the `k` documents with the best BM25 score for the query.
+
+        Args:
+            query (str): Free text query
+            k (int): Number of results to return
+            channel (str, optional): Only search this channel (ID or name)
+            since (float, optional): Only search documents ending at or after this epoch time
+            until (float, optional): Only search documents starting at or before this epoch time
+
+        Returns:
+            list: Langchain documents, best match first
+        """
+        expression = self.to_match_expression(query)
+        if not expression:
+            return []
+
+        conditions = ["documents_fts MATCH ?"]
+        params = [expression]
+        if channel:
+            conditions.append("(d.channel_id = ? OR json_extract(d.metadata, '$.channel') = ?)")
+            params.extend([channel, channel])
+        if since is not None:
+            conditions.append("d.end_ts >= ?")
+            params.append(since)
+        if until is not None:
+            conditions.append("d.ts <= ?")
+            params.append(until)
+
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT d.doc_id, d.content, d.metadata FROM documents_fts "
+                "JOIN documents d ON d.rowid = documents_fts.rowid "
+                f"WHERE {' AND '.join(conditions)} ORDER BY bm25(documents_fts) LIMIT ?",
+                params + [k]
+            ).fetchall()
+
+        return [
+            Document(id=doc_id, page_content=content, metadata=json.loads(metadata))
+            for doc_id, content, metadata in rows
+        ]
+
+    def close(self):
+        self.db.close()
@@ -1,93 +1,328 @@
 # main.py
 import os
-import json
-from data import main as extract_slack_messages
+import argparse
+from datetime import datetime
+from itertools import islice
+from async_data import iter_all_channels_messages, SlackRateLimiter
+from data import sync_channels_messages, save_sync_state, track_high_water_marks
+from data import append_records_to_jsonl, iter_channels_data_records, iter_jsonl
 from dotenv import load_dotenv
-from vectordb import create_vector_database, query_vector_database, generate_llm_response
+from threads import harvest_threads, iter_records_with_threads, ThreadCache, DEFAULT_THREAD_LOOKBACK_DAYS
+from vectordb import create_vector_database, upsert_documents
+from vectordb import get_rag_service, ANSWER_CACHE_FILENAME, FAQ_INDEX_FILENAME, QUERY_CACHE_FILENAME
+from answer_cache import invalidate_answer_cache
+from transform import iter_documents_for_vectordb
+from chunking import chunk_conversation_windows
+from realtime import run_realtime_ingestion
+from metrics import metrics
+from users import UserDirectory
+from columnar_store import write_records_to_store, iter_store_records, compact_store, high_water_marks
+from faq import mine_faq_entries, build_faq_index
+from embedding_backends import make_embeddings
+from index_versions import new_version_directory, activate_version, compact_vector_database, writer_lock
+from index_versions import retained_records, retention_cutoff
 
 # Load environment variables
 load_dotenv()
 
-def run_pipeline(channel_ids=None, days_back=30, output_file="slack_raw_data.json"):
+# High-water marks are kept next to the vectors they describe
+SYNC_STATE_FILENAME = "sync_state.json"
+# Newest event the realtime daemon ingested per channel; it never moves the sync marks past a gap
+REALTIME_STATE_FILENAME = "realtime_state.json"
+THREAD_CACHE_FILENAME = "thread_cache.sqlite3"
+USER_DIRECTORY_FILENAME = "user_directory.json"
+
+# Raw history every ingest path appends to, as JSONL and as a columnar copy
+# partitioned by channel and month; rebuilds read either of them
+RAW_DATA_FILE = "slack_raw_data.jsonl"
+HISTORY_DIRECTORY = "./slack_history"
+
+# Files a rebuilt or compacted version starts from instead of starting empty
+CARRIED_OVER_FILENAMES = (SYNC_STATE_FILENAME, REALTIME_STATE_FILENAME, THREAD_CACHE_FILENAME,
+                          USER_DIRECTORY_FILENAME, QUERY_CACHE_FILENAME, FAQ_INDEX_FILENAME)
+
+def open_user_directory(persist_directory, offline=False):
+    """Load the user directory kept next to the database, listing the workspace again if it expired."""
+    users = UserDirectory(os.path.join(persist_directory, USER_DIRECTORY_FILENAME), offline=offline)
+    users.refresh()
+    return users
+
+def report_metrics(persist_directory):
+    """Print the per-stage metrics and write them as metrics.prom and metrics.json next to the database."""
+    print("\nPipeline stages:")
+    metrics.print_summary()
+    prom_file, json_file = metrics.write(persist_directory)
+    print(f"Metrics written to {prom_file} and {json_file}")
+
+def write_processed_messages(records, filename="processed_messages.txt"):
     """
-    Run the data extraction pipeline from Slack.
+    Write the plain text form of every message record as it streams past.
+    
+    Args:
+        records (iterable): Message and thread records
+        filename (str): Path of the plain text file
+    
+    Yields:
+        dict: Every record, unchanged
+    """
+    with open(filename, "w", encoding="utf-8") as f:
+        for record in records:
+            if record.get("type") != "thread":
+                channel_name = record.get("channel_name", record.get("channel_id"))
+                user = record.get("user", "unknown")
+                date = record.get("ts", "unknown")
+                content = record.get("text", "")
+                f.write(f"Channel: #{channel_name}\nUser: {user}\nDate: {date}\nContent: {content}\n\n")
+            yield record
+
+def run_pipeline(channel_ids=None, days_back=30, output_file=RAW_DATA_FILE,
+                 persist_directory="./slack_vectordb", include_threads=True,
+                 thread_cache_file=None, batch_size=200, history_directory=HISTORY_DIRECTORY):
+    """
+    Run the data extraction pipeline from Slack into the vector database.
+    
+    Messages stream from the Slack API through an append-only JSONL file, the
+    columnar history store, the plain text dump and the document transform
+    into batched vector store writes. Threads are fetched a batch of parents at
+    a time and join the same stream behind their parents. Every message is
+    handled exactly once and only a bounded number of pages and threads is in
+    memory at any time.
     
     Args:
         channel_ids (list, optional): Specific channel IDs to extract from
         days_back (int, optional): How many days back to extract messages
-        output_file (str): Filename to save the extracted data
+        output_file (str): JSONL file the raw records are appended to
+        persist_directory (str): Path to the vector database
+        include_threads (bool): Also fetch the replies of every thread
+        thread_cache_file (str, optional): SQLite cache of fetched threads, keyed by their latest
+            reply; defaults to a file next to the vector database
+        batch_size (int): Number of documents embedded and stored per request
+        history_directory (str): Columnar store the raw messages are also written to
+    
+    Returns:
+        dict: High-water marks of the extracted channels
     """
+    if days_back:
+        oldest = str(datetime.now().timestamp() - (days_back * 24 * 60 * 60))
+    else:
+        oldest = None
+    
+    state = {}
+    failed_channels = []
+    
+    metrics.reset()
     print("Starting Slack message extraction...")
-    documents = extract_slack_messages(
-        channel_ids=channel_ids,
-        days_back=days_back,
-        output_file=output_file
-    )
-    
-    print(f"Extracted {len(documents)} channels.")
-    print(f"Raw data saved to {output_file}")
-    
-    # Save the processed messages as plain text
-    with open("processed_messages.txt", "w", encoding="utf-8") as f:
-        for channel_id, channel_data in documents.items():
-            channel_name = channel_data.get("name", channel_id)
-            for msg in channel_data.get("messages", []):
-                user = msg.get("user", "unknown")
-                date = msg.get("ts", "unknown")
-                content = msg.get("text", "")
-                f.write(f"Channel: #{channel_name}\nUser: {user}\nDate: {date}\nContent: {content}\n\n")
+    with writer_lock(persist_directory):
+        users = open_user_directory(persist_directory)
+        # History pages and thread replies draw from one tier budget
+        limiter = SlackRateLimiter()
+        records = iter_all_channels_messages(channel_ids, oldest=oldest, failed_channels=failed_channels,
+                                             limiter=limiter)
+        if include_threads:
+            records = iter_records_with_threads(
+                records,
+                cache_file=thread_cache_file or os.path.join(persist_directory, THREAD_CACHE_FILENAME),
+                limiter=limiter
+            )
+        records = append_records_to_jsonl(records, output_file)
+        records = write_records_to_store(records, history_directory)
+        records = write_processed_messages(records)
+        records = track_high_water_marks(records, state)
+        documents = chunk_conversation_windows(iter_documents_for_vectordb(records, users))
+        create_vector_database(documents, persist_directory, batch_size)
+        
+        # A channel that failed half-way must be fetched again from the start
+        for channel_id in failed_channels:
+            state.pop(channel_id, None)
+        save_sync_state(state, os.path.join(persist_directory, SYNC_STATE_FILENAME))
     
+    print(f"Raw data appended to {output_file} and {history_directory}")
     print(f"Processed messages saved to processed_messages.txt")
-    return documents
+    report_metrics(persist_directory)
+    return state
 
-def display_sample_messages(documents, count=5):
-    """Display a sample of the extracted messages."""
-    # Flatten all messages from all channels
-    all_messages = []
-    for channel_id, channel_data in documents.items():
-        channel_name = channel_data.get("name", channel_id)
-        for msg in channel_data.get("messages", []):
-            all_messages.append({
-                "channel_name": channel_name,
-                "user": msg.get("user", "unknown"),
-                "date": msg.get("ts", "unknown"),
-                "content": msg.get("text", "")
-            })
+def rebuild_from_jsonl(jsonl_file=RAW_DATA_FILE, persist_directory="./slack_vectordb", batch_size=200,
+                       retention_days=None):
+    """
+    Build the vector database from previously extracted raw records, without calling Slack.
+    
+    The new database is built in a versioned sibling directory and swapped in
+    when complete, so the chat keeps answering from the old one meanwhile.
+    The records are always read in the same order, so an interrupted rebuild
+    resumes from its checkpoint when started again. The sync state of the new
+    version is reset to the newest message of every channel in the file, so
+    the next --sync fetches whatever the file is missing.
+    
+    Args:
+        jsonl_file (str): JSONL file written by run_pipeline
+        persist_directory (str): Path to the vector database
+        batch_size (int): Number of documents embedded and stored per request
+        retention_days (int, optional): Leave out conversations older than this
+    """
+    metrics.reset()
+    with writer_lock(persist_directory):
+        version_dir = new_version_directory(persist_directory, CARRIED_OVER_FILENAMES, resume=True)
+        print(f"Rebuilding {persist_directory} from {jsonl_file} in {version_dir}...")
+        # Names come from the saved user directory only, so the rebuild never calls Slack
+        users = open_user_directory(version_dir, offline=True)
+        state = {}
+        records = retained_records(track_high_water_marks(iter_jsonl(jsonl_file), state), retention_days)
+        documents = chunk_conversation_windows(iter_documents_for_vectordb(records, users))
+        create_vector_database(documents, version_dir, batch_size)
+        save_sync_state(state, os.path.join(version_dir, SYNC_STATE_FILENAME))
+        activate_version(persist_directory, version_dir)
+    report_metrics(persist_directory)
 
-    sample_count = min(count, len(all_messages))
-    print(f"\nShowing {sample_count} sample messages:")
+def rebuild_from_store(history_directory=HISTORY_DIRECTORY, persist_directory="./slack_vectordb", batch_size=200,
+                       channel_ids=None, retention_days=None):
+    """
+    Build the vector database from the columnar history store, without calling Slack.
+    
+    Only the columns needed for documents are read, from memory-mapped files,
+    so this is much faster than parsing the JSONL dump. Like rebuild_from_jsonl,
+    the build goes to a new version that is swapped in when complete. Messages
+    come out in time order, so an interrupted rebuild resumes from its checkpoint.
+    The sync state is reset to the newest stored message of every channel.
+    
+    Args:
+        history_directory (str): Columnar store written by run_pipeline
+        persist_directory (str): Path to the vector database
+        batch_size (int): Number of documents embedded and stored per request
+        channel_ids (list, optional): Only rebuild these channels
+        retention_days (int, optional): Leave out messages older than this; whole
+            partitions outside the period are not read
+    """
+    metrics.reset()
+    with writer_lock(persist_directory):
+        version_dir = new_version_directory(persist_directory, CARRIED_OVER_FILENAMES, resume=True)
+        print(f"Rebuilding {persist_directory} from {history_directory} in {version_dir}...")
+        users = open_user_directory(version_dir, offline=True)
+        records = iter_store_records(history_directory, channels=channel_ids,
+                                     since=retention_cutoff(retention_days))
+        documents = chunk_conversation_windows(iter_documents_for_vectordb(records, users))
+        create_vector_database(documents, version_dir, batch_size)
+        save_sync_state(high_water_marks(history_directory, channel_ids),
+                        os.path.join(version_dir, SYNC_STATE_FILENAME))
+        activate_version(persist_directory, version_dir)
+    report_metrics(persist_directory)
 
+def compact_database(persist_directory="./slack_vectordb", retention_days=None, history_directory=HISTORY_DIRECTORY):
+    """
+    Prune expired documents and reclaim the space of deleted vectors, without downtime.
+    
+    The small files incremental syncs leave in the columnar history are merged as well.
+    
+    Args:
+        persist_directory (str): Path to the vector database
+        retention_days (int, optional): Drop conversations whose newest message is older than this
+        history_directory (str): Columnar store of the raw messages
+    """
+    metrics.reset()
+    compact_vector_database(persist_directory, retention_days, carry_over=CARRIED_OVER_FILENAMES)
+    # The realtime daemon compacts the partitions it writes to under the same lock
+    with writer_lock(persist_directory):
+        print(f"Compacted {compact_store(history_directory)} partitions of {history_directory}")
+    report_metrics(persist_directory)
+
+def build_faq(persist_directory="./slack_vectordb"):
+    """
+    Mine resolved question/answer threads from the thread cache into the FAQ index.
+    
+    Runs offline: the threads come from the cache filled by the last sync and
+    names from the saved user directory. Only the questions are embedded, once
+    per run, with the same model as the vector database.
+    
+    Args:
+        persist_directory (str): Path to the vector database
+    """
+    thread_cache = ThreadCache(os.path.join(persist_directory, THREAD_CACHE_FILENAME))
+    users = open_user_directory(persist_directory, offline=True)
+    entries = mine_faq_entries(thread_cache.iter_threads(), users)
+    thread_count = len(thread_cache)
+    thread_cache.close()
+    
+    index_file = os.path.join(persist_directory, FAQ_INDEX_FILENAME)
+    build_faq_index(entries, make_embeddings(), index_file)
+    print(f"FAQ index built with {len(entries)} questions from {thread_count} threads: {index_file}")
+    return entries
 
-def prepare_documents_for_vectordb(slack_data):
+def display_sample_messages(records, count=5):
+    """Display a sample of the extracted messages."""
+    samples = list(islice((record for record in records if record.get("type") != "thread"), count))
+    
+    print(f"\nShowing {len(samples)} sample messages:")
+    for record in samples:
+        channel_name = record.get("channel_name", record.get("channel_id"))
+        print(f"#{channel_name} [{record.get('ts', 'unknown')}] {record.get('user', 'unknown')}: {record.get('text', '')}")
+
+def prepare_documents_for_vectordb(slack_data, users=None):
     """
     Convert slack data to the format needed for the vector database.
     
+    Consecutive messages of a channel are grouped into conversation windows.
+    
     Args:
         slack_data (dict): Dictionary containing slack channel data
+        users (UserDirectory, optional): Directory used to resolve user IDs to display names
     
     Returns:
         list: Documents formatted for vector database
     """
-    documents = []
+    records = iter_channels_data_records(slack_data)
+    return list(chunk_conversation_windows(iter_documents_for_vectordb(records, users)))
+
+def run_incremental_sync(channel_ids=None, days_back=100, persist_directory="./slack_vectordb",
+                         history_directory=HISTORY_DIRECTORY, thread_lookback_days=DEFAULT_THREAD_LOOKBACK_DAYS,
+                         output_file=RAW_DATA_FILE):
+    """
+    Fetch only the messages posted since the last run and upsert them into the vector database.
     
-    for channel_id, channel_data in slack_data.items():
-        channel_name = channel_data.get("name", channel_id)
+    Args:
+        channel_ids (list, optional): Specific channel IDs to sync, defaults to every channel visible to the bot
+        days_back (int, optional): Window used for channels that were never synced
+        persist_directory (str): Path to the vector database
+        history_directory (str): Columnar store the new messages are also written to
+        thread_lookback_days (int): Threads started this recently are checked for new replies
+        output_file (str): JSONL file the new records are appended to
+    
+    Returns:
+        list: The documents that were upserted
+    """
+    state_file = os.path.join(persist_directory, SYNC_STATE_FILENAME)
+    
+    metrics.reset()
+    print("Starting incremental Slack sync...")
+    # The high-water marks are read and advanced with no other writer in between
+    with writer_lock(persist_directory):
+        slack_data, new_state = sync_channels_messages(
+            channel_ids=channel_ids,
+            state_file=state_file,
+            days_back=days_back
+        )
+        # Replies to threads older than the high-water marks are found by listing the recent parents again
+        harvest_threads(slack_data, cache_file=os.path.join(persist_directory, THREAD_CACHE_FILENAME),
+                        lookback_days=thread_lookback_days)
         
-        for msg in channel_data.get("messages", []):
-            user = msg.get("user", "unknown")
-            date = msg.get("ts", "unknown")
-            content = msg.get("text", "")
+        # Keep the raw history in step with the vector database, so a rebuild from it misses nothing
+        records = append_records_to_jsonl(iter_channels_data_records(slack_data), output_file)
+        for _ in write_records_to_store(records, history_directory):
+            pass
+        
+        documents = prepare_documents_for_vectordb(slack_data, open_user_directory(persist_directory))
+        if documents:
+            print(f"Upserting {len(documents)} new documents into {persist_directory}...")
+            upsert_documents(documents, persist_directory=persist_directory)
             
-            if content:  # Only add non-empty messages
-                documents.append({
-                    "content": content,
-                    "metadata": {
-                        "channel": channel_name,
-                        "user": user,
-                        "timestamp": date
-                    }
-                })
-    
+            # Answers built from these channels may no longer be complete
+            touched_channels = {doc["metadata"]["channel_id"] for doc in documents}
+            dropped = invalidate_answer_cache(os.path.join(persist_directory, ANSWER_CACHE_FILENAME), touched_channels)
+            if dropped:
+                print(f"Dropped {dropped} cached answers from updated channels.")
+        
+        # Only advance the checkpoints once the messages are safely stored
+        save_sync_state(new_state, state_file)
+    print("Incremental sync complete.")
+    report_metrics(persist_directory)
     return documents
 
 def run_chat_cli(persist_directory="./slack_vectordb"):
@@ -106,43 +341,87 @@ def run_chat_cli(persist_directory="./slack_vectordb"):
     while True:
         user_input = input("\nYou: ")
         
+        # The clients and the chain are built once, and again only after the index was swapped
+        service = get_rag_service(persist_directory)
+        
         if user_input.lower() in ["exit", "quit", "bye"]:
+            stats = service.cache_stats()
+            print(f"\nQuery cache: {stats['memory_hits'] + stats['disk_hits']} hits, {stats['misses']} misses.")
+            report_metrics(persist_directory)
             print("\nThank you for using the Mifos Chat Assistant. Goodbye!")
             break
         
         print("\nAssistant: ", end="")
         
         try:
-            response = generate_llm_response(user_input, persist_directory=persist_directory)
-            print(response)
+            _, tokens = service.stream_answer(user_input)
+            for token in tokens:
+                print(token, end="", flush=True)
+            print()
         except Exception as e:
             print(f"Sorry, I encountered an error: {str(e)}")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mifos Slack community chat assistant")
+    parser.add_argument("--sync", action="store_true",
+                        help="fetch messages posted since the last run into the existing vector database")
+    parser.add_argument("--reindex", metavar="SOURCE",
+                        help="(re)build the vector database from a raw JSONL file or a columnar history "
+                             "directory instead of Slack")
+    parser.add_argument("--listen", action="store_true",
+                        help="ingest new and edited messages in real time over Socket Mode instead of chatting")
+    parser.add_argument("--compact", action="store_true",
+                        help="copy the live documents into a new, compacted version and swap to it")
+    parser.add_argument("--retention-days", type=int, metavar="DAYS",
+                        help="with --compact or --reindex, leave out conversations older than DAYS")
+    parser.add_argument("--build-faq", action="store_true",
+                        help="mine resolved threads into the FAQ index answered without the LLM")
+    args = parser.parse_args()
+    
     # Check if vector database already exists
     persist_directory = "./slack_vectordb"
     
-    if not os.path.exists(persist_directory):
+    if args.listen:
+        run_realtime_ingestion(
+            persist_directory=persist_directory,
+            state_file=os.path.join(persist_directory, REALTIME_STATE_FILENAME),
+            thread_cache_file=os.path.join(persist_directory, THREAD_CACHE_FILENAME),
+            user_directory_file=os.path.join(persist_directory, USER_DIRECTORY_FILENAME),
+            channel_ids=["C5KKAMQCW"],
+            raw_data_file=RAW_DATA_FILE,
+            history_directory=HISTORY_DIRECTORY
+        )
+        raise SystemExit
+    
+    if args.reindex and os.path.isdir(args.reindex):
+        rebuild_from_store(args.reindex, persist_directory=persist_directory, retention_days=args.retention_days)
+    elif args.reindex:
+        rebuild_from_jsonl(args.reindex, persist_directory=persist_directory, retention_days=args.retention_days)
+    elif not os.path.exists(persist_directory):
         print("Vector database not found. Creating new database...")
         
-        # Extract data from Slack
-        slack_data = run_pipeline(
+        # Extract data from Slack straight into the vector database
+        output_file = RAW_DATA_FILE
+        run_pipeline(
             channel_ids=["C5KKAMQCW"], 
-            days_back=100
+            days_back=100,
+            output_file=output_file,
+            persist_directory=persist_directory
         )
         
         # Display sample of extracted messages
-        display_sample_messages(slack_data)
-        
-        # Prepare documents for vector database
-        documents = prepare_documents_for_vectordb(slack_data)
-        
-        # Create the vector database
-        print(f"\nCreating vector database with {len(documents)} documents...")
-        create_vector_database(documents, persist_directory=persist_directory)
+        display_sample_messages(iter_jsonl(output_file))
         print("Vector database created successfully!")
+    elif args.sync:
+        run_incremental_sync(channel_ids=["C5KKAMQCW"], persist_directory=persist_directory)
     else:
         print(f"Using existing vector database at {persist_directory}")
     
+    if args.compact:
+        compact_database(persist_directory, retention_days=args.retention_days)
+    
+    if args.build_faq:
+        build_faq(persist_directory)
+    
     # Start the CLI chat interface
     run_chat_cli(persist_directory=persist_directory)
\ No newline at end of file
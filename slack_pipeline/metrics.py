@@ -0,0 +1,154 @@
+import os
+import json
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+import numpy as np
+
+# Stages of the pipeline, in the order data flows through them
+STAGES = ("fetch", "transform", "embed", "upsert", "retrieve", "rerank", "llm")
+
+# Counters kept for every stage, exported as slack_pipeline_stage_<name>_total
+COUNTERS = ("calls", "seconds", "items", "bytes", "input_tokens", "output_tokens")
+
+METRIC_PREFIX = "slack_pipeline_stage"
+
+class PipelineMetrics:
+    """
+    Timings and volume counters of every pipeline stage.
+
+    Each stage accumulates calls, seconds, items (messages, documents, pages),
+    bytes and input/output tokens, plus the durations of its latest calls for
+    latency percentiles. Recording is thread-safe, since embedding and fetching
+    run in worker threads.
+    """
+
+    def __init__(self, max_samples=10000):
+        """
+        Args:
+            max_samples (int): Durations kept per stage for the percentiles
+        """
+        self.max_samples = max_samples
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Forget everything recorded so far, e.g. at the start of a run."""
+        with self.lock:
+            self.counters = {}
+            self.samples = {}
+            self.started = time.time()
+
+    def record(self, stage, seconds, items=0, bytes=0, input_tokens=0, output_tokens=0):
+        """
+        Add one call of a stage.
+
+        Args:
+            stage (str): Stage name, one of STAGES
+            seconds (float): Time spent in the call
+            items (int): Messages, documents or pages handled
+            bytes (int): Payload size in bytes
+            input_tokens (int): Tokens sent to a model
+            output_tokens (int): Tokens produced by a model
+        """
+        with self.lock:
+            counters = self.counters.setdefault(stage, dict.fromkeys(COUNTERS, 0))
+            counters["calls"] += 1
+            counters["seconds"] += seconds
+            counters["items"] += items
+            counters["bytes"] += bytes
+            counters["input_tokens"] += input_tokens
+            counters["output_tokens"] += output_tokens
+            self.samples.setdefault(stage, deque(maxlen=self.max_samples)).append(seconds)
+
+    @contextmanager
+    def timer(self, stage, **counts):
+        """
+        Time the enclosed block as one call of `stage`.
+
+        The yielded dictionary can be filled with counts only known at the end
+        of the block, e.g. the number of tokens of an answer.
+        """
+        counts = dict(counts)
+        started = time.perf_counter()
+        try:
+            yield counts
+        finally:
+            self.record(stage, time.perf_counter() - started, **counts)
+
+    def summary(self):
+        """
+        Return the counters and latency percentiles of every stage.
+
+        Returns:
+            dict: {"started", "elapsed_seconds", "stages": {stage: counters + p50/p95/p99 in ms}}
+        """
+        with self.lock:
+            stages = {}
+            for stage in sorted(self.counters, key=lambda name: STAGES.index(name) if name in STAGES else len(STAGES)):
+                durations = np.array(self.samples[stage]) * 1000
+                stages[stage] = dict(
+                    self.counters[stage],
+                    p50_ms=float(np.percentile(durations, 50)),
+                    p95_ms=float(np.percentile(durations, 95)),
+                    p99_ms=float(np.percentile(durations, 99))
+                )
+
+            return {"started": self.started, "elapsed_seconds": time.time() - self.started, "stages": stages}
+
+    def to_prometheus(self):
+        """Render the metrics in the Prometheus text exposition format."""
+        summary = self.summary()
+        lines = []
+
+        for counter in COUNTERS:
+            name = f"{METRIC_PREFIX}_{counter}_total"
+            lines.append(f"# HELP {name} Total {counter.replace('_', ' ')} per pipeline stage.")
+            lines.append(f"# TYPE {name} counter")
+            for stage, values in summary["stages"].items():
+                lines.append(f'{name}{{stage="{stage}"}} {values[counter]}')
+
+        name = f"{METRIC_PREFIX}_latency_seconds"
+        lines.append(f"# HELP {name} Latency of a single call per pipeline stage.")
+        lines.append(f"# TYPE {name} summary")
+        for stage, values in summary["stages"].items():
+            for quantile in ("50", "95", "99"):
+                lines.append(f'{name}{{stage="{stage}",quantile="0.{quantile}"}} {values[f"p{quantile}_ms"] / 1000}')
+            lines.append(f'{name}_sum{{stage="{stage}"}} {values["seconds"]}')
+            lines.append(f'{name}_count{{stage="{stage}"}} {values["calls"]}')
+
+        return "\n".join(lines) + "\n"
+
+    def print_summary(self):
+        """Print one line per stage."""
+        for stage, values in self.summary()["stages"].items():
+            print(
+                f"{stage:>9}: {values['calls']} calls, {values['seconds']:.2f} s, {values['items']} items, "
+                f"{values['bytes'] / 1e6:.1f} MB, {values['input_tokens']} tokens in, "
+                f"{values['output_tokens']} tokens out, p95 {values['p95_ms']:.1f} ms"
+            )
+
+    def write(self, directory, basename="metrics"):
+        """
+        Write `<basename>.prom` and `<basename>.json` atomically into a directory.
+
+        The .prom file can be picked up by the node_exporter textfile collector.
+
+        Returns:
+            tuple: Paths of the Prometheus and JSON files
+        """
+        os.makedirs(directory, exist_ok=True)
+        paths = []
+
+        for extension, content in (("prom", self.to_prometheus()), ("json", json.dumps(self.summary(), indent=2))):
+            path = os.path.join(directory, f"{basename}.{extension}")
+            with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+                f.write(content)
+            os.replace(f"{path}.tmp", path)
+            paths.append(path)
+
+        return tuple(paths)
+
+# Metrics of the current process, shared by every module of the pipeline
+metrics = PipelineMetrics()
@@ -0,0 +1,233 @@
+import os
+import re
+import zlib
+import hashlib
+import sqlite3
+import numpy as np
+from ingest import content_hash
+
+# Estimated Jaccard similarity above which two documents are near-duplicates
+DEFAULT_DUPLICATE_THRESHOLD = 0.85
+
+# 16 bands of 8 rows put the LSH candidate threshold around 0.7, below the
+# verification threshold, so few true near-duplicates are missed
+NUM_BANDS = 16
+ROWS_PER_BAND = 8
+NUM_PERMUTATIONS = NUM_BANDS * ROWS_PER_BAND
+
+# Character shingles work for one-line bot messages as well as for long stack traces
+SHINGLE_CHARS = 5
+
+# Mersenne prime of the universal hash family; a * x + b stays below 2**64
+MERSENNE_PRIME = (1 << 31) - 1
+
+def shingle_hashes(text, size=SHINGLE_CHARS):
+    """32-bit hashes of the distinct character shingles of the normalized text."""
+    text = re.sub(r"\s+", " ", text.lower()).strip()
+    if len(text) <= size:
+        return np.array([zlib.crc32(text.encode("utf-8"))], dtype=np.uint64)
+    return np.unique(np.fromiter(
+        (zlib.crc32(text[i:i + size].encode("utf-8")) for i in range(len(text) - size + 1)),
+        dtype=np.uint64
+    ))
+
+class MinHasher:
+    """MinHash signatures from a fixed, seeded family of hash permutations."""
+
+    def __init__(self, num_permutations=NUM_PERMUTATIONS, seed=1):
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, MERSENNE_PRIME, size=num_permutations, dtype=np.uint64)
+        self.b = rng.integers(0, MERSENNE_PRIME, size=num_permutations, dtype=np.uint64)
+
+    def signature(self, text):
+        """Return the MinHash signature of a text as a uint32 array."""
+        hashes = shingle_hashes(text)
+        permuted = (self.a[:, None] * hashes[None, :] + self.b[:, None]) % MERSENNE_PRIME
+        return permuted.min(axis=1).astype(np.uint32)
+
+def band_keys(signature, rows=ROWS_PER_BAND):
+    """One 64-bit bucket key per band of the signature."""
+    return [
+        int.from_bytes(hashlib.blake2b(signature[start:start + rows].tobytes(), digest_size=8).digest(),
+                       "little", signed=True)
+        for start in range(0, len(signature), rows)
+    ]
+
+class NearDuplicateIndex:
+    """
+    Persistent MinHash/LSH index dropping near-duplicate documents before they are embedded.
+
+    Every document is reduced to a 128-value MinHash signature, which is cut into
+    bands. Documents sharing a band bucket are candidates, and a candidate is a
+    duplicate when the signatures agree on at least `threshold` of their values,
+    an estimate of the Jaccard similarity of the texts. Finding candidates is a
+    handful of indexed lookups per document, so the filter runs in roughly linear
+    time over the history, and the index lives in SQLite next to the database so
+    that later syncs are deduplicated against everything stored before.
+
+    The first document of a group is the representative and is embedded; the
+    others are skipped and recorded, and the representative's metadata lists
+    their IDs in "duplicate_ids".
+    """
+
+    def __init__(self, index_file, threshold=DEFAULT_DUPLICATE_THRESHOLD):
+        """
+        Args:
+            index_file (str): SQLite file holding the signatures and buckets
+            threshold (float): Estimated Jaccard similarity for a near-duplicate
+        """
+        index_dir = os.path.dirname(index_file)
+        if index_dir:
+            os.makedirs(index_dir, exist_ok=True)
+
+        self.threshold = threshold
+        self.hasher = MinHasher()
+        self.touched = set()
+        self.stats = {"documents": 0, "duplicates": 0}
+        self.db = sqlite3.connect(index_file, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS signatures (
+                doc_id TEXT PRIMARY KEY,
+                signature BLOB NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS buckets (
+                band INTEGER NOT NULL,
+                bucket INTEGER NOT NULL,
+                doc_id TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS buckets_lookup ON buckets (band, bucket);
+            CREATE INDEX IF NOT EXISTS buckets_doc ON buckets (doc_id);
+            CREATE TABLE IF NOT EXISTS duplicates (
+                doc_id TEXT PRIMARY KEY,
+                representative_id TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS duplicates_representative ON duplicates (representative_id);
+            """
+        )
+        self.db.commit()
+
+    def forget(self, doc_id):
+        """Drop what is known about a document, before it is indexed again with new content."""
+        self.db.execute("DELETE FROM signatures WHERE doc_id = ?", (doc_id,))
+        self.db.execute("DELETE FROM buckets WHERE doc_id = ?", (doc_id,))
+        self.db.execute("DELETE FROM duplicates WHERE doc_id = ?", (doc_id,))
+
+    def remove(self, doc_ids):
+        """Drop documents pruned from the database, together with the duplicates they represented."""
+        for doc_id in doc_ids:
+            self.forget(doc_id)
+            self.db.execute("DELETE FROM duplicates WHERE representative_id = ?", (doc_id,))
+        self.db.commit()
+
+    def find_representative(self, doc_id, signature, keys):
+        """Return the ID of an indexed document the signature nearly duplicates, or None."""
+        candidates = set()
+        for band, bucket in enumerate(keys):
+            rows = self.db.execute(
+                "SELECT doc_id FROM buckets WHERE band = ? AND bucket = ?", (band, bucket)
+            ).fetchall()
+            candidates.update(row[0] for row in rows)
+        candidates.discard(doc_id)
+
+        for candidate in sorted(candidates):
+            stored = self.db.execute("SELECT signature FROM signatures WHERE doc_id = ?", (candidate,)).fetchone()
+            if stored and np.mean(np.frombuffer(stored[0], dtype=np.uint32) == signature) >= self.threshold:
+                return candidate
+        return None
+
+    def check(self, doc):
+        """
+        Index a document, returning the ID of the representative it duplicates or None.
+
+        A representative checked again (e.g. a window that grew) stays one, even
+        if its new content matches another document: it is already embedded and
+        indexed, so recording it as a duplicate would leave it in both stores.
+
+        Args:
+            doc (dict): Processed document with "id" and "content"
+        """
+        doc_id = doc.get("id") or content_hash(doc["content"])
+        signature = self.hasher.signature(doc["content"])
+        keys = band_keys(signature)
+
+        is_representative = self.db.execute("SELECT 1 FROM signatures WHERE doc_id = ?", (doc_id,)).fetchone()
+        self.forget(doc_id)
+        representative = None if is_representative else self.find_representative(doc_id, signature, keys)
+
+        if representative is None:
+            self.db.execute("INSERT INTO signatures (doc_id, signature) VALUES (?, ?)", (doc_id, signature.tobytes()))
+            self.db.executemany(
+                "INSERT INTO buckets (band, bucket, doc_id) VALUES (?, ?, ?)",
+                [(band, bucket, doc_id) for band, bucket in enumerate(keys)]
+            )
+            self.touched.add(doc_id)
+        else:
+            self.db.execute(
+                "INSERT INTO duplicates (doc_id, representative_id) VALUES (?, ?)", (doc_id, representative)
+            )
+            self.touched.add(representative)
+
+        return representative
+
+    def filter(self, documents):
+        """
+        Yield only the documents that are not near-duplicates of an indexed one.
+
+        Args:
+            documents (iterable): Processed documents
+
+        Yields:
+            dict: The representatives
+        """
+        for doc in documents:
+            self.stats["documents"] += 1
+            if self.check(doc) is None:
+                yield doc
+            else:
+                self.stats["duplicates"] += 1
+
+            if self.stats["documents"] % 1000 == 0:
+                self.db.commit()
+        self.db.commit()
+
+    def duplicates_of(self, representative_ids):
+        """Map representative IDs to the sorted IDs of their duplicates."""
+        result = {}
+        for doc_id in representative_ids:
+            rows = self.db.execute(
+                "SELECT doc_id FROM duplicates WHERE representative_id = ? ORDER BY doc_id", (doc_id,)
+            ).fetchall()
+            if rows:
+                result[doc_id] = [row[0] for row in rows]
+        return result
+
+    def apply_metadata(self, vectordb, batch_size=500):
+        """
+        Record the duplicate IDs in the metadata of the representatives touched since the last call.
+
+        The metadata is updated in place without re-embedding, so representatives
+        that were stored before their duplicates showed up are covered too.
+        """
+        duplicates = self.duplicates_of(sorted(self.touched))
+        self.touched.clear()
+
+        doc_ids = list(duplicates)
+        for start in range(0, len(doc_ids), batch_size):
+            batch = doc_ids[start:start + batch_size]
+            stored = set(vectordb._collection.get(ids=batch, include=[])["ids"])
+            batch = [doc_id for doc_id in batch if doc_id in stored]
+            if batch:
+                vectordb._collection.update(
+                    ids=batch,
+                    metadatas=[
+                        {"duplicate_ids": ",".join(duplicates[doc_id]), "duplicate_count": len(duplicates[doc_id])}
+                        for doc_id in batch
+                    ]
+                )
+        return len(doc_ids)
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
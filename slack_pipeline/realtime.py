@@ -0,0 +1,422 @@
+import os
+import threading
+from langchain_chroma import Chroma
+from slack_bolt.adapter.socket_mode import SocketModeHandler
+from data import app, client, load_sync_state, save_sync_state, track_high_water_marks, append_records_to_jsonl
+from async_data import SlackRateLimiter
+from threads import fetch_threads, thread_to_document
+from transform import iter_documents_for_vectordb, apply_edits
+from chunking import chunk_conversation_windows
+from ingest import ingest_documents, make_document_id
+from embedding_backends import make_embeddings, check_embedding_model
+from answer_cache import invalidate_answer_cache
+from vectordb import open_lexical_index, open_duplicate_index, ANSWER_CACHE_FILENAME
+from index_versions import writer_lock
+from metrics import metrics
+from users import UserDirectory
+from columnar_store import write_records_to_store
+
+# Message subtypes that carry a new message worth indexing
+INDEXED_SUBTYPES = {None, "bot_message", "thread_broadcast", "file_share", "me_message"}
+
+class RealtimeIngestor:
+    """
+    Buffer of Slack message events flushed into the vector database in micro-batches.
+
+    Events are only appended to in-memory buffers, so the Socket Mode handler
+    acknowledges them immediately. A background thread flushes the buffers when
+    `batch_size` events are waiting or every `flush_interval` seconds, whichever
+    comes first. New messages go through the same transform and window chunking
+    as the batch pipeline, extending the channel's latest stored window while
+    they are close enough to it, thread replies refresh their whole thread document,
+    and edits rewrite the window that holds the message. The records go to
+    the same raw history as the batch pipeline's, so a rebuild from the
+    history still has them. The newest event of each channel is recorded in a
+    realtime state of its own. The sync state is left alone, so a later --sync
+    still fetches everything since its own high-water marks, including the
+    messages posted while the daemon was not listening.
+    """
+
+    def __init__(self, persist_directory="./slack_vectordb", state_file=None, thread_cache_file=None,
+                 batch_size=50, flush_interval=5.0, embeddings=None, users=None, raw_data_file=None,
+                 history_directory=None):
+        """
+        Args:
+            persist_directory (str): Directory where the vector database is persisted
+            state_file (str, optional): JSON file of the realtime high-water marks, not the sync state
+            thread_cache_file (str, optional): SQLite thread cache shared with the batch pipeline
+            batch_size (int): Number of buffered events that triggers a flush
+            flush_interval (float): Longest time in seconds an event waits in the buffer
+            embeddings (Embeddings, optional): Embedding model, defaults to the configured backend
+            users (UserDirectory, optional): Directory used to resolve user IDs to display names
+            raw_data_file (str, optional): JSONL file the raw records are appended to
+            history_directory (str, optional): Columnar store the raw records are written to
+        """
+        self.persist_directory = persist_directory
+        self.raw_data_file = raw_data_file
+        self.history_directory = history_directory
+        self.state_file = state_file
+        self.thread_cache_file = thread_cache_file
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.users = users
+        self.state = load_sync_state(state_file) if state_file else {}
+
+        self.embeddings = embeddings or make_embeddings()
+        self.version = None
+        self.open_version()
+
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.stopped = threading.Event()
+        self.channel_names = {}
+        # Kept across flushes, so the thread fetches of consecutive flushes share one tier budget
+        self.limiter = SlackRateLimiter()
+        self.messages = []
+        self.edits = []
+        self.threads = {}
+        self.thread = None
+
+    def open_version(self):
+        """Open the stores of the version the database currently points to."""
+        if self.version is not None:
+            self.duplicate_index.close()
+            self.lexical_index.close()
+            print(f"Switching to the new vector database version {os.path.realpath(self.persist_directory)}")
+
+        self.version = os.path.realpath(self.persist_directory)
+        self.vectordb = Chroma(persist_directory=self.version, embedding_function=self.embeddings)
+        check_embedding_model(self.vectordb, self.embeddings)
+        self.lexical_index = open_lexical_index(self.version, self.vectordb)
+        self.duplicate_index = open_duplicate_index(self.version)
+
+    def pending(self):
+        return len(self.messages) + len(self.edits) + len(self.threads)
+
+    def channel_name(self, channel_id):
+        """Name of a channel, looked up once per channel (events only carry the ID)."""
+        if channel_id not in self.channel_names:
+            try:
+                self.channel_names[channel_id] = client.conversations_info(channel=channel_id)["channel"]["name"]
+            except Exception as e:
+                print(f"Could not look up channel {channel_id}: {e}")
+                return channel_id
+        return self.channel_names[channel_id]
+
+    def add_message(self, channel_id, message):
+        """Buffer a new top-level message."""
+        with self.lock:
+            self.messages.append(dict(message, channel_id=channel_id))
+        self.notify()
+
+    def add_thread_activity(self, channel_id, thread_ts):
+        """Buffer a thread whose replies changed; it is fetched again as a whole."""
+        with self.lock:
+            self.threads[(channel_id, thread_ts)] = {"ts": thread_ts, "thread_ts": thread_ts, "latest_reply": None}
+        self.notify()
+
+    def add_edit(self, channel_id, message, previous_message):
+        """Buffer an edited message together with the text it replaces."""
+        with self.lock:
+            self.edits.append((dict(message, channel_id=channel_id), previous_message or {}))
+        self.notify()
+
+    def notify(self):
+        if self.pending() >= self.batch_size:
+            self.wakeup.set()
+
+    def edited_documents(self, edits):
+        """
+        Turn buffered edits of already stored messages into the documents to upsert.
+
+        A message indexed inside a conversation window gets its line of the
+        window rewritten; any other message is indexed on its own.
+        """
+        documents = {}
+
+        for record, previous in edits:
+            message_id = make_document_id(record["channel_id"], record["ts"])
+            window_ids = self.lexical_index.find_containing(message_id)
+
+            # Windows already rewritten by an earlier edit of this flush are edited again in place
+            missing = [doc_id for doc_id in window_ids if doc_id not in documents]
+            if missing:
+                stored = self.vectordb._collection.get(ids=missing, include=["documents", "metadatas"])
+                for doc_id, content, metadata in zip(stored["ids"], stored["documents"], stored["metadatas"]):
+                    documents[doc_id] = {"id": doc_id, "content": content, "metadata": dict(metadata or {})}
+
+            # Rebuild the line exactly as the transform wrote it into the window
+            old_text, new_text = previous.get("text", ""), record.get("text", "")
+            user = record.get("user", "unknown")
+            if self.users is not None:
+                self.users.resolve_record(record)
+                user = self.users.name(user)
+                old_text, new_text = self.users.rewrite_mentions(old_text), self.users.rewrite_mentions(new_text)
+            old_line = f"{user}: {old_text}"
+            rewritten = False
+            for doc_id in window_ids:
+                doc = documents.get(doc_id)
+                if doc and old_line in doc["content"]:
+                    doc["content"] = doc["content"].replace(old_line, f"{user}: {new_text}", 1)
+                    rewritten = True
+
+            if not rewritten:
+                for doc in iter_documents_for_vectordb([record], self.users):
+                    documents[doc["id"]] = doc
+
+        return list(documents.values())
+
+    def write_raw_history(self, records):
+        """Append records to the raw history written by the batch pipeline."""
+        if self.raw_data_file:
+            records = append_records_to_jsonl(records, self.raw_data_file)
+        if self.history_directory:
+            records = write_records_to_store(records, self.history_directory)
+        for _ in records:
+            pass
+
+    def stored_windows(self, channel_ids, edited):
+        """
+        The stored window holding the newest message of each channel, for new messages to extend.
+
+        Windows rewritten by an edit of the same flush are taken in their edited form.
+        """
+        window_ids = [self.lexical_index.latest_window(channel_id) for channel_id in channel_ids]
+        window_ids = [doc_id for doc_id in window_ids if doc_id]
+        missing = [doc_id for doc_id in window_ids if doc_id not in edited]
+
+        windows = [edited[doc_id] for doc_id in window_ids if doc_id in edited]
+        if missing:
+            stored = self.vectordb._collection.get(ids=missing, include=["documents", "metadatas"])
+            windows.extend(
+                {"id": doc_id, "content": content, "metadata": dict(metadata or {})}
+                for doc_id, content, metadata in zip(stored["ids"], stored["documents"], stored["metadatas"])
+            )
+        return {
+            doc["metadata"]["channel_id"]: doc for doc in windows
+            if doc["metadata"].get("type") == "window" and doc["metadata"].get("end_timestamp")
+        }
+
+    def requeue(self, messages, edits, threads):
+        """Put events taken by a flush back in front of the buffers."""
+        with self.lock:
+            self.messages = messages + self.messages
+            self.edits = edits + self.edits
+            threads.update(self.threads)
+            self.threads = threads
+
+    def write(self, messages, edits, threads, state):
+        """
+        Ingest one batch of buffered events, advancing the realtime high-water marks in `state`.
+
+        Returns:
+            dict: Ingestion statistics
+        """
+        # A rebuild or compaction swapped the database: write to the live version
+        if os.path.realpath(self.persist_directory) != self.version:
+            self.open_version()
+
+        for record in messages:
+            record["channel_name"] = self.channel_name(record["channel_id"])
+        for record, _ in edits:
+            record["channel_name"] = self.channel_name(record["channel_id"])
+
+        # Messages edited before they were stored are chunked with their new text
+        messages, edits = apply_edits(messages, edits)
+
+        # Edits of stored messages go first, so that a window both edited and extended is written once with both changes
+        edited = {doc["id"]: doc for doc in self.edited_documents(edits)}
+        documents = list(chunk_conversation_windows(
+            iter_documents_for_vectordb(track_high_water_marks(messages, state), self.users),
+            stored_windows=self.stored_windows({record["channel_id"] for record in messages}, edited)
+        ))
+        written = {doc["id"] for doc in documents}
+        documents.extend(doc for doc_id, doc in edited.items() if doc_id not in written)
+
+        raw_records = messages + [record for record, _ in edits]
+        if threads:
+            parents = [
+                (channel_id, self.channel_name(channel_id), parent)
+                for (channel_id, _), parent in threads.items()
+            ]
+            for thread in fetch_threads(parents, self.thread_cache_file, limiter=self.limiter):
+                if self.users is not None:
+                    self.users.resolve_record(thread)
+                documents.append(thread_to_document(thread, self.users))
+                raw_records.append(thread)
+
+        # Written before the vectors, as in the batch pipeline, so a rebuild never misses an indexed message
+        self.write_raw_history(raw_records)
+
+        stats = ingest_documents(
+            self.duplicate_index.filter(documents),
+            self.vectordb,
+            batch_size=max(len(documents), 1),
+            max_workers=1,
+            lexical_index=self.lexical_index
+        )
+        self.duplicate_index.apply_metadata(self.vectordb)
+
+        touched_channels = {doc["metadata"]["channel_id"] for doc in documents}
+        invalidate_answer_cache(os.path.join(self.persist_directory, ANSWER_CACHE_FILENAME), touched_channels)
+        return stats
+
+    def flush(self, wait=False):
+        """
+        Write everything buffered so far into the vector database.
+
+        The flush runs under the writer lock shared with --sync, rebuilds and
+        compaction; while another process holds it, the events stay buffered
+        unless `wait` is set.
+        The realtime high-water marks are advanced on a copy, which replaces
+        them only once the batch is stored. If writing fails, the events are
+        put back in the buffers and retried by the next flush.
+
+        Returns:
+            dict: Ingestion statistics, None if nothing was buffered
+        """
+        with self.flush_lock:
+            with self.lock:
+                messages, self.messages = self.messages, []
+                edits, self.edits = self.edits, []
+                threads, self.threads = self.threads, {}
+
+            if not (messages or edits or threads):
+                return None
+
+            with writer_lock(self.persist_directory, blocking=wait) as locked:
+                if not locked:
+                    # A sync, rebuild or compaction is writing: keep the events for the next flush
+                    self.requeue(messages, edits, threads)
+                    print(f"Another process is writing to {self.persist_directory}, "
+                          f"keeping {self.pending()} events buffered.")
+                    return None
+
+                state = dict(self.state)
+                try:
+                    stats = self.write(messages, edits, threads, state)
+                except BaseException:
+                    self.requeue(messages, edits, threads)
+                    raise
+
+                self.state = state
+                if self.state_file:
+                    save_sync_state(self.state, self.state_file)
+
+            # The daemon never ends, so the metrics files are refreshed after every flush
+            metrics.write(self.persist_directory)
+
+            print(
+                f"Flushed {len(messages)} new messages, {len(edits)} edits and {len(threads)} threads "
+                f"({stats['documents']} documents written)."
+            )
+            return stats
+
+    def run_flusher(self):
+        while not self.stopped.is_set():
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                # The events are back in the buffers and the realtime marks were not advanced past them
+                print(f"Error flushing realtime events, retrying with the next flush: {e}")
+
+    def start(self):
+        """Start the background flusher thread."""
+        self.thread = threading.Thread(target=self.run_flusher, name="realtime-flush", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Stop the flusher and write whatever is still buffered."""
+        self.stopped.set()
+        self.wakeup.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.flush(wait=True)
+        self.duplicate_index.close()
+        self.lexical_index.close()
+
+    def handle_event(self, event):
+        """
+        Route one Slack `message` event to the matching buffer.
+
+        Args:
+            event (dict): The event payload delivered by Slack
+        """
+        channel_id = event.get("channel")
+        subtype = event.get("subtype")
+
+        if subtype == "message_changed":
+            message = event.get("message", {})
+            if message.get("thread_ts") and message.get("thread_ts") != message.get("ts"):
+                self.add_thread_activity(channel_id, message["thread_ts"])
+                return
+            if message.get("reply_count"):
+                self.add_thread_activity(channel_id, message["ts"])
+            self.add_edit(channel_id, message, event.get("previous_message"))
+            return
+
+        if subtype not in INDEXED_SUBTYPES or not event.get("ts"):
+            return
+
+        thread_ts = event.get("thread_ts")
+        if thread_ts and thread_ts != event["ts"]:
+            self.add_thread_activity(channel_id, thread_ts)
+            # Broadcast replies are also shown in the channel, as in conversations.history
+            if subtype != "thread_broadcast":
+                return
+
+        self.add_message(channel_id, event)
+
+def run_realtime_ingestion(persist_directory="./slack_vectordb", state_file=None, thread_cache_file=None,
+                           channel_ids=None, batch_size=50, flush_interval=5.0, user_directory_file=None,
+                           raw_data_file=None, history_directory=None):
+    """
+    Listen for message events over Socket Mode and ingest them until interrupted.
+
+    Needs SLACK_APP_TOKEN (xapp-...) with connections:write, and the app
+    subscribed to the message.channels event.
+
+    Args:
+        persist_directory (str): Directory where the vector database is persisted
+        state_file (str, optional): JSON file of the realtime high-water marks, not the sync state
+        thread_cache_file (str, optional): SQLite thread cache shared with the batch pipeline
+        channel_ids (list, optional): Only ingest these channels, all channels if omitted
+        batch_size (int): Number of buffered events that triggers a flush
+        flush_interval (float): Longest time in seconds an event waits in the buffer
+        user_directory_file (str, optional): JSON user directory shared with the batch pipeline
+        raw_data_file (str, optional): JSONL file the raw records are appended to
+        history_directory (str, optional): Columnar store the raw records are written to
+    """
+    users = None
+    if user_directory_file:
+        users = UserDirectory(user_directory_file)
+        users.refresh()
+
+    ingestor = RealtimeIngestor(
+        persist_directory=persist_directory,
+        state_file=state_file,
+        thread_cache_file=thread_cache_file,
+        batch_size=batch_size,
+        flush_interval=flush_interval,
+        users=users,
+        raw_data_file=raw_data_file,
+        history_directory=history_directory
+    )
+
+    @app.event("message")
+    def on_message(event):
+        if channel_ids is None or event.get("channel") in channel_ids:
+            ingestor.handle_event(event)
+
+    ingestor.start()
+    print(f"Listening for Slack messages (flushing every {batch_size} events or {flush_interval:g} seconds)...")
+    try:
+        SocketModeHandler(app, os.environ.get("SLACK_APP_TOKEN")).start()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print("Stopping, writing buffered messages...")
+        ingestor.stop()
@@ -0,0 +1,108 @@
+import os
+import threading
+from collections import OrderedDict
+from embedding_cache import query_cache_key
+from metrics import metrics
+
+DEFAULT_RERANK_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+
+class CrossEncoderReranker:
+    """
+    Reorder retrieved documents with a small cross-encoder running on the CPU.
+
+    A cross-encoder reads the question and a candidate together, so it ranks far
+    better than the vector and keyword scores, but it is too slow to run over the
+    whole collection. It only rescores the few dozen candidates of a search, all
+    in one batched forward pass. Scores are cached per (question, document ID,
+    content hash), so repeated questions and the documents shared by similar
+    questions are not scored again.
+    """
+
+    def __init__(self, model_name=DEFAULT_RERANK_MODEL, num_threads=None, batch_size=64, max_entries=50000):
+        """
+        Args:
+            model_name (str): Hugging Face cross-encoder name or local path
+            num_threads (int, optional): CPU threads used by the forward pass, all cores if omitted
+            batch_size (int): Pairs scored per forward pass
+            max_entries (int): Capacity of the score cache
+        """
+        try:
+            from sentence_transformers import CrossEncoder
+        except ImportError as e:
+            raise ImportError(
+                "Reranking needs sentence-transformers: pip install 'sentence-transformers[onnx]'"
+            ) from e
+
+        import torch
+        torch.set_num_threads(num_threads or os.cpu_count())
+
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.max_entries = max_entries
+        self.model = CrossEncoder(model_name, device="cpu")
+        self.lock = threading.Lock()
+        self.scores = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0}
+
+    @staticmethod
+    def cache_key(query, doc):
+        return (query_cache_key(query), doc.id or doc.page_content, doc.metadata.get("content_hash"))
+
+    def score(self, query, documents):
+        """
+        Return the relevance score of every document for the query.
+
+        Args:
+            query (str): The user's question
+            documents (list): Langchain documents
+
+        Returns:
+            list: One float per document, higher is more relevant
+        """
+        keys = [self.cache_key(query, doc) for doc in documents]
+
+        with self.lock:
+            missing = [index for index, key in enumerate(keys) if key not in self.scores]
+            self.stats["hits"] += len(keys) - len(missing)
+            self.stats["misses"] += len(missing)
+
+            if missing:
+                pairs = [(query, documents[index].page_content) for index in missing]
+                size = sum(len(text.encode("utf-8")) for _, text in pairs)
+                with metrics.timer("rerank", items=len(pairs), bytes=size):
+                    new_scores = self.model.predict(pairs, batch_size=self.batch_size, show_progress_bar=False)
+                for index, value in zip(missing, new_scores):
+                    self.scores[keys[index]] = float(value)
+
+            result = []
+            for key in keys:
+                self.scores.move_to_end(key)
+                result.append(self.scores[key])
+
+            while len(self.scores) > self.max_entries:
+                self.scores.popitem(last=False)
+
+        return result
+
+    def rerank(self, query, documents, top_n):
+        """Return the `top_n` most relevant documents, best first."""
+        if not documents:
+            return []
+
+        scores = self.score(query, documents)
+        ranked = sorted(zip(scores, range(len(documents))), reverse=True)
+        return [documents[index] for _, index in ranked[:top_n]]
+
+def make_reranker():
+    """
+    Build the reranker selected by the environment, or None when reranking is off.
+
+    Reranking is enabled by setting RERANK_MODEL (e.g.
+    cross-encoder/ms-marco-MiniLM-L-6-v2); RERANK_THREADS sets the CPU threads.
+    """
+    model_name = os.environ.get("RERANK_MODEL")
+    if not model_name:
+        return None
+
+    threads = os.environ.get("RERANK_THREADS")
+    return CrossEncoderReranker(model_name, num_threads=int(threads) if threads else None)
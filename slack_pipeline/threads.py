@@ -0,0 +1,383 @@
+import os
+import json
+import time
+import sqlite3
+import asyncio
+from ingest import make_document_id
+from async_data import SlackRateLimiter, async_slack_client, call_slack_api, iter_all_channels_messages
+
+# Threads started this recently are checked for new replies on every sync, even
+# when their parent is older than the channel's high-water mark
+DEFAULT_THREAD_LOOKBACK_DAYS = 14
+
+# Thread parents collected from the message stream before their threads are fetched
+DEFAULT_THREAD_BATCH_SIZE = 64
+
+class ThreadCache:
+    """
+    Previously fetched threads in SQLite, keyed by "<channel_id>:<thread_ts>".
+
+    Lookups and writes touch one row each, so a run only reads the threads it
+    checks and writes the ones it fetched, instead of loading and rewriting
+    the whole cache. A JSON cache left by an older version next to the file is
+    imported the first time it is opened.
+    """
+
+    def __init__(self, cache_file):
+        """
+        Args:
+            cache_file (str): SQLite file holding the threads
+        """
+        cache_dir = os.path.dirname(cache_file)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+        is_new = not os.path.exists(cache_file)
+        self.db = sqlite3.connect(cache_file, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS threads (
+                key TEXT PRIMARY KEY,
+                record TEXT NOT NULL
+            )
+            """
+        )
+        self.db.commit()
+
+        legacy_file = f"{os.path.splitext(cache_file)[0]}.json"
+        if is_new and os.path.exists(legacy_file):
+            with open(legacy_file, 'r', encoding='utf-8') as f:
+                legacy = json.load(f)
+            for key, thread in legacy.items():
+                self.put(key, thread)
+            self.db.commit()
+            print(f"Imported {len(legacy)} threads from {legacy_file}")
+
+    def get(self, key):
+        """Return the cached thread record, or None."""
+        row = self.db.execute("SELECT record FROM threads WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, key, thread):
+        self.db.execute("INSERT OR REPLACE INTO threads (key, record) VALUES (?, ?)", (key, json.dumps(thread)))
+
+    def iter_threads(self):
+        """Yield every cached thread record, one row at a time."""
+        for (record,) in self.db.execute("SELECT record FROM threads ORDER BY key"):
+            yield json.loads(record)
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM threads").fetchone()[0]
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+def is_thread_parent(msg):
+    """Return True if the message started a thread that has replies."""
+    return msg.get("reply_count", 0) > 0 and msg.get("thread_ts", msg.get("ts")) == msg.get("ts")
+
+def collect_thread_parents(channels_data):
+    """
+    Find every top-level message that started a thread.
+
+    Args:
+        channels_data (dict): Extracted data as returned by extract_all_channels_messages
+
+    Returns:
+        list: (channel_id, channel_name, parent_message) tuples
+    """
+    parents = []
+
+    for channel_id, channel_data in channels_data.items():
+        channel_name = channel_data.get("name", channel_id)
+        for msg in channel_data.get("messages", []):
+            if is_thread_parent(msg):
+                parents.append((channel_id, channel_name, msg))
+
+    return parents
+
+async def fetch_thread_replies_async(client, limiter, channel_id, thread_ts):
+    """
+    Fetch a whole thread, following every page of conversations.replies.
+
+    Args:
+        client (AsyncWebClient): The Slack client
+        limiter (SlackRateLimiter): Limiter shared by all concurrent callers
+        channel_id (str): The channel containing the thread
+        thread_ts (str): Timestamp of the thread parent
+
+    Returns:
+        list: The parent message followed by its replies, oldest first
+    """
+    messages = {}
+    cursor = None
+
+    while True:
+        result = await call_slack_api(
+            client, limiter, "conversations.replies",
+            channel=channel_id,
+            ts=thread_ts,
+            cursor=cursor,
+            limit=200
+        )
+        # The parent is repeated at the top of every page
+        for msg in result["messages"]:
+            messages[msg["ts"]] = msg
+
+        if not result.get("has_more", False):
+            break
+        cursor = result["response_metadata"]["next_cursor"]
+
+    return sorted(messages.values(), key=lambda msg: float(msg["ts"]))
+
+def build_thread_document(channel_id, channel_name, messages):
+    """
+    Turn the messages of one thread into a single structured thread record.
+
+    Args:
+        channel_id (str): The channel containing the thread
+        channel_name (str): Name of that channel
+        messages (list): The parent message followed by its replies
+
+    Returns:
+        dict: Thread record with the parent and the replies
+    """
+    parent, replies = messages[0], messages[1:]
+
+    return {
+        "type": "thread",
+        "channel_id": channel_id,
+        "channel_name": channel_name,
+        "thread_ts": parent["ts"],
+        "latest_reply": parent.get("latest_reply"),
+        "reply_count": len(replies),
+        "parent": {
+            "user": parent.get("user", "unknown"),
+            "ts": parent["ts"],
+            "text": parent.get("text", "")
+        },
+        "replies": [
+            {
+                "user": reply.get("user", "unknown"),
+                "ts": reply["ts"],
+                "text": reply.get("text", "")
+            }
+            for reply in replies
+        ]
+    }
+
+async def fetch_threads_async(parents, cache_file=None, max_concurrency=8, tier_limits=None, only_changed=False,
+                              stats=None, limiter=None):
+    """
+    Fetch the replies of the given thread parents.
+
+    Threads whose `latest_reply` matches the cached copy are reused without any
+    API call. The remaining threads are fetched with at most `max_concurrency`
+    requests in flight, all drawing from one shared rate limiter.
+
+    Args:
+        parents (list): (channel_id, channel_name, parent_message) tuples
+        cache_file (str, optional): Path of the SQLite thread cache
+        max_concurrency (int): Maximum number of threads fetched at the same time
+        tier_limits (dict, optional): Requests per minute overrides, keyed by tier
+        only_changed (bool): Leave threads that are unchanged since they were cached out of the result
+        stats (dict, optional): Receives the "threads" and "fetched" counts instead of printing them
+        limiter (SlackRateLimiter, optional): Limiter shared with other callers, instead of a new one
+
+    Returns:
+        list: Thread records as built by build_thread_document
+    """
+    cache = ThreadCache(cache_file) if cache_file else None
+    limiter = limiter or SlackRateLimiter(tier_limits)
+    semaphore = asyncio.Semaphore(max_concurrency)
+    threads = []
+    fetched = 0
+
+    async with async_slack_client(max_concurrency) as client:
+        async def fetch_one(channel_id, channel_name, parent):
+            nonlocal fetched
+            key = f"{channel_id}:{parent['ts']}"
+
+            cached = cache.get(key) if cache is not None else None
+            if cached and cached["latest_reply"] == parent.get("latest_reply"):
+                if not only_changed:
+                    threads.append(cached)
+                return
+
+            async with semaphore:
+                try:
+                    messages = await fetch_thread_replies_async(client, limiter, channel_id, parent["ts"])
+                except Exception as e:
+                    print(f"Error fetching thread {key}: {e}")
+                    return
+
+            thread = build_thread_document(channel_id, channel_name, messages)
+            if cache is not None:
+                cache.put(key, thread)
+            threads.append(thread)
+            fetched += 1
+
+        await asyncio.gather(*(fetch_one(*parent) for parent in parents))
+
+    if stats is None:
+        print(f"Harvested {len(parents)} threads ({fetched} fetched, {len(parents) - fetched} unchanged).")
+    else:
+        stats["threads"] = stats.get("threads", 0) + len(parents)
+        stats["fetched"] = stats.get("fetched", 0) + fetched
+
+    if cache is not None:
+        cache.close()
+
+    return threads
+
+def fetch_threads(parents, cache_file=None, max_concurrency=8, only_changed=False, stats=None, limiter=None,
+                  loop=None):
+    """Blocking wrapper around fetch_threads_async, run on `loop` if given or on a new event loop."""
+    fetch = fetch_threads_async(parents, cache_file=cache_file, max_concurrency=max_concurrency,
+                                only_changed=only_changed, stats=stats, limiter=limiter)
+    if loop is not None:
+        return loop.run_until_complete(fetch)
+    return asyncio.run(fetch)
+
+def iter_records_with_threads(records, cache_file=None, batch_size=DEFAULT_THREAD_BATCH_SIZE, max_concurrency=8,
+                              limiter=None):
+    """
+    Pass message records through, adding the thread records of the parents among them.
+
+    Parents are collected `batch_size` at a time and their threads fetched
+    (with bounded concurrency) as soon as a batch is full, so neither the
+    parents nor the threads of the whole history are ever held in memory.
+    Every batch runs on the same event loop and draws from the same rate
+    limiter, so the tier budget holds across batches.
+
+    Args:
+        records (iterable): Message records as produced by iter_all_channels_messages
+        cache_file (str, optional): Path of the SQLite thread cache
+        batch_size (int): Parents collected before their threads are fetched
+        max_concurrency (int): Maximum number of threads fetched at the same time
+        limiter (SlackRateLimiter, optional): Limiter shared with the producer of `records`
+
+    Yields:
+        dict: Every message record, unchanged, and the thread records after their parents
+    """
+    limiter = limiter or SlackRateLimiter()
+    loop = asyncio.new_event_loop()
+    parents = []
+    stats = {}
+
+    try:
+        for record in records:
+            yield record
+            if record.get("type") != "thread" and is_thread_parent(record):
+                parents.append((record["channel_id"], record.get("channel_name", record["channel_id"]), record))
+                if len(parents) >= batch_size:
+                    yield from fetch_threads(parents, cache_file, max_concurrency, stats=stats, limiter=limiter,
+                                             loop=loop)
+                    parents = []
+
+        if parents:
+            yield from fetch_threads(parents, cache_file, max_concurrency, stats=stats, limiter=limiter, loop=loop)
+    finally:
+        loop.close()
+
+    threads = stats.get("threads", 0)
+    print(f"Harvested {threads} threads ({stats.get('fetched', 0)} fetched, "
+          f"{threads - stats.get('fetched', 0)} unchanged).")
+
+def iter_recent_thread_parents(channel_ids, lookback_days=DEFAULT_THREAD_LOOKBACK_DAYS, limiter=None):
+    """
+    Yield the thread parents posted in the last `lookback_days` days.
+
+    The history of the window is listed again page by page, and only the
+    parents (with their current latest_reply) are kept.
+
+    Yields:
+        tuple: (channel_id, channel_name, parent_message)
+    """
+    oldest = str(time.time() - lookback_days * 24 * 60 * 60)
+    for record in iter_all_channels_messages(channel_ids, oldest=oldest, limiter=limiter):
+        if is_thread_parent(record):
+            yield record["channel_id"], record["channel_name"], record
+
+def harvest_threads(channels_data, cache_file=None, max_concurrency=8, lookback_days=None):
+    """
+    Fetch the threads of every extracted channel and attach them under the "threads" key.
+
+    An incremental sync only lists messages newer than the high-water mark, so
+    replies to older threads would never be seen. With `lookback_days`, the
+    parents of that window are listed again and the threads whose latest_reply
+    moved since they were cached are fetched as well.
+
+    Args:
+        channels_data (dict): Extracted data as returned by extract_all_channels_messages
+        cache_file (str, optional): Path of the SQLite thread cache
+        max_concurrency (int): Maximum number of threads fetched at the same time
+        lookback_days (int, optional): Also refresh the changed threads started in this window
+
+    Returns:
+        dict: channels_data with a "threads" list added to every channel
+    """
+    limiter = SlackRateLimiter()
+    parents = collect_thread_parents(channels_data)
+    threads = fetch_threads(parents, cache_file, max_concurrency, limiter=limiter)
+
+    if lookback_days and channels_data:
+        seen = {(channel_id, parent["ts"]) for channel_id, _, parent in parents}
+        older = [
+            parent for parent in iter_recent_thread_parents(list(channels_data), lookback_days, limiter)
+            if (parent[0], parent[2]["ts"]) not in seen
+        ]
+        changed = fetch_threads(older, cache_file, max_concurrency, only_changed=True, limiter=limiter)
+        print(f"Refreshed {len(changed)} older threads with new replies.")
+        threads.extend(changed)
+
+    for channel_data in channels_data.values():
+        channel_data["threads"] = []
+    for thread in threads:
+        channels_data[thread["channel_id"]]["threads"].append(thread)
+
+    return channels_data
+
+def thread_last_activity(thread):
+    """Timestamp of the newest message of a thread record: its latest reply, or the parent."""
+    times = [thread.get("latest_reply"), thread["thread_ts"]]
+    times.extend(reply["ts"] for reply in thread.get("replies", []))
+    return max((ts for ts in times if ts), key=float)
+
+def thread_to_document(thread, users=None):
+    """
+    Convert a thread record to the format needed for the vector database.
+
+    Each thread becomes one document holding the question and all its answers.
+    With a UserDirectory, authors and <@U…> mentions are written as display names.
+    """
+    if users is None:
+        lines = [thread["parent"]["text"]]
+        lines.extend(f"{reply['user']}: {reply['text']}" for reply in thread["replies"])
+    else:
+        lines = [users.rewrite_mentions(thread["parent"]["text"])]
+        lines.extend(
+            f"{users.name(reply['user'])}: {users.rewrite_mentions(reply['text'])}"
+            for reply in thread["replies"]
+        )
+
+    return {
+        "id": make_document_id(thread["channel_id"], thread["thread_ts"]) + ":thread",
+        "content": "\n".join(lines),
+        "metadata": {
+            "channel": thread["channel_name"],
+            "channel_id": thread["channel_id"],
+            "user": thread["parent"]["user"],
+            "user_name": users.name(thread["parent"]["user"]) if users else thread["parent"]["user"],
+            "timestamp": thread["thread_ts"],
+            "thread_ts": thread["thread_ts"],
+            # Newest reply; retention reads it, and ingestion turns it into the "end_ts" the time filters compare
+            "end_timestamp": thread_last_activity(thread),
+            "reply_count": thread["reply_count"],
+            # Messages the thread holds besides its parent; not "message_ids", which marks windows
+            "reply_ids": ",".join(make_document_id(thread["channel_id"], reply["ts"]) for reply in thread["replies"]),
+            "type": "thread"
+        }
+    }
@@ -0,0 +1,37 @@
+from functools import lru_cache
+import tiktoken
+
+# Encoding of the OpenAI chat and embedding models used by the pipeline
+ENCODING_NAME = "cl100k_base"
+
+@lru_cache(maxsize=1)
+def get_encoding():
+    """
+    Load the tokenizer once per process.
+    
+    tiktoken downloads the encoding on first use; when that is not possible
+    (e.g. an offline CI box) None is returned and token counts are estimated.
+    """
+    try:
+        return tiktoken.get_encoding(ENCODING_NAME)
+    except Exception as e:
+        print(f"Could not load the {ENCODING_NAME} tokenizer ({e}). Estimating token counts.")
+        return None
+
+def count_tokens(text):
+    """Return the number of tokens in `text`."""
+    encoding = get_encoding()
+    if encoding is None:
+        return max(1, len(text) // 4)
+    return len(encoding.encode(text, disallowed_special=()))
+
+def truncate_to_tokens(text, max_tokens):
+    """Return the longest prefix of `text` that fits in `max_tokens` tokens."""
+    encoding = get_encoding()
+    if encoding is None:
+        return text[:max_tokens * 4]
+
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return encoding.decode(tokens[:max_tokens])
@@ -0,0 +1,85 @@
+import time
+from ingest import make_document_id
+from threads import thread_to_document
+from metrics import metrics
+
+def record_to_document(record, users=None):
+    """
+    Convert one message or thread record, or return None for an empty message.
+
+    With a UserDirectory, <@U…> mentions are rewritten to display names and the
+    author's display name is stored next to the raw user ID.
+    """
+    if record.get("type") == "thread":
+        return thread_to_document(record, users)
+
+    content = record.get("text", "")
+    if not content:  # Only add non-empty messages
+        return None
+
+    user = record.get("user", "unknown")
+    return {
+        "id": make_document_id(record["channel_id"], record.get("ts")),
+        "content": users.rewrite_mentions(content) if users else content,
+        "metadata": {
+            "channel": record.get("channel_name", record["channel_id"]),
+            "channel_id": record["channel_id"],
+            "user": user,
+            "user_name": users.name(user) if users else user,
+            "timestamp": record.get("ts", "unknown")
+        }
+    }
+
+def apply_edits(messages, edits):
+    """
+    Fold edits into the messages of the same batch they change.
+
+    A message edited before it was ever stored is written once, with its
+    latest text, instead of being stored stale and then patched.
+
+    Args:
+        messages (list): Message records, each with "channel_id" and "ts"
+        edits (list): (edited_record, previous_message) pairs, oldest first
+
+    Returns:
+        tuple: The messages with their edits applied, and the edits of messages not among them
+    """
+    messages = [dict(record) for record in messages]
+    by_id = {(record["channel_id"], record.get("ts")): record for record in messages}
+    remaining = []
+
+    for record, previous in edits:
+        message = by_id.get((record["channel_id"], record.get("ts")))
+        if message is None:
+            remaining.append((record, previous))
+        else:
+            message.update(record)
+
+    return messages, remaining
+
+def iter_documents_for_vectordb(records, users=None):
+    """
+    Convert message and thread records to the format needed for the vector database.
+
+    Args:
+        records (iterable): Records as produced by iter_all_channels_messages and fetch_threads
+        users (UserDirectory, optional): Directory used to resolve user IDs to display names
+
+    Yields:
+        dict: Documents formatted for vector database
+    """
+    for record in records:
+        started = time.perf_counter()
+        if users is not None:
+            users.resolve_record(record)
+        doc = record_to_document(record, users)
+        if doc is None:
+            continue
+
+        metrics.record(
+            "transform",
+            time.perf_counter() - started,
+            items=1,
+            bytes=len(doc["content"].encode("utf-8"))
+        )
+        yield doc
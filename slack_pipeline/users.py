@@ -0,0 +1,192 @@
+import os
+import re
+import json
+import time
+import asyncio
+from async_data import SlackRateLimiter, async_slack_client, call_slack_api
+
+# A full users.list refresh is done at most this often
+DEFAULT_USER_TTL_SECONDS = 24 * 60 * 60
+
+# <@U0123ABC> or <@U0123ABC|legacy name>
+MENTION_PATTERN = re.compile(r"<@([UW][A-Z0-9]+)(?:\|[^>]*)?>")
+
+def user_entry(member):
+    """The fields of a users.list member kept in the directory."""
+    profile = member.get("profile", {})
+    return {
+        "name": (
+            profile.get("display_name")
+            or profile.get("real_name")
+            or member.get("real_name")
+            or member.get("name")
+            or member["id"]
+        ),
+        "real_name": profile.get("real_name") or member.get("real_name", ""),
+        "deleted": member.get("deleted", False),
+        "is_bot": member.get("is_bot", False),
+        "updated": member.get("updated", 0)
+    }
+
+async def list_users_async(client, limiter, page_size=200):
+    """Return every member of the workspace, following users.list pagination."""
+    members = []
+    cursor = None
+
+    while True:
+        result = await call_slack_api(client, limiter, "users.list", cursor=cursor, limit=page_size)
+        members.extend(result["members"])
+
+        cursor = result.get("response_metadata", {}).get("next_cursor")
+        if not cursor:
+            return members
+
+async def fetch_user_async(client, limiter, user_id):
+    """Return one member from users.info, or None if Slack does not know it."""
+    try:
+        result = await call_slack_api(client, limiter, "users.info", user=user_id)
+    except Exception as e:
+        print(f"Could not look up user {user_id}: {e}")
+        return None
+    return result["user"]
+
+class UserDirectory:
+    """
+    Slack user ID to display name directory, filled in bulk and persisted with a TTL.
+
+    One paginated users.list call sequence fetches the whole workspace (a few
+    requests for thousands of users) instead of one users.info call per author.
+    The directory is saved next to the vector database and only listed again
+    once it is older than `ttl_seconds`; the refresh only rewrites members whose
+    `updated` time changed. IDs that show up in between (new members) are
+    looked up with users.info, once each.
+    """
+
+    def __init__(self, cache_file, ttl_seconds=DEFAULT_USER_TTL_SECONDS, offline=False):
+        """
+        Args:
+            cache_file (str): JSON file holding the directory
+            ttl_seconds (int): Age after which the whole directory is listed again
+            offline (bool): Only use the saved entries, never call Slack
+        """
+        self.cache_file = cache_file
+        self.ttl_seconds = ttl_seconds
+        self.offline = offline
+        self.users = {}
+        self.listed_at = 0
+        self.unknown = set()
+
+        if cache_file and os.path.exists(cache_file):
+            with open(cache_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.users = data.get("users", {})
+            self.listed_at = data.get("listed_at", 0)
+
+    def is_stale(self):
+        return time.time() - self.listed_at > self.ttl_seconds
+
+    def save(self):
+        """Atomically write the directory to disk."""
+        cache_dir = os.path.dirname(self.cache_file)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+        tmp_file = f"{self.cache_file}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump({"listed_at": self.listed_at, "users": self.users}, f)
+        os.replace(tmp_file, self.cache_file)
+
+    def merge(self, members):
+        """Add or update members, returning how many entries changed."""
+        changed = 0
+        for member in members:
+            known = self.users.get(member["id"])
+            if known is None or known["updated"] != member.get("updated", 0):
+                self.users[member["id"]] = user_entry(member)
+                changed += 1
+        return changed
+
+    async def refresh_async(self, force=False):
+        """List the whole workspace if the directory is older than its TTL."""
+        if self.offline or (not force and not self.is_stale()):
+            return 0
+
+        async with async_slack_client(max_concurrency=2) as client:
+            members = await list_users_async(client, SlackRateLimiter())
+
+        changed = self.merge(members)
+        self.listed_at = time.time()
+        self.unknown.clear()
+        if self.cache_file:
+            self.save()
+
+        print(f"Listed {len(members)} Slack users ({changed} new or updated).")
+        return changed
+
+    def refresh(self, force=False):
+        """
+        Blocking wrapper around refresh_async.
+
+        A failed refresh (e.g. a token without users:read) keeps the cached entries.
+
+        Returns:
+            int: Number of new or updated directory entries
+        """
+        try:
+            return asyncio.run(self.refresh_async(force=force))
+        except Exception as e:
+            print(f"Could not list Slack users ({e}). Using {len(self.users)} cached users.")
+            return 0
+
+    def missing(self, user_ids):
+        """IDs absent from the directory that were not looked up in vain before."""
+        return {
+            user_id for user_id in user_ids
+            if user_id and user_id != "unknown" and user_id not in self.users and user_id not in self.unknown
+        }
+
+    async def resolve_missing_async(self, user_ids, max_concurrency=8):
+        """Look up IDs absent from the directory with users.info."""
+        missing = self.missing(user_ids)
+        if not missing:
+            return 0
+
+        limiter = SlackRateLimiter()
+        async with async_slack_client(max_concurrency) as client:
+            members = await asyncio.gather(*(fetch_user_async(client, limiter, user_id) for user_id in missing))
+
+        found = [member for member in members if member]
+        self.unknown.update(missing - {member["id"] for member in found})
+        self.merge(found)
+        if found and self.cache_file:
+            self.save()
+        return len(found)
+
+    def resolve_missing(self, user_ids):
+        """Blocking wrapper around resolve_missing_async, free when every ID is known."""
+        if self.offline or not self.missing(user_ids):
+            return 0
+        return asyncio.run(self.resolve_missing_async(user_ids))
+
+    def name(self, user_id):
+        """Display name of a user, or the ID itself when unknown."""
+        entry = self.users.get(user_id)
+        return entry["name"] if entry else user_id
+
+    def rewrite_mentions(self, text):
+        """Replace <@U…> mentions with @display name."""
+        return MENTION_PATTERN.sub(lambda match: "@" + self.name(match.group(1)), text)
+
+    def resolve_record(self, record):
+        """Make sure the authors and mentioned users of a message or thread record are known."""
+        if record.get("type") == "thread":
+            messages = [record["parent"]] + record["replies"]
+        else:
+            messages = [record]
+
+        user_ids = set()
+        for message in messages:
+            user_ids.add(message.get("user"))
+            user_ids.update(MENTION_PATTERN.findall(message.get("text", "")))
+
+        self.resolve_missing(user_ids)
@@ -1,136 +1,523 @@
 # vector_db_integration.py
 import os
+import httpx
 from langchain_chroma import Chroma
-from langchain_openai import OpenAIEmbeddings, ChatOpenAI
-from langchain.schema import Document
+from langchain_openai import ChatOpenAI
 from langchain.chains import RetrievalQA
 from langchain.prompts import PromptTemplate
 from dotenv import load_dotenv
+from ingest import ingest_documents
+from embedding_cache import CachedQueryEmbeddings
+from answer_cache import SemanticAnswerCache
+from lexical_index import LexicalIndex
+from hybrid_search import HybridRetriever, make_search_executor
+from embedding_backends import make_embeddings, check_embedding_model, embedding_model_name
+from metrics import metrics
+from rerank import make_reranker
+from context_packing import pack_context, DEFAULT_CONTEXT_TOKENS
+from near_duplicates import NearDuplicateIndex
+from faq import FAQIndex, DEFAULT_FAQ_THRESHOLD
+from tokenizer import count_tokens
 
 load_dotenv()
 
-def create_vector_database(documents, persist_directory="./slack_vectordb"):
+# Batches committed by an interrupted ingestion run
+INGEST_CHECKPOINT_FILENAME = "ingest_checkpoint.jsonl"
+
+# BM25 keyword index, kept in step with the Chroma collection
+LEXICAL_INDEX_FILENAME = "lexical_index.sqlite3"
+
+# MinHash signatures and LSH buckets of every stored document
+NEAR_DUPLICATE_INDEX_FILENAME = "near_duplicates.sqlite3"
+
+# Query embedding cache, kept next to the vectors it was computed for
+QUERY_CACHE_FILENAME = "query_embeddings.sqlite3"
+ANSWER_CACHE_FILENAME = "answer_cache.sqlite3"
+
+# Question/answer pairs mined from resolved threads (see faq.build_faq_index)
+FAQ_INDEX_FILENAME = "faq.sqlite3"
+
+# Prompt used to answer questions from the retrieved Slack messages
+QA_TEMPLATE = """
+    You are an assistant for Mifos community chat questions. Use the following pieces of context to answer the question at the end.
+    If you don't know the answer, just say that you don't know, don't try to make up an answer.
+    
+    Context:
+    {context}
+    
+    Question: {question}
+    
+    Answer:
+    """
+
+def open_lexical_index(persist_directory, vectordb):
+    """Open the BM25 index of a vector database, indexing any documents it is missing."""
+    index_file = os.path.join(persist_directory, LEXICAL_INDEX_FILENAME)
+    is_new = not os.path.exists(index_file)
+    
+    lexical_index = LexicalIndex(index_file)
+    if is_new and vectordb._collection.count():
+        print("Building the keyword index from the existing vector database...")
+        lexical_index.rebuild_from_collection(vectordb._collection)
+    
+    return lexical_index
+
+def open_duplicate_index(persist_directory):
+    """Open the MinHash index that keeps near-duplicates out of a vector database."""
+    return NearDuplicateIndex(os.path.join(persist_directory, NEAR_DUPLICATE_INDEX_FILENAME))
+
+def create_vector_database(documents, persist_directory="./slack_vectordb", batch_size=200, max_workers=4,
+                           embeddings=None):
     """
     Create a vector database from processed Slack messages.
     
+    Documents are consumed and embedded `batch_size` at a time by `max_workers`
+    parallel workers, so `documents` can be a generator over a history of any
+    size. Committed batches are checkpointed next to the database, and running
+    the same build again after a crash resumes where it stopped.
+    
     Args:
-        documents (list): List of processed documents from slack_extractor
+        documents (iterable): Processed documents from slack_extractor
         persist_directory (str): Directory to persist the vector database
+        batch_size (int): Number of documents embedded and stored per request
+        max_workers (int): Number of batches embedded concurrently
+        embeddings (Embeddings, optional): Embedding model, defaults to the configured backend
         
     Returns:
         VectorStore: The created vector database
     """
-    # Initialize embeddings - you can replace with other embedding models
-    embeddings = OpenAIEmbeddings(
-        openai_api_key=os.environ.get("OPENAI_API_KEY")
-    )
+    # The backend is chosen with EMBEDDING_BACKEND, see embedding_backends.make_embeddings
+    embeddings = embeddings or make_embeddings()
     
-    # Convert to Langchain documents
-    langchain_docs = []
-    for doc in documents:
-        langchain_docs.append(
-            Document(
-                page_content=doc["content"],
-                metadata=doc["metadata"]
-            )
-        )
-    
-    # Create and persist the vector database
-    vectordb = Chroma.from_documents(
-        documents=langchain_docs,
-        embedding=embeddings,
-        persist_directory=persist_directory
+    vectordb = Chroma(
+        persist_directory=persist_directory,
+        embedding_function=embeddings
     )
+    check_embedding_model(vectordb, embeddings)
     
+    lexical_index = open_lexical_index(persist_directory, vectordb)
+    duplicate_index = open_duplicate_index(persist_directory)
+    stats = ingest_documents(
+        duplicate_index.filter(documents),
+        vectordb,
+        batch_size=batch_size,
+        max_workers=max_workers,
+        checkpoint_file=os.path.join(persist_directory, INGEST_CHECKPOINT_FILENAME),
+        lexical_index=lexical_index
+    )
+    duplicate_index.apply_metadata(vectordb)
+    duplicate_index.close()
+    lexical_index.close()
+    print(f"Ingested {stats['documents']} documents in {stats['seconds']:.1f} seconds "
+          f"({duplicate_index.stats['duplicates']} near-duplicates skipped).")
     
     return vectordb
 
-def query_vector_database(query, persist_directory="./slack_vectordb", k=5):
+def upsert_documents(documents, persist_directory="./slack_vectordb"):
     """
-    Query the vector database.
+    Add new or changed documents to an existing vector database.
+    
+    Documents are keyed by channel ID and message timestamp, so upserting the
+    same message twice (e.g. after an interrupted sync) does not duplicate it,
+    and messages whose text has not changed are not embedded again. Near-duplicates
+    of documents already stored are skipped.
     
     Args:
-        query (str): The query string
+        documents (list): List of processed documents from slack_extractor
         persist_directory (str): Directory where the vector database is persisted
-        k (int): Number of results to return
         
     Returns:
-        list: List of retrieved documents
+        dict: Ingestion statistics
     """
-    embeddings = OpenAIEmbeddings(
-        openai_api_key=os.environ.get("OPENAI_API_KEY")
-    )
+    embeddings = make_embeddings()
     
     vectordb = Chroma(
         persist_directory=persist_directory,
         embedding_function=embeddings
     )
+    check_embedding_model(vectordb, embeddings)
+    
+    lexical_index = open_lexical_index(persist_directory, vectordb)
+    duplicate_index = open_duplicate_index(persist_directory)
+    try:
+        stats = ingest_documents(duplicate_index.filter(documents), vectordb, lexical_index=lexical_index)
+        duplicate_index.apply_metadata(vectordb)
+        return dict(stats, duplicates=duplicate_index.stats["duplicates"])
+    finally:
+        duplicate_index.close()
+        lexical_index.close()
+
+class SlackRAGService:
+    """
+    Long-lived retrieval and question answering over the Slack vector database.
+    
+    The embeddings client, the Chroma collection, the chat model, the prompt and
+    the RetrievalQA chain are built once and reused for every question. Both
+    OpenAI clients share one pooled HTTP client, so consecutive questions reuse
+    open connections instead of paying for new TLS handshakes.
+    """
+    
+    def __init__(self, persist_directory="./slack_vectordb", model_name="4o-mini", temperature=0, k=5,
+                 embeddings=None, llm=None, http_client=None, query_cache_file=None,
+                 answer_cache_threshold=None, reranker=None, rerank_candidates=30,
+                 context_tokens=DEFAULT_CONTEXT_TOKENS, faq_threshold=DEFAULT_FAQ_THRESHOLD):
+        """
+        Args:
+            persist_directory (str): Directory where the vector database is persisted
+            model_name (str): The OpenAI model to use
+            temperature (float): Controls randomness in the response (0 = deterministic, 1 = creative)
+            k (int): Number of documents retrieved per question
+            embeddings (Embeddings, optional): Embedding model, defaults to the configured backend
+            llm (BaseChatModel, optional): Chat model, defaults to ChatOpenAI
+            http_client (httpx.Client, optional): HTTP client shared by the OpenAI clients
+            query_cache_file (str, optional): SQLite query embedding cache, defaults to a
+                file next to the vector database
+            answer_cache_threshold (float, optional): Cosine similarity above which a stored
+                answer is reused instead of calling the LLM; the answer cache is off if omitted
+            reranker (CrossEncoderReranker, optional): Rescores the retrieved candidates so that
+                only the best `k` reach the LLM; no reranking if omitted
+            rerank_candidates (int): Number of candidates retrieved for the reranker
+            context_tokens (int): Token budget of the retrieved context placed in the prompt
+            faq_threshold (float): Cosine similarity above which a mined FAQ answer is returned
+                without retrieval or an LLM call; the FAQ is only used if its index file exists
+        """
+        self.persist_directory = persist_directory
+        self.k = k
+        self.context_tokens = context_tokens
+        self.http_client = http_client or httpx.Client(
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+            timeout=60
+        )
+        
+        base_embeddings = embeddings or make_embeddings(http_client=self.http_client)
+        
+        # Repeated questions are answered from the query embedding cache
+        self.embeddings = CachedQueryEmbeddings(
+            base_embeddings,
+            model_name=embedding_model_name(base_embeddings),
+            cache_file=query_cache_file or os.path.join(persist_directory, QUERY_CACHE_FILENAME)
+        )
+        
+        self.vectordb = Chroma(
+            persist_directory=persist_directory,
+            embedding_function=self.embeddings
+        )
+        check_embedding_model(self.vectordb, base_embeddings)
+        
+        self.llm = llm or ChatOpenAI(
+            model_name=model_name,
+            temperature=temperature,
+            openai_api_key=os.environ.get("OPENAI_API_KEY"),
+            http_client=self.http_client
+        )
+        
+        self.prompt = PromptTemplate(
+            template=QA_TEMPLATE,
+            input_variables=["context", "question"]
+        )
+        
+        # Keyword and vector searches are fused when the BM25 index has been built
+        index_file = os.path.join(persist_directory, LEXICAL_INDEX_FILENAME)
+        self.lexical_index = LexicalIndex(index_file) if os.path.exists(index_file) else None
+        self.executor = make_search_executor()
+        self.retriever = HybridRetriever(
+            vectordb=self.vectordb,
+            lexical_index=self.lexical_index,
+            k=k,
+            executor=self.executor,
+            reranker=reranker,
+            rerank_candidates=rerank_candidates
+        )
+        
+        self.qa_chain = RetrievalQA.from_chain_type(
+            llm=self.llm,
+            chain_type="stuff",
+            retriever=self.retriever,
+            chain_type_kwargs={"prompt": self.prompt},
+            return_source_documents=True
+        )
+        
+        self.answer_cache = None
+        if answer_cache_threshold is not None:
+            self.answer_cache = SemanticAnswerCache(
+                os.path.join(persist_directory, ANSWER_CACHE_FILENAME),
+                threshold=answer_cache_threshold
+            )
+        
+        faq_file = os.path.join(persist_directory, FAQ_INDEX_FILENAME)
+        self.faq_index = None
+        if os.path.exists(faq_file):
+            self.faq_index = FAQIndex(faq_file, threshold=faq_threshold,
+                                      model_name=embedding_model_name(base_embeddings))
+    
+    def query(self, query, k=None, channel=None, since=None, until=None):
+        """
+        Return the `k` documents that best match the query.
+        
+        Args:
+            query (str): The query string
+            k (int, optional): Number of results to return
+            channel (str, optional): Only search this channel (ID or name)
+            since (datetime or float, optional): Only search messages posted at or after this time
+            until (datetime or float, optional): Only search messages posted at or before this time
+        """
+        with metrics.timer("retrieve", input_tokens=count_tokens(query)) as counts:
+            documents = self.retriever.search(query, k=k or self.k, channel=channel, since=since, until=until)
+            counts["items"] = len(documents)
+        return documents
+    
+    def generate(self, query, documents):
+        """Run the "stuff" chain over already retrieved documents, packed into the context budget."""
+        packed = pack_context(documents, self.context_tokens)
+        context = "\n\n".join(doc.page_content for doc in packed)
+        with metrics.timer("llm", items=len(packed), input_tokens=count_tokens(context) + count_tokens(query),
+                           bytes=len(context.encode("utf-8"))) as counts:
+            result = self.qa_chain.combine_documents_chain.invoke({"input_documents": packed, "question": query})
+            counts["output_tokens"] = count_tokens(result["output_text"])
+        return {"query": query, "result": result["output_text"], "source_documents": documents}
+    
+    def faq_answer(self, query):
+        """
+        Return the FAQ entry answering the query, or None.
+        
+        The normalized exact match is tried first, so the most frequent questions
+        are answered without even embedding them.
+        """
+        if self.faq_index is None:
+            return None
+        
+        entry = self.faq_index.lookup_exact(query)
+        if entry is None:
+            entry = self.faq_index.lookup_similar(self.embeddings.embed_query(query))
+        return entry
+    
+    def answer(self, query, channel=None, since=None, until=None):
+        """
+        Answer a question using the retrieved documents as context.
+        
+        Args:
+            query (str): The user's question
+            channel (str, optional): Only use messages from this channel (ID or name)
+            since (datetime or float, optional): Only use messages posted at or after this time
+            until (datetime or float, optional): Only use messages posted at or before this time
+        
+        Returns:
+            dict: {"query", "result", "source_documents"}, plus "faq": True when the
+                answer came from the FAQ index or "cached": True when it came from the
+                semantic answer cache
+        """
+        filtered = channel is not None or since is not None or until is not None
+        
+        # FAQ answers come from any channel and time, so they never answer filtered questions either
+        entry = None if filtered else self.faq_answer(query)
+        if entry:
+            return {
+                "query": query,
+                "result": entry["answer"],
+                "source_documents": [FAQIndex.to_document(entry)],
+                "faq": True
+            }
+        
+        # Cached answers were produced from the whole workspace, so they never answer filtered questions
+        if self.answer_cache is None or filtered:
+            return self.generate(query, self.query(query, channel=channel, since=since, until=until))
+        
+        embedding = self.embeddings.embed_query(query)
+        cached = self.answer_cache.lookup(embedding)
+        if cached:
+            return {
+                "query": query,
+                "result": cached["answer"],
+                "source_documents": cached["source_documents"],
+                "cached": True
+            }
+        
+        response = self.generate(query, self.query(query))
+        self.answer_cache.store(query, embedding, response["result"], response["source_documents"])
+        return response
+    
+    def stream_answer(self, query, channel=None, since=None, until=None):
+        """
+        Answer a question, yielding the tokens as the LLM produces them.
+        
+        Retrieval finishes before generation starts, so the source documents are
+        returned immediately together with a generator of answer tokens.
+        
+        Args:
+            query (str): The user's question
+            channel (str, optional): Only use messages from this channel (ID or name)
+            since (datetime or float, optional): Only use messages posted at or after this time
+            until (datetime or float, optional): Only use messages posted at or before this time
+        
+        Returns:
+            tuple: (source_documents, tokens) where tokens is a generator of strings
+        """
+        filtered = channel is not None or since is not None or until is not None
+        use_cache = self.answer_cache is not None and not filtered
+        
+        entry = None if filtered else self.faq_answer(query)
+        if entry:
+            return [FAQIndex.to_document(entry)], iter([entry["answer"]])
+        
+        if use_cache:
+            embedding = self.embeddings.embed_query(query)
+            cached = self.answer_cache.lookup(embedding)
+            if cached:
+                return cached["source_documents"], iter([cached["answer"]])
+        
+        documents = self.query(query, channel=channel, since=since, until=until)
+        packed = pack_context(documents, self.context_tokens)
+        prompt = self.prompt.format(
+            context="\n\n".join(doc.page_content for doc in packed),
+            question=query
+        )
+        
+        def tokens():
+            parts = []
+            with metrics.timer("llm", items=len(packed), input_tokens=count_tokens(prompt),
+                               bytes=len(prompt.encode("utf-8"))) as counts:
+                for chunk in self.llm.stream(prompt):
+                    parts.append(chunk.content)
+                    yield chunk.content
+                counts["output_tokens"] = count_tokens("".join(parts))
+            
+            if use_cache:
+                self.answer_cache.store(query, embedding, "".join(parts), documents)
+        
+        return documents, tokens()
+    
+    def cache_stats(self):
+        """Return the hit and miss counters of the query embedding cache."""
+        return self.embeddings.cache_stats()
+    
+    def close(self):
+        """Close the pooled HTTP connections and the caches."""
+        self.http_client.close()
+        self.executor.shutdown(wait=False)
+        self.embeddings.close()
+        if self.lexical_index is not None:
+            self.lexical_index.close()
+        if self.answer_cache is not None:
+            self.answer_cache.close()
+
+def make_rag_service(persist_directory="./slack_vectordb", model_name="4o-mini", temperature=0, **overrides):
+    """
+    Build a SlackRAGService configured from the environment, as get_rag_service does.
+    
+    Keyword arguments override the environment settings, e.g. to evaluate a
+    variant of the configured retriever with its own query cache.
+    """
+    threshold = os.environ.get("ANSWER_CACHE_THRESHOLD")
+    settings = {
+        "answer_cache_threshold": float(threshold) if threshold else None,
+        "rerank_candidates": int(os.environ.get("RERANK_CANDIDATES", 30)),
+        "context_tokens": int(os.environ.get("CONTEXT_TOKENS", DEFAULT_CONTEXT_TOKENS)),
+        "faq_threshold": float(os.environ.get("FAQ_THRESHOLD", DEFAULT_FAQ_THRESHOLD))
+    }
+    settings.update(overrides)
+    if "reranker" not in settings:
+        settings["reranker"] = make_reranker()
     
-    results = vectordb.similarity_search(query, k=k)
+    return SlackRAGService(persist_directory=persist_directory, model_name=model_name, temperature=temperature,
+                           **settings)
+
+# Services shared by every caller in the process, keyed by their configuration
+_services = {}
+
+# Services replaced after a version swap, closed at the next swap so that answers in flight can finish
+_retired = {}
+
+def get_rag_service(persist_directory="./slack_vectordb", model_name="4o-mini", temperature=0):
+    """
+    Return the shared SlackRAGService for a configuration, building it on first use.
+    
+    The CLI and any server front-end should go through this function so that
+    they all reuse the same clients and connection pool. The semantic answer
+    cache is enabled by setting ANSWER_CACHE_THRESHOLD (e.g. 0.95), and
+    cross-encoder reranking by setting RERANK_MODEL (see rerank.make_reranker)
+    and optionally RERANK_CANDIDATES. CONTEXT_TOKENS sets the prompt context budget
+    and FAQ_THRESHOLD the similarity needed for a mined FAQ answer.
+    
+    The service is opened on the version `persist_directory` currently points
+    to (see index_versions). When a rebuild or compaction swaps the pointer,
+    the next call opens the new version, so long-running callers move over
+    without a restart.
+    """
+    key = (os.path.abspath(persist_directory), model_name, temperature)
+    version = os.path.realpath(persist_directory)
+    
+    service = _services.get(key)
+    if service is not None and service.persist_directory != version:
+        previous = _retired.pop(key, None)
+        if previous is not None:
+            previous.close()
+        _retired[key] = service
+        print(f"Switching to the new vector database version {version}")
+        service = None
+    
+    if service is None:
+        _services[key] = make_rag_service(version, model_name=model_name, temperature=temperature)
     
-    return results
+    return _services[key]
 
-def generate_llm_response(query, persist_directory="./slack_vectordb", model_name="4o-mini", temperature=0):
+def query_vector_database(query, persist_directory="./slack_vectordb", k=5, channel=None, since=None, until=None):
+    """
+    Query the vector database.
+    
+    Args:
+        query (str): The query string
+        persist_directory (str): Directory where the vector database is persisted
+        k (int): Number of results to return
+        channel (str, optional): Only search this channel (ID or name)
+        since (datetime or float, optional): Only search messages posted at or after this time
+        until (datetime or float, optional): Only search messages posted at or before this time
+        
+    Returns:
+        list: List of retrieved documents
+    """
+    return get_rag_service(persist_directory).query(query, k=k, channel=channel, since=since, until=until)
+
+def generate_llm_response(query, persist_directory="./slack_vectordb", model_name="4o-mini", temperature=0,
+                          channel=None, since=None, until=None):
     """
     Generate a response to a query using retrieved documents from the vector database as context.
     
+    Questions that match a mined FAQ entry with high confidence are answered
+    from the FAQ index without retrieval or an LLM call.
+    
     Args:
         query (str): The user's query
         persist_directory (str): Directory where the vector database is persisted
         model_name (str): The OpenAI model to use
         temperature (float): Controls randomness in the response (0 = deterministic, 1 = creative)
+        channel (str, optional): Only use messages from this channel (ID or name)
+        since (datetime or float, optional): Only use messages posted at or after this time
+        until (datetime or float, optional): Only use messages posted at or before this time
         
     Returns:
         str: The LLM's response
     """
-    # Initialize embeddings
-    embeddings = OpenAIEmbeddings(
-        openai_api_key=os.environ.get("OPENAI_API_KEY")
-    )
-    
-    # Load the vector database
-    vectordb = Chroma(
-        persist_directory=persist_directory,
-        embedding_function=embeddings
-    )
-    
-    # Create retriever
-    retriever = vectordb.as_retriever(search_kwargs={"k": 5})
+    service = get_rag_service(persist_directory, model_name=model_name, temperature=temperature)
     
-    # Initialize LLM
-    llm = ChatOpenAI(
-        model_name=model_name,
-        temperature=temperature,
-        openai_api_key=os.environ.get("OPENAI_API_KEY")
-    )
-    
-    # Create a custom prompt template
-    template = """
-    You are an assistant for Mifos community chat questions. Use the following pieces of context to answer the question at the end.
-    If you don't know the answer, just say that you don't know, don't try to make up an answer.
-    
-    Context:
-    {context}
-    
-    Question: {question}
-    
-    Answer:
+    return service.answer(query, channel=channel, since=since, until=until)
+
+def stream_llm_response(query, persist_directory="./slack_vectordb", model_name="4o-mini", temperature=0,
+                        channel=None, since=None, until=None):
     """
+    Streaming variant of generate_llm_response.
     
-    QA_PROMPT = PromptTemplate(
-        template=template, 
-        input_variables=["context", "question"]
-    )
-    
-    # Create a retrieval QA chain
-    qa_chain = RetrievalQA.from_chain_type(
-        llm=llm,
-        chain_type="stuff",
-        retriever=retriever,
-        chain_type_kwargs={"prompt": QA_PROMPT}
-    )
-    
-    # Generate response using invoke instead of run (which is deprecated)
-    response = qa_chain.invoke({"query": query})
+    Args:
+        query (str): The user's query
+        persist_directory (str): Directory where the vector database is persisted
+        model_name (str): The OpenAI model to use
+        temperature (float): Controls randomness in the response (0 = deterministic, 1 = creative)
+        channel (str, optional): Only use messages from this channel (ID or name)
+        since (datetime or float, optional): Only use messages posted at or after this time
+        until (datetime or float, optional): Only use messages posted at or before this time
+        
+    Returns:
+        tuple: (source_documents, tokens) where tokens yields the answer as it is generated
+    """
+    service = get_rag_service(persist_directory, model_name=model_name, temperature=temperature)
     
-    return response
\ No newline at end of file
+    return service.stream_answer(query, channel=channel, since=since, until=until)
@@ -0,0 +1,15 @@
+import os
+import sys
+import pytest
+
+# The pipeline modules import each other by module name, as when run from slack_pipeline/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "slack_pipeline"))
+# Chroma would otherwise report usage over the network
+os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+
+import tokenizer
+
+@pytest.fixture(autouse=True)
+def offline_tokenizer(monkeypatch):
+    """Estimate token counts instead of letting tiktoken download its encoding."""
+    monkeypatch.setattr(tokenizer, "get_encoding", lambda: None)
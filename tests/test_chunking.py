@@ -0,0 +1,90 @@
+from chunking import chunk_conversation_windows
+
+T0 = 1700000000.0
+
+def message(ts, text="hello there", channel_id="C1", user="U1"):
+    """A message document as iter_documents_for_vectordb produces it."""
+    timestamp = f"{ts:.6f}"
+    return {
+        "id": f"{channel_id}:{timestamp}",
+        "content": text,
+        "metadata": {
+            "channel": "general",
+            "channel_id": channel_id,
+            "user": user,
+            "user_name": user,
+            "timestamp": timestamp
+        }
+    }
+
+def test_close_messages_share_a_window():
+    windows = list(chunk_conversation_windows([message(T0), message(T0 + 60, "thanks!", user="U2")]))
+
+    assert len(windows) == 1
+    window = windows[0]
+    assert window["id"] == f"C1:{T0:.6f}:window"
+    assert window["content"] == "U1: hello there\nU2: thanks!"
+    assert window["metadata"]["message_count"] == 2
+    assert window["metadata"]["message_ids"] == f"C1:{T0:.6f},C1:{T0 + 60:.6f}"
+    assert window["metadata"]["end_timestamp"] == f"{T0 + 60:.6f}"
+
+def test_gap_closes_the_window():
+    windows = list(chunk_conversation_windows([message(T0), message(T0 + 3600)], max_gap_seconds=900))
+
+    assert [window["metadata"]["message_count"] for window in windows] == [1, 1]
+
+def test_token_budget_closes_the_window():
+    long_text = "word " * 100
+    windows = list(chunk_conversation_windows([message(T0, long_text), message(T0 + 1, long_text)], max_tokens=150))
+
+    assert len(windows) == 2
+
+def test_channels_and_page_order_are_interleaved():
+    documents = [message(T0 + 60), message(T0 + 30, channel_id="C2"), message(T0), message(T0 + 90, channel_id="C2")]
+    windows = {window["metadata"]["channel_id"]: window for window in chunk_conversation_windows(documents)}
+
+    assert windows["C1"]["metadata"]["timestamp"] == f"{T0:.6f}"
+    assert windows["C1"]["metadata"]["message_count"] == 2
+    assert windows["C2"]["metadata"]["message_count"] == 2
+
+def test_threads_pass_through():
+    thread = {"id": "C1:1:thread", "content": "question", "metadata": {"type": "thread", "channel_id": "C1"}}
+
+    assert list(chunk_conversation_windows([thread])) == [thread]
+
+def test_reopened_window_is_extended_under_its_id():
+    stored = next(chunk_conversation_windows([message(T0), message(T0 + 60)]))
+
+    windows = list(chunk_conversation_windows([message(T0 + 120, "one more", user="U3")],
+                                              stored_windows={"C1": stored}))
+
+    assert len(windows) == 1
+    window = windows[0]
+    assert window["id"] == stored["id"]
+    assert window["content"] == stored["content"] + "\nU3: one more"
+    assert window["metadata"]["timestamp"] == f"{T0:.6f}"
+    assert window["metadata"]["end_timestamp"] == f"{T0 + 120:.6f}"
+    assert window["metadata"]["message_count"] == 3
+    assert window["metadata"]["message_ids"].split(",")[-1] == f"C1:{T0 + 120:.6f}"
+
+def test_reopened_window_is_not_extended_across_a_gap():
+    stored = next(chunk_conversation_windows([message(T0)]))
+
+    windows = list(chunk_conversation_windows([message(T0 + 3600)], max_gap_seconds=900,
+                                              stored_windows={"C1": stored}))
+
+    assert [window["id"] for window in windows] == [f"C1:{T0 + 3600:.6f}:window"]
+
+def test_reopened_window_only_takes_later_messages():
+    stored = next(chunk_conversation_windows([message(T0), message(T0 + 60)]))
+
+    windows = list(chunk_conversation_windows([message(T0 + 30)], stored_windows={"C1": stored}))
+
+    assert [window["id"] for window in windows] == [f"C1:{T0 + 30:.6f}:window"]
+
+def test_untouched_stored_window_is_not_written_again():
+    stored = next(chunk_conversation_windows([message(T0)]))
+
+    windows = list(chunk_conversation_windows([message(T0, channel_id="C2")], stored_windows={"C1": stored}))
+
+    assert [window["metadata"]["channel_id"] for window in windows] == ["C2"]
@@ -0,0 +1,92 @@
+import pyarrow as pa
+from columnar_store import (MESSAGE_SCHEMA, MessageStoreWriter, compact_store, high_water_marks, iter_partitions,
+                            iter_store_records, latest_versions, part_files, read_messages, write_records_to_store)
+
+T0 = 1700000000.0
+
+def message(ts, text="hello", **fields):
+    return dict({"channel_id": "C1", "channel_name": "general", "ts": f"{ts:.6f}", "user": "U1", "text": text},
+                **fields)
+
+def write(root, records):
+    for _ in write_records_to_store(records, root):
+        pass
+
+def test_latest_versions_keeps_the_newest_copy_oldest_message_first():
+    rows = [
+        {"ts": "20.000000", "text": "b", "ingested_at": 1.0},
+        {"ts": "10.000000", "text": "a old", "ingested_at": 1.0},
+        {"ts": "10.000000", "text": "a new", "ingested_at": 2.0},
+        {"ts": "9.000000", "text": "c", "ingested_at": 1.0}
+    ]
+    table = pa.Table.from_pylist(rows, schema=pa.schema([MESSAGE_SCHEMA.field(name) for name in rows[0]]))
+
+    latest = latest_versions(table)
+
+    assert latest["text"].to_pylist() == ["c", "a new", "b"]
+
+def test_latest_versions_of_an_empty_table():
+    assert latest_versions(MESSAGE_SCHEMA.empty_table()).num_rows == 0
+
+def test_rewritten_messages_are_read_once_in_their_latest_version(tmp_path):
+    root = str(tmp_path / "history")
+    write(root, [message(T0, "first"), message(T0 + 60, "second")])
+    write(root, [message(T0, "first, edited")])
+
+    texts = read_messages(root, columns=["ts", "text"])["text"].to_pylist()
+
+    assert texts == ["first, edited", "second"]
+
+def test_compaction_merges_files_without_losing_messages(tmp_path):
+    root = str(tmp_path / "history")
+    for i in range(5):
+        write(root, [message(T0 + i, f"message {i}"), message(T0, f"version {i}")])
+    (_, _, directory), = iter_partitions(root)
+    assert len(part_files(directory)) == 5
+
+    assert compact_store(root) == 1
+
+    assert len(part_files(directory)) == 1
+    texts = read_messages(root, columns=["text"])["text"].to_pylist()
+    assert texts == ["version 4"] + [f"message {i}" for i in range(1, 5)]
+
+def test_writer_compacts_a_partition_past_its_file_limit(tmp_path):
+    root = str(tmp_path / "history")
+    with MessageStoreWriter(root, rows_per_file=1, max_files_per_partition=3) as writer:
+        for i in range(3):
+            writer.add(message(T0 + i))
+    (_, _, directory), = iter_partitions(root)
+
+    assert len(part_files(directory)) == 1
+    assert read_messages(root).num_rows == 3
+
+def test_high_water_marks_ignore_thread_replies(tmp_path):
+    root = str(tmp_path / "history")
+    thread = {
+        "type": "thread", "channel_id": "C1", "channel_name": "general", "thread_ts": f"{T0:.6f}",
+        "reply_count": 1, "latest_reply": f"{T0 + 500:.6f}",
+        "parent": {"user": "U1", "ts": f"{T0:.6f}", "text": "question"},
+        "replies": [{"user": "U2", "ts": f"{T0 + 500:.6f}", "text": "answer"}]
+    }
+    write(root, [message(T0 + 100), thread])
+
+    assert high_water_marks(root) == {"C1": f"{T0 + 100:.6f}"}
+
+def test_since_brings_whole_threads_with_replies_in_range(tmp_path):
+    root = str(tmp_path / "history")
+    thread = {
+        "type": "thread", "channel_id": "C1", "channel_name": "general", "thread_ts": f"{T0:.6f}",
+        "reply_count": 2, "latest_reply": f"{T0 + 9000:.6f}",
+        "parent": {"user": "U1", "ts": f"{T0:.6f}", "text": "question"},
+        "replies": [{"user": "U2", "ts": f"{T0 + 10:.6f}", "text": "first answer"},
+                    {"user": "U3", "ts": f"{T0 + 9000:.6f}", "text": "late answer"}]
+    }
+    write(root, [thread, message(T0 + 8000, "recent")])
+
+    records = list(iter_store_records(root, since=T0 + 5000))
+
+    assert [record.get("text") for record in records if record.get("type") != "thread"] == ["recent"]
+    threads = [record for record in records if record.get("type") == "thread"]
+    assert len(threads) == 1
+    assert threads[0]["parent"]["text"] == "question"
+    assert [reply["text"] for reply in threads[0]["replies"]] == ["first answer", "late answer"]
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+from evaluate import covered_ids, score_ranking
+
+def message(doc_id):
+    return Document(id=doc_id, page_content=doc_id)
+
+def window(doc_id, *message_ids):
+    return Document(id=doc_id, page_content=doc_id,
+                    metadata={"type": "window", "message_ids": ",".join(message_ids)})
+
+def test_covered_ids_of_windows_threads_and_duplicates():
+    thread = Document(id="C1:1:thread", page_content="", metadata={
+        "type": "thread", "channel_id": "C1", "thread_ts": "1", "reply_ids": "C1:2,C1:3", "duplicate_ids": "C1:9"
+    })
+
+    assert covered_ids(thread) == {"C1:1:thread", "C1:1", "C1:2", "C1:3", "C1:9"}
+    assert covered_ids(window("C1:1:window", "C1:1", "C1:2")) == {"C1:1:window", "C1:1", "C1:2"}
+
+def test_perfect_ranking_scores_one_whatever_the_number_of_relevant_ids():
+    scores = score_ranking([message("C1:1"), message("C1:2"), message("C1:3")], ["C1:1", "C1:2", "C1:3"], (1, 3, 5))
+
+    assert scores["mrr"] == 1.0
+    assert scores["ndcg@1"] == scores["ndcg@3"] == scores["ndcg@5"] == pytest.approx(1.0)
+    assert scores["recall@1"] == pytest.approx(1 / 3)
+    assert scores["recall@3"] == 1.0
+
+def test_window_holding_the_whole_answer():
+    scores = score_ranking([window("C1:1:window", "C1:1", "C1:2"), message("C1:7")], ["C1:1", "C1:2"], (1, 2))
+
+    assert scores["recall@1"] == 1.0
+    assert scores["ndcg@1"] == pytest.approx(1.0)
+    # Gains are binary: the window is one relevant document where the ideal ranking has two
+    assert scores["ndcg@2"] == pytest.approx(1 / (1 + 1 / np.log2(3)))
+
+def test_message_found_twice_counts_once():
+    scores = score_ranking([window("C1:1:window", "C1:1"), message("C1:1")], ["C1:1"], (2,))
+
+    assert scores["ndcg@2"] == pytest.approx(1.0)
+    assert scores["recall@2"] == 1.0
+
+def test_late_hit():
+    scores = score_ranking([message("C1:7"), message("C1:8"), message("C1:1")], ["C1:1"], (1, 3))
+
+    assert scores["mrr"] == pytest.approx(1 / 3)
+    assert scores["ndcg@1"] == 0.0
+    assert scores["recall@1"] == 0.0
+    assert scores["ndcg@3"] == pytest.approx(0.5)
+    assert scores["recall@3"] == 1.0
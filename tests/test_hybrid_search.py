@@ -0,0 +1,35 @@
+from datetime import datetime, timezone
+from langchain_core.documents import Document
+from hybrid_search import build_chroma_filter, reciprocal_rank_fusion, to_epoch
+
+def documents(*ids):
+    return [Document(id=doc_id, page_content=doc_id) for doc_id in ids]
+
+def test_documents_found_by_both_searches_rank_first():
+    fused = reciprocal_rank_fusion([documents("a", "b", "c"), documents("d", "c", "a")])
+
+    assert [doc.id for doc in fused] == ["a", "c", "d", "b"]
+
+def test_fusion_keeps_each_document_once():
+    fused = reciprocal_rank_fusion([documents("a", "b"), documents("b", "a"), documents("b")])
+
+    assert [doc.id for doc in fused] == ["b", "a"]
+
+def test_no_filter_without_restrictions():
+    assert build_chroma_filter() is None
+
+def test_channel_filter_matches_id_or_name():
+    assert build_chroma_filter(channel="#general") == {"$or": [{"channel_id": "general"}, {"channel": "general"}]}
+
+def test_time_range_matches_overlapping_conversations():
+    where = build_chroma_filter(since=100.0, until=200.0)
+
+    assert where == {"$and": [
+        {"$or": [{"end_ts": {"$gte": 100.0}}, {"ts": {"$gte": 100.0}}]},
+        {"ts": {"$lte": 200.0}}
+    ]}
+
+def test_datetimes_are_converted_to_epoch_seconds():
+    assert to_epoch(datetime(2024, 1, 1, tzinfo=timezone.utc)) == 1704067200.0
+    assert to_epoch("12.5") == 12.5
+    assert to_epoch(None) is None
@@ -0,0 +1,61 @@
+import numpy as np
+from near_duplicates import MinHasher, NearDuplicateIndex, band_keys, NUM_BANDS
+
+TEXT = ("To deploy Fineract on Kubernetes, install the helm chart from the fineract repository, "
+        "set the database credentials in values.yaml and run helm install with the tenant settings.")
+NEAR_COPY = TEXT.replace("run helm install", "run  helm  install").upper()
+OTHER = "The mobile wallet build fails on Gradle 8 because the Kotlin plugin version is too old for it."
+
+def similarity(first, second):
+    hasher = MinHasher()
+    return np.mean(hasher.signature(first) == hasher.signature(second))
+
+def test_signatures_estimate_jaccard_similarity():
+    assert similarity(TEXT, TEXT) == 1.0
+    assert similarity(TEXT, TEXT + " Thanks!") > 0.85
+    assert similarity(TEXT, OTHER) < 0.2
+
+def test_signatures_are_stable_across_hashers():
+    assert np.array_equal(MinHasher().signature(TEXT), MinHasher().signature(TEXT))
+    assert len(band_keys(MinHasher().signature(TEXT))) == NUM_BANDS
+
+def test_near_duplicates_are_filtered(tmp_path):
+    index = NearDuplicateIndex(str(tmp_path / "near_duplicates.sqlite3"))
+    documents = [{"id": "a", "content": TEXT}, {"id": "b", "content": NEAR_COPY}, {"id": "c", "content": OTHER}]
+
+    kept = [doc["id"] for doc in index.filter(documents)]
+
+    assert kept == ["a", "c"]
+    assert index.stats == {"documents": 3, "duplicates": 1}
+    assert index.duplicates_of(["a", "c"]) == {"a": ["b"]}
+    index.close()
+
+def test_duplicates_are_found_across_runs(tmp_path):
+    index_file = str(tmp_path / "near_duplicates.sqlite3")
+    index = NearDuplicateIndex(index_file)
+    list(index.filter([{"id": "a", "content": TEXT}]))
+    index.close()
+
+    index = NearDuplicateIndex(index_file)
+    assert index.check({"id": "b", "content": NEAR_COPY}) == "a"
+    index.close()
+
+def test_stored_representative_is_never_demoted(tmp_path):
+    index = NearDuplicateIndex(str(tmp_path / "near_duplicates.sqlite3"))
+    list(index.filter([{"id": "a", "content": TEXT}, {"id": "b", "content": OTHER}]))
+
+    # "b" is already embedded and indexed; its new content matching "a" must not make it a duplicate
+    assert index.check({"id": "b", "content": NEAR_COPY}) is None
+    assert index.duplicates_of(["a"]) == {}
+    assert index.check({"id": "c", "content": NEAR_COPY}) in ("a", "b")
+    index.close()
+
+def test_removed_representative_takes_its_duplicates_along(tmp_path):
+    index = NearDuplicateIndex(str(tmp_path / "near_duplicates.sqlite3"))
+    list(index.filter([{"id": "a", "content": TEXT}, {"id": "b", "content": NEAR_COPY}]))
+
+    index.remove(["a"])
+
+    assert index.duplicates_of(["a"]) == {}
+    assert index.check({"id": "c", "content": TEXT}) is None
+    index.close()
@@ -0,0 +1,71 @@
+import json
+import pytest
+import slack_bolt
+from benchmark import FakeEmbeddings
+
+T0 = 1700000000.0
+
+@pytest.fixture
+def ingestor(tmp_path, monkeypatch):
+    """A realtime ingestor writing to a temporary database, without any Slack connection."""
+    monkeypatch.setenv("SLACK_BOT_TOKEN", "xoxb-test")
+    # Building the Bolt app verifies the token against Slack
+    monkeypatch.setattr(slack_bolt, "App", lambda **kwargs: None)
+    import realtime
+
+    ingestor = realtime.RealtimeIngestor(
+        persist_directory=str(tmp_path / "db"),
+        state_file=str(tmp_path / "realtime_state.json"),
+        embeddings=FakeEmbeddings(),
+        raw_data_file=str(tmp_path / "raw.jsonl")
+    )
+    ingestor.channel_names = {"C1": "general"}
+    yield ingestor
+    ingestor.duplicate_index.close()
+    ingestor.lexical_index.close()
+
+def stored_documents(ingestor):
+    stored = ingestor.vectordb._collection.get(include=["documents"])
+    return dict(zip(stored["ids"], stored["documents"]))
+
+def event(ts, text, user="U1"):
+    return {"ts": f"{ts:.6f}", "text": text, "user": user}
+
+def test_edit_in_the_same_flush_is_chunked_with_the_new_text(ingestor):
+    ingestor.add_message("C1", event(T0, "first"))
+    ingestor.add_message("C1", event(T0 + 10, "old text", "U2"))
+    ingestor.add_edit("C1", event(T0 + 10, "new text", "U2"), event(T0 + 10, "old text", "U2"))
+
+    ingestor.flush()
+
+    assert stored_documents(ingestor) == {f"C1:{T0:.6f}:window": "U1: first\nU2: new text"}
+
+def test_edit_of_a_stored_message_rewrites_its_window(ingestor):
+    ingestor.add_message("C1", event(T0, "first"))
+    ingestor.add_message("C1", event(T0 + 10, "second", "U2"))
+    ingestor.flush()
+
+    ingestor.add_edit("C1", event(T0, "first, edited"), event(T0, "first"))
+    ingestor.flush()
+
+    assert stored_documents(ingestor) == {f"C1:{T0:.6f}:window": "U1: first, edited\nU2: second"}
+
+def test_later_message_extends_the_stored_window(ingestor):
+    ingestor.add_message("C1", event(T0, "first"))
+    ingestor.flush()
+
+    ingestor.add_message("C1", event(T0 + 60, "second", "U2"))
+    ingestor.flush()
+
+    assert stored_documents(ingestor) == {f"C1:{T0:.6f}:window": "U1: first\nU2: second"}
+
+def test_sync_state_is_left_to_the_batch_sync(ingestor, tmp_path):
+    sync_state_file = tmp_path / "db" / "sync_state.json"
+    sync_state_file.write_text(json.dumps({"C1": f"{T0:.6f}"}))
+
+    ingestor.add_message("C1", event(T0 + 90000, "posted after a gap"))
+    ingestor.flush()
+
+    # The messages between the sync mark and this event are still fetched by the next --sync
+    assert json.loads(sync_state_file.read_text()) == {"C1": f"{T0:.6f}"}
+    assert json.loads((tmp_path / "realtime_state.json").read_text()) == {"C1": f"{T0 + 90000:.6f}"}
@@ -0,0 +1,38 @@
+import time
+from index_versions import last_activity, retained_records, retention_cutoff
+
+DAY = 24 * 60 * 60
+
+def thread(started, last_reply):
+    return {
+        "type": "thread", "channel_id": "C1", "thread_ts": f"{started:.6f}", "latest_reply": f"{last_reply:.6f}",
+        "parent": {"ts": f"{started:.6f}", "text": "question"},
+        "replies": [{"ts": f"{last_reply:.6f}", "text": "answer"}]
+    }
+
+def test_last_activity_of_windows_and_messages():
+    assert last_activity({"ts": 100.0, "end_timestamp": "250.000000"}) == 250.0
+    assert last_activity({"ts": 100.0}) == 100.0
+    assert last_activity({"timestamp": "unknown"}) is None
+
+def test_last_activity_of_threads():
+    assert last_activity({"type": "thread", "ts": 100.0, "end_timestamp": "900.000000"}) == 900.0
+    # Written before threads recorded their latest reply: never pruned
+    assert last_activity({"type": "thread", "ts": 100.0}) is None
+
+def test_no_retention_keeps_everything():
+    assert retention_cutoff(None) is None
+    records = [{"ts": "1.000000"}, thread(1, 2)]
+
+    assert list(retained_records(records)) == records
+
+def test_old_thread_with_a_recent_reply_is_retained():
+    now = time.time()
+    old_message = {"ts": f"{now - 40 * DAY:.6f}"}
+    recent_message = {"ts": f"{now - DAY:.6f}"}
+    active_thread = thread(now - 40 * DAY, now - DAY)
+    stale_thread = thread(now - 40 * DAY, now - 35 * DAY)
+
+    kept = list(retained_records([old_message, recent_message, active_thread, stale_thread], retention_days=30))
+
+    assert kept == [recent_message, active_thread]
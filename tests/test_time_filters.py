@@ -0,0 +1,97 @@
+import sqlite3
+from langchain_chroma import Chroma
+from benchmark import FakeEmbeddings
+from ingest import prepare_batch
+from lexical_index import LexicalIndex
+from hybrid_search import build_chroma_filter
+
+DAY = 24 * 60 * 60
+T0 = 1700000000.0
+
+def thread_document():
+    """A thread started at T0 whose last reply came a week later."""
+    return {
+        "id": f"C1:{T0:.6f}:thread",
+        "content": "how do I deploy fineract\nU2: use the helm chart",
+        "metadata": {
+            "channel": "general",
+            "channel_id": "C1",
+            "user": "U1",
+            "timestamp": f"{T0:.6f}",
+            "thread_ts": f"{T0:.6f}",
+            "end_timestamp": f"{T0 + 7 * DAY:.6f}",
+            "type": "thread"
+        }
+    }
+
+def message_document(ts):
+    return {
+        "id": f"C1:{ts:.6f}",
+        "content": "deploy fineract on kubernetes",
+        "metadata": {"channel": "general", "channel_id": "C1", "user": "U1", "timestamp": f"{ts:.6f}"}
+    }
+
+def test_prepare_batch_adds_numeric_start_and_end():
+    thread, message = prepare_batch([thread_document(), message_document(T0 + DAY)])
+
+    assert (thread["metadata"]["ts"], thread["metadata"]["end_ts"]) == (T0, T0 + 7 * DAY)
+    assert message["metadata"]["ts"] == message["metadata"]["end_ts"] == T0 + DAY
+
+def test_prepare_batch_moves_the_end_of_a_grown_window():
+    window = thread_document()
+    prepare_batch([window])
+    window["metadata"]["end_timestamp"] = f"{T0 + 9 * DAY:.6f}"
+
+    prepare_batch([window])
+
+    assert window["metadata"]["end_ts"] == T0 + 9 * DAY
+
+def search_ids(index, since=None, until=None):
+    return sorted(doc.id for doc in index.search("deploy", k=10, since=since, until=until))
+
+def test_keyword_search_matches_threads_with_replies_in_range(tmp_path):
+    index = LexicalIndex(str(tmp_path / "lexical.sqlite3"))
+    index.upsert(prepare_batch([thread_document(), message_document(T0 + DAY)]))
+
+    assert search_ids(index, since=T0 + 6 * DAY) == [f"C1:{T0:.6f}:thread"]
+    assert search_ids(index, since=T0 + 6 * DAY, until=T0 + 8 * DAY) == [f"C1:{T0:.6f}:thread"]
+    assert search_ids(index, until=T0 - 1) == []
+    assert search_ids(index, since=T0 + 8 * DAY) == []
+    assert len(search_ids(index, since=T0 + DAY / 2, until=T0 + 2 * DAY)) == 2
+    index.close()
+
+def test_keyword_index_without_end_times_is_migrated(tmp_path):
+    index_file = str(tmp_path / "lexical.sqlite3")
+    index = LexicalIndex(index_file)
+    index.upsert(prepare_batch([thread_document()]))
+    index.close()
+    db = sqlite3.connect(index_file)
+    db.execute("ALTER TABLE documents DROP COLUMN end_ts")
+    db.commit()
+    db.close()
+
+    index = LexicalIndex(index_file)
+
+    assert search_ids(index, since=T0 + 6 * DAY) == [f"C1:{T0:.6f}:thread"]
+    index.close()
+
+def test_chroma_filter_matches_threads_with_replies_in_range(tmp_path):
+    vectordb = Chroma(collection_name="time_filters", embedding_function=FakeEmbeddings(),
+                      persist_directory=str(tmp_path / "chroma"))
+    documents = prepare_batch([thread_document(), message_document(T0 + DAY)])
+    vectordb._collection.add(
+        ids=[doc["id"] for doc in documents],
+        documents=[doc["content"] for doc in documents],
+        metadatas=[doc["metadata"] for doc in documents],
+        embeddings=FakeEmbeddings().embed_documents([doc["content"] for doc in documents])
+    )
+    # Stored before end_ts existed: matched on its start time
+    vectordb._collection.add(ids=["C1:legacy"], documents=["legacy"], metadatas=[{"ts": T0 + 6.5 * DAY}],
+                             embeddings=FakeEmbeddings().embed_documents(["legacy"]))
+
+    def matching(since=None, until=None):
+        return sorted(vectordb._collection.get(where=build_chroma_filter(since=since, until=until))["ids"])
+
+    assert matching(since=T0 + 6 * DAY) == [f"C1:{T0:.6f}:thread", "C1:legacy"]
+    assert matching(since=T0 + 8 * DAY) == []
+    assert matching(since=T0 + DAY / 2, until=T0 + 2 * DAY) == [f"C1:{T0:.6f}:thread", f"C1:{T0 + DAY:.6f}"]
@@ -0,0 +1,38 @@
+from transform import apply_edits, record_to_document
+
+def test_edit_of_a_buffered_message_is_folded_into_it():
+    messages = [
+        {"channel_id": "C1", "ts": "1.000100", "text": "old text", "user": "U1"},
+        {"channel_id": "C1", "ts": "2.000100", "text": "other", "user": "U2"}
+    ]
+    edit = ({"channel_id": "C1", "ts": "1.000100", "text": "new text", "user": "U1"}, {"text": "old text"})
+
+    edited, remaining = apply_edits(messages, [edit])
+
+    assert [message["text"] for message in edited] == ["new text", "other"]
+    assert remaining == []
+    # The buffered records stay as they were, so a failed flush can requeue them
+    assert messages[0]["text"] == "old text"
+
+def test_later_edit_of_the_same_message_wins():
+    messages = [{"channel_id": "C1", "ts": "1.000100", "text": "v1"}]
+    edits = [
+        ({"channel_id": "C1", "ts": "1.000100", "text": "v2"}, {"text": "v1"}),
+        ({"channel_id": "C1", "ts": "1.000100", "text": "v3"}, {"text": "v2"})
+    ]
+
+    edited, remaining = apply_edits(messages, edits)
+
+    assert edited[0]["text"] == "v3"
+    assert remaining == []
+
+def test_edit_of_a_stored_message_is_kept():
+    edit = ({"channel_id": "C1", "ts": "1.000100", "text": "new"}, {"text": "old"})
+
+    edited, remaining = apply_edits([{"channel_id": "C2", "ts": "1.000100", "text": "same ts"}], [edit])
+
+    assert edited[0]["text"] == "same ts"
+    assert remaining == [edit]
+
+def test_empty_message_has_no_document():
+    assert record_to_document({"channel_id": "C1", "ts": "1.000100", "text": ""}) is None